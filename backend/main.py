@@ -1,18 +1,36 @@
 import os
-import json
 import time
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, HTMLResponse
+import asyncio
+import queue
+import uuid
+import threading
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from src.scanner.scanner import VulnerabilityScanner
-from src.reporting.report_generator import generate_report
-from src.reporting.logger import Logger  # Assume logging integrated in scan
-from src.scanner.attacks.sniff import sniff_can_packets
-from src.scanner.attacks.inject import inject_can_packet
+from src.reporting.report_generator import generate_report, iter_report, REPORT_FORMATS
+from src.reporting.logger import Logger, live_loggers, set_serializer, set_write_observer  # Assume logging integrated in scan
+from src.reporting.query import query_results, query_traffic, clear_results as clear_stored_results, MAX_LIMIT
+from src.reporting.partitions import (
+    Maintainer, compact_after_hours, list_partitions, partition_mode, retention_days,
+)
 from src.scanner.detection.engine import DetectionEngine
+from src.scanner.detection.policy import PolicyHolder
+from src.scanner.detection.registry import registered_rules, reset_rule_stats, rule_stats
+from src.scanner.capture import Capture
+from src.scanner.attacks.socketcan import compile_filters
+from src.scanner.replay import REPLAY_FORMATS, analyze_capture
+from src.scanner.orchestrator import ScanOrchestrator, merge_findings
+from src.scanner.broadcast import OVERFLOW_POLICIES, BroadcastHub
+from src.scanner.traffic import TrafficProfile, paced
+from src.scanner.wire import WIRE_FORMATS, WireEvent, dumps, encode_batch
+from src.scanner.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, Sample, counter, exposition, histogram, register_collector,
+)
+from src.scanner.frame import CanFrame, event_to_dict
 import json as _json
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 app = FastAPI()
 
@@ -46,46 +64,403 @@ def save_settings(cfg: Dict[str, Any]):
         _json.dump(cfg, f)
 
 SETTINGS = load_settings()
+# Compiled once; engines share it so settings updates reach running streams
+POLICY = PolicyHolder(SETTINGS)
+
+
+# SQLite write latency and backlog (reporting reports writes through an observer)
+RESULTS_WRITE_SECONDS = histogram("results_write_seconds", "SQLite executemany+commit time per batch")
+RESULTS_ROWS = counter("results_rows_written_total", "Result rows committed to SQLite")
+
+
+def _observe_write(rows: int, seconds: float, queued: int):
+    RESULTS_WRITE_SECONDS.observe(seconds)
+    RESULTS_ROWS.inc(rows)
+
+
+set_write_observer(_observe_write)
+# Stored details use the same encoder as the live streams
+set_serializer(dumps)
+
+
+@register_collector
+def _logger_samples():
+    queued = sum(logger.queued for logger in live_loggers())
+    # Measured on the maintenance thread, never on the event loop
+    usage = STORAGE.usage
+    return [
+        Sample("results_write_queue_depth", "gauge", "Rows waiting for the SQLite writer", values={(): queued}),
+        Sample("results_partitions", "gauge", "Result database files (time partitions)",
+               values={(): usage["partitions"]}),
+        Sample("results_storage_bytes", "gauge", "Size of the result database files", values={(): usage["bytes"]}),
+    ]
+
+
+# Time-partitioned storage (RESULTS_PARTITION=day|hour): retention and
+# compaction run in the background every RESULTS_MAINTENANCE_INTERVAL seconds.
+# The same thread measures the storage for /metrics, partitioned or not.
+STORAGE = Maintainer(interval=float(os.getenv("RESULTS_MAINTENANCE_INTERVAL", "300"))).start()
+
+
+# One background writer shared by all orchestrated scans
+_job_logger: Optional[Logger] = None
+_job_logger_lock = threading.Lock()
+
+
+def _log_job_event(job, event, findings):
+    # Runs on the scan's worker thread (ScanOrchestrator on_event)
+    global _job_logger
+    if _job_logger is None:
+        with _job_logger_lock:
+            if _job_logger is None:
+                _job_logger = Logger()
+    if event is not None:
+        payload = {**event_to_dict(event), "interface": job.interface}
+        _job_logger.log_event(event, scan_id=job.scan_id, details=payload)
+    for f in findings:
+        _job_logger.log_finding(f, scan_id=job.scan_id)
+
+
+# Worker pool for background and multi-interface scans (one capture thread per running scan);
+# each job keeps its last SCAN_LOG_SIZE messages for clients resuming a stream
+ORCHESTRATOR = ScanOrchestrator(
+    max_workers=int(os.getenv("SCAN_WORKERS", "8")),
+    max_queue=int(os.getenv("SCAN_QUEUE", "64")),
+    policy=POLICY,
+    on_event=_log_job_event,
+    log_size=int(os.getenv("SCAN_LOG_SIZE", "4096")),
+)
+
+
+# Live SSE/WS viewers share captures; each gets a STREAM_QUEUE-bounded queue
+HUB = BroadcastHub(maxsize=int(os.getenv("STREAM_QUEUE", "1024")))
+
+
+def _simulated_events():
+    # Deterministic synthetic events for demos/CI
+    now = float(int(time.time()))
+    return [
+        {"type": "sniff", "status": "detected", "frame": CanFrame(0x123, bytes.fromhex("01020304"), timestamp=now)},
+        {"type": "sniff", "status": "detected", "frame": CanFrame(0x456, bytes.fromhex("11223344"), timestamp=now)},
+        {"type": "inject", "status": "success", "details": "Injected test frame on vcan0"},
+    ]
+
+
+def _capture_filters(entries=None):
+    # Per-scan entries win over the `capture_filter` setting; none means no filtering
+    if entries is None:
+        entries = SETTINGS.get("capture_filter")
+    if isinstance(entries, str):
+        entries = [e for e in entries.split(",") if e.strip()]
+    return compile_filters(entries) if entries else None
+
+
+# Synthetic bus for simulated scans with a duration (src/scanner/traffic.py)
+SIMULATE_IDS = int(os.getenv("SIMULATE_IDS", "50"))
+
+
+def _simulated_source(duration: Optional[float] = None):
+    # Without a duration: the three demo events. With one: synthetic traffic
+    # from SIMULATE_IDS periodic IDs in real time (duration=0 runs until stopped)
+    if duration is None:
+        for i, item in enumerate(_simulated_events()):
+            if i:
+                time.sleep(0.3)  # demo pacing
+            yield item
+        return
+    profile = TrafficProfile.default(n_ids=SIMULATE_IDS, seed=int(time.time()))
+    for frame in paced(profile.iter_frames(duration=duration or None, start=time.time())):
+        yield {"type": "sniff", "status": "detected", "frame": frame}
+
+
+def _scan_capture(interface: str, simulate: bool, duration: Optional[float], scan_id: str, id_filter=None):
+    # duration: None keeps the short default capture (10 frames / 3 s),
+    # 0 captures until the client goes away, > 0 captures for that many seconds.
+    # Returns the capture and its scanner (whose `injected` record feeds detection)
+    scanner = VulnerabilityScanner(interface, filters=_capture_filters(id_filter))
+
+    # Runs on the capture's reader thread, never on the event loop
+    def source():
+        if simulate:
+            yield from _simulated_source(duration)
+        elif duration is None:
+            yield from scanner.iter_scan()
+        else:
+            yield from scanner.iter_scan(count=None, timeout=duration or None)
+
+    return Capture(source, name=f"capture-{scan_id[:8]}", on_stop=scanner.stop), scanner
+
 
 class ScanRequest(BaseModel):
     interface: str = "vcan0"
     simulate: bool = False
+    # Capture only these IDs (kernel CAN_RAW_FILTER); defaults to settings.capture_filter
+    filter: list[str | int] | None = None
+    # Scan several buses at once; results and findings are tagged with the interface
+    interfaces: list[str] | None = None
+    # Background scans (/api/scans): capture seconds, as for the live streams
+    duration: float | None = None
+    # Background scans: sample the scan's stack (true, or the interval in seconds)
+    profile: bool | float | None = None
+
+
+async def _run_multi_scan(request: ScanRequest):
+    try:
+        jobs = ORCHESTRATOR.submit_many(request.interfaces, keep_events=True, filters=_capture_filters(request.filter))
+    except queue.Full:
+        return Response(content=dumps({"error": "Too many scans queued; retry later"}), status_code=503,
+                        media_type="application/json")
+    # Events and findings are logged by _log_job_event as the jobs run
+    await asyncio.to_thread(ORCHESTRATOR.wait, jobs)
+    results = []
+    for job in jobs:
+        for event in job.events:
+            results.append({**event_to_dict(event), "interface": job.interface})
+    body = {
+        "results": results,
+        "findings": merge_findings(jobs),
+        "scans": [{**job.to_dict(), "findings": job.findings} for job in jobs],
+    }
+    return Response(content=dumps(body), media_type="application/json")
+
 
 # On-demand scan (REST)
 @app.post("/api/scan")
 async def run_scan(request: ScanRequest):
+    if request.interfaces and not request.simulate:
+        return await _run_multi_scan(request)
     try:
         if request.simulate:
             # Produce deterministic synthetic results for demos/CI
-            now = int(time.time())
-            results = [
-                {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x123, data=01020304, t={now})"},
-                {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x456, data=11223344, t={now})"},
-                {"type": "inject", "status": "success", "details": "Injected test frame on vcan0"},
-            ]
+            results = _simulated_events()
         else:
-            scanner = VulnerabilityScanner(request.interface)
-            results = scanner.run_scan()
+            # Blocking capture runs in the threadpool so the loop keeps serving
+            scanner = VulnerabilityScanner(request.interface, filters=_capture_filters(request.filter))
+            results = await asyncio.to_thread(scanner.run_scan)
 
         # Run detection
-        engine = DetectionEngine(SETTINGS)
+        engine = DetectionEngine(policy=POLICY, injected=None if request.simulate else scanner.injected)
         findings = engine.analyze(results)
 
+        scan_id = uuid.uuid4().hex
         logger = Logger()
-        for result in results:
-            logger.log_result(result["type"], result.get("status", "detected"), str(result))
+        payloads = [event_to_dict(r) for r in results]
+        for result, payload in zip(results, payloads):
+            logger.log_event(result, scan_id=scan_id, details=payload)
         for f in findings:
-            logger.log_result("finding", f.get("severity", "alert"), str(f))
-        logger.close()
-        return {"results": results, "findings": findings}
+            logger.log_finding(f, scan_id=scan_id)
+        # close() waits for the writer thread to commit
+        await asyncio.to_thread(logger.close)
+        body = {"scan_id": scan_id, "results": payloads, "findings": findings}
+        return Response(content=dumps(body), media_type="application/json")
     except Exception as e:
         err = {"type": "scan", "status": "failed", "error": str(e)}
         return {"results": [err], "findings": []}
 
+def _json_error(message: str, status_code: int) -> Response:
+    return Response(content=dumps({"error": message}), status_code=status_code, media_type="application/json")
+
+
+def _job_options(request: ScanRequest) -> Dict[str, Any]:
+    opts: Dict[str, Any] = {"filters": _capture_filters(request.filter)}
+    if request.simulate:
+        # The orchestrator hands sources the job's scanner; simulations need none
+        duration = request.duration
+        opts["source"] = lambda scanner: _simulated_source(duration)
+    elif request.duration is not None:
+        opts.update(count=None, timeout=request.duration or None)
+    if request.profile:
+        opts["profile"] = request.profile
+    return opts
+
+
+# Background scans: submit, then poll or stream (resumable) by scan id
+@app.post("/api/scans", status_code=202)
+async def submit_scans(request: ScanRequest):
+    try:
+        jobs = ORCHESTRATOR.submit_many(request.interfaces or [request.interface], **_job_options(request))
+    except queue.Full:
+        return _json_error("Too many scans queued; retry later", 503)
+    return {"scans": [job.to_dict() for job in jobs]}
+
+
+@app.get("/api/scans")
+async def list_scans():
+    return {"scans": [job.to_dict() for job in ORCHESTRATOR.jobs()]}
+
+
+@app.get("/api/scans/{scan_id}")
+async def get_scan(scan_id: str):
+    job = ORCHESTRATOR.get(scan_id)
+    if job is None:
+        return _json_error(f"Unknown scan {scan_id!r}", 404)
+    return Response(content=dumps({**job.to_dict(), "findings": job.findings}), media_type="application/json")
+
+
+@app.delete("/api/scans/{scan_id}")
+async def cancel_scan(scan_id: str):
+    job = ORCHESTRATOR.get(scan_id)
+    if job is None:
+        return _json_error(f"Unknown scan {scan_id!r}", 404)
+    return {"cancelled": ORCHESTRATOR.cancel(scan_id), **job.to_dict()}
+
+
+@app.get("/api/scans/{scan_id}/profile")
+async def scan_profile(scan_id: str, format: str = "json", limit: int = 20):
+    # Sampled stacks of a scan submitted with "profile": top functions, or folded stacks for flamegraphs
+    job = ORCHESTRATOR.get(scan_id)
+    if job is None:
+        return _json_error(f"Unknown scan {scan_id!r}", 404)
+    if job.profile is None:
+        return _json_error(f"Scan {scan_id!r} was not profiled", 404)
+    if format == "folded":
+        return Response(content=job.profile.folded(), media_type="text/plain")
+    return {"scan_id": scan_id, "status": job.status, **job.profile.to_dict(limit)}
+
+
+def _job_message(seq: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    payload = item.get("payload")
+    if item["event"] == "result":
+        payload = event_to_dict(payload)
+    return {"event": item["event"], "payload": payload, "seq": seq}
+
+
+async def _follow_job(job, offset: int, keepalive: float = 15.0):
+    # Yields (seq, message) from `offset`; None on idle keepalive; ends after "done"
+    log = job.log
+    while True:
+        entries, missed = log.read(offset, limit=512)
+        if missed:
+            yield offset + missed - 1, {"event": "gap", "payload": {"missed": missed, "offset": offset}}
+            offset += missed
+        for seq, item in entries:
+            yield seq, _job_message(seq, item)
+            offset = seq + 1
+        if entries:
+            continue
+        if log.closed:
+            return
+        if not await log.wait_async(offset, keepalive):
+            yield None
+
+
+def _resume_offset(value: Optional[str], default: int = 0) -> int:
+    try:
+        return max(0, int(value)) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+
+@app.get("/api/scans/{scan_id}/stream")
+def stream_job(scan_id: str, request: Request, offset: Optional[int] = None):
+    job = ORCHESTRATOR.get(scan_id)
+    if job is None:
+        return _json_error(f"Unknown scan {scan_id!r}", 404)
+    # EventSource reconnects send the last seen id; resume just after it
+    last_id = request.headers.get("last-event-id")
+    start = offset if offset is not None else _resume_offset(last_id, -1) + 1
+
+    async def event_gen():
+        async for item in _follow_job(job, start):
+            if item is None:
+                yield ": keepalive\n\n"
+            else:
+                seq, message = item
+                yield f"id: {seq}\n{_sse_event(message)}"
+
+    origin = allowed_origins[0] if allowed_origins else "*"
+    headers = {"Cache-Control": "no-cache", "Connection": "keep-alive", "Access-Control-Allow-Origin": origin}
+    return StreamingResponse(event_gen(), media_type="text/event-stream", headers=headers)
+
+
+@app.websocket("/api/scans/{scan_id}/ws")
+async def ws_job(websocket: WebSocket, scan_id: str):
+    await websocket.accept()
+    job = ORCHESTRATOR.get(scan_id)
+    try:
+        if job is None:
+            await websocket.send_json({"event": "error", "payload": {"error": f"Unknown scan {scan_id!r}"}})
+            return
+        async for item in _follow_job(job, _resume_offset(websocket.query_params.get("offset"))):
+            if item is not None:
+                await websocket.send_text(dumps(item[1]))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+
+# Recorded logs that /api/replay may read; paths are resolved inside this directory
+REPLAY_DIR = os.getenv("REPLAY_DIR", os.path.join("data", "captures"))
+
+
+class ReplayRequest(BaseModel):
+    path: str
+    format: str | None = None
+    realtime: bool = False
+    speed: float = 1.0
+    batch: bool = False
+
+
+def _replay_path(path: str) -> Optional[str]:
+    root = os.path.realpath(REPLAY_DIR)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root or not os.path.isfile(full):
+        return None
+    return full
+
+
+# Offline analysis of a recorded log (candump / ASC / PCAP(NG) / BLF)
+@app.post("/api/replay")
+async def replay_capture(request: ReplayRequest):
+    full = _replay_path(request.path)
+    if full is None:
+        return Response(content=dumps({"error": f"No capture {request.path!r} in {REPLAY_DIR}"}),
+                        status_code=404, media_type="application/json")
+    if request.format is not None and request.format not in REPLAY_FORMATS:
+        return Response(content=dumps({"error": f"Unsupported format {request.format!r}", "formats": list(REPLAY_FORMATS)}),
+                        status_code=400, media_type="application/json")
+    scan_id = uuid.uuid4().hex
+    logger = Logger()
+    try:
+        summary = await asyncio.to_thread(
+            analyze_capture, full, fmt=request.format, engine=DetectionEngine(policy=POLICY),
+            realtime=request.realtime, speed=request.speed or 1.0, batch=request.batch,
+        )
+        # Frames are not stored row by row; the findings and a summary row are
+        for f in summary["findings"]:
+            logger.log_finding(f, scan_id=scan_id)
+        logger.log_result("replay", "completed", {"path": request.path, "frames": summary["frames"],
+                                                  "elapsed": summary["elapsed"]}, scan_id=scan_id)
+        body = {"scan_id": scan_id, **summary}
+    except Exception as e:
+        err = {"type": "replay", "status": "failed", "error": str(e)}
+        logger.log_result("replay", "failed", err, scan_id=scan_id)
+        body = {"scan_id": scan_id, "frames": 0, "findings": [], "error": str(e)}
+    finally:
+        await asyncio.to_thread(logger.close)
+    return Response(content=dumps(body), media_type="application/json")
+
+
+_REPORT_MEDIA_TYPES = {"markdown": "text/markdown", "jsonl": "application/x-ndjson", "html": "text/html"}
+
+
 @app.get("/api/report")
-async def get_report():
-    report = generate_report()
-    return {"report": report}
+def get_report(format: Optional[str] = None, scan_id: Optional[str] = None):
+    # Without `format` keep the JSON-wrapped Markdown the dashboard expects;
+    # with it, stream the report in chunks straight from the DB cursor
+    if format is None:
+        return {"report": generate_report(scan_id=scan_id)}
+    if format not in REPORT_FORMATS:
+        return Response(
+            content=dumps({"error": f"Unsupported format {format!r}", "formats": list(REPORT_FORMATS)}),
+            status_code=400,
+            media_type="application/json",
+        )
+    return StreamingResponse(iter_report(fmt=format, scan_id=scan_id), media_type=_REPORT_MEDIA_TYPES[format])
 
 
 @app.get("/health")
@@ -93,103 +468,182 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: capture, detection, rules, storage, streaming and scan jobs
+    return Response(content=exposition(), media_type=METRICS_CONTENT_TYPE)
+
+
+def _parse_can_id(value: Optional[str]) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(value, 16) if value.lower().startswith("0x") else int(value)
+
+
+# The results and storage handlers are plain functions: FastAPI runs them in
+# its threadpool, so their SQLite and file work never blocks the event loop
 @app.get("/api/results")
-async def get_results():
-    # Convenience endpoint to return raw rows for UI use
-    import sqlite3
-    db_path = os.getenv("RESULTS_DB", "data/results.db")
-    if not os.path.exists(db_path):
-        return {"results": []}
-    conn = sqlite3.connect(db_path)
+def get_results(
+    scan_id: Optional[str] = None,
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    can_id: Optional[str] = None,
+    rule_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[int] = None,
+    limit: int = 200,
+):
+    # Keyset-paginated rows for UI use; pass next_cursor back as `cursor`
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, timestamp, test_type, status, details FROM results ORDER BY id DESC")
-        rows = cur.fetchall()
-        return {
-            "results": [
-                {
-                    "id": r[0],
-                    "timestamp": r[1],
-                    "type": r[2],
-                    "status": r[3],
-                    "details": r[4],
-                }
-                for r in rows
-            ]
-        }
-    finally:
-        conn.close()
+        cid = _parse_can_id(can_id)
+    except ValueError:
+        return {"results": [], "next_cursor": None, "error": f"Invalid can_id {can_id!r}"}
+    rows, next_cursor = query_results(
+        scan_id=scan_id,
+        test_type=type,
+        severity=severity,
+        can_id=cid,
+        rule_id=rule_id,
+        since=since,
+        until=until,
+        before_id=cursor,
+        limit=min(limit, MAX_LIMIT),
+    )
+    return {"results": rows, "next_cursor": next_cursor}
+
+
+@app.get("/api/results/traffic")
+def get_traffic(
+    scan_id: Optional[str] = None,
+    can_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 200,
+):
+    # Frames per minute and CAN ID, from raw frames or compacted aggregates
+    try:
+        cid = _parse_can_id(can_id)
+    except ValueError:
+        return {"traffic": [], "error": f"Invalid can_id {can_id!r}"}
+    rows = query_traffic(scan_id=scan_id, can_id=cid, since=since, until=until, limit=min(limit, MAX_LIMIT))
+    return {"traffic": rows}
 
 
 @app.delete("/api/results")
-async def clear_results():
-    import sqlite3
-    db_path = os.getenv("RESULTS_DB", "data/results.db")
-    if not os.path.exists(db_path):
-        return {"cleared": 0}
-    conn = sqlite3.connect(db_path)
+def clear_results(scan_id: Optional[str] = None):
+    return {"cleared": clear_stored_results(scan_id=scan_id)}
+
+
+@app.get("/api/storage")
+def storage():
+    # Partitions with size and compaction state, plus the retention settings
+    return {
+        "partition": partition_mode(),
+        "retention_days": retention_days(),
+        "compact_after_hours": compact_after_hours(),
+        "partitions": [part.to_dict() for part in list_partitions()],
+        "last_maintenance": STORAGE.last,
+    }
+
+
+@app.post("/api/storage/maintain")
+async def maintain_storage():
+    # Apply retention and compaction now instead of waiting for the next run
+    if not STORAGE.enabled:
+        return Response(
+            content=dumps({"error": "Result partitioning is off; set RESULTS_PARTITION=day or hour"}),
+            status_code=409, media_type="application/json",
+        )
+    return await asyncio.to_thread(STORAGE.run_once)
+
+
+def _sse_event(data: dict) -> str:
+    return f"data: {dumps(data)}\n\n"
+
+
+async def _live_feed(interface: str, simulate: bool, duration: Optional[float], id_filter):
+    # One capture + detection run shared by every viewer of the same live scan.
+    # Messages are WireEvents, encoded at most once per wire format for all
+    # subscribers. Findings carry their finding_id as coalesce key (later
+    # rollups supersede earlier ones).
+    logger = Logger()
+    scan_id = uuid.uuid4().hex
+    yield None, WireEvent("start", {"interface": interface, "simulate": simulate, "scan_id": scan_id})
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM results")
-        conn.commit()
-        return {"cleared": cur.rowcount}
+        capture, scanner = _scan_capture(interface, simulate, duration, scan_id, id_filter)
+        # Streaming detection: findings are emitted as soon as a rule fires
+        engine = DetectionEngine(policy=POLICY, injected=scanner.injected)
+        # Capture runs on a reader thread; this coroutine only awaits its queue
+        async with capture:
+            async for item in capture:
+                logger.log_event(item, scan_id=scan_id, details=event_to_dict(item))
+                yield None, WireEvent("result", item)
+                for f in engine.feed(item):
+                    logger.log_finding(f, scan_id=scan_id)
+                    yield f.get("finding_id"), WireEvent("finding", f)
+        # Final state of finding groups updated since their last emit
+        for f in engine.flush():
+            logger.log_finding(f, scan_id=scan_id)
+            yield f.get("finding_id"), WireEvent("finding", f)
+    except Exception as e:
+        err = {"type": "scan", "status": "failed", "error": str(e)}
+        logger.log_result("scan", "failed", err, scan_id=scan_id)
+        yield None, WireEvent("error", err)
     finally:
-        conn.close()
+        await asyncio.to_thread(logger.close)
+    yield None, WireEvent("done")
 
 
-def _sse_event(data: dict) -> str:
-    return f"data: {json.dumps(data)}\n\n"
+def _live_subscribe(interface: str, simulate: bool, duration: Optional[float], id_filter,
+                    overflow: Optional[str] = None):
+    # Viewers asking for the same interface and parameters share one capture
+    if overflow not in OVERFLOW_POLICIES:
+        overflow = None
+    key = (interface, simulate, duration, id_filter)
+    return HUB.subscribe(key, lambda: _live_feed(interface, simulate, duration, id_filter), overflow=overflow)
+
+
+# Most frames per compact/binary batch message
+_MAX_BATCH = 4096
+
+
+async def _wire_messages(sub, fmt: str, batch_ms: float):
+    # json: one message per event. compact/binary: wait batch_ms after the
+    # first pending event, then send everything queued meanwhile with runs of
+    # frames packed into single batch messages.
+    interval = max(0.0, batch_ms) / 1000.0
+    async for ev in sub:
+        events = [ev]
+        if fmt != "json":
+            if interval and ev.frame is not None:
+                await asyncio.sleep(interval)
+            events.extend(sub.drain(_MAX_BATCH))
+        for message in encode_batch(events, fmt):
+            yield message
+
+
+def _wire_format(value: Optional[str]) -> str:
+    return value if value in WIRE_FORMATS else "json"
 
 
 # Live scan (SSE)
 @app.get("/api/scan/stream")
-def stream_scan(interface: str = "vcan0", simulate: bool = False):
-    logger = Logger()
-
-    def event_gen():
-        # Start event
-        yield _sse_event({"event": "start", "payload": {"interface": interface, "simulate": simulate}})
-        collected = []
+def stream_scan(interface: str = "vcan0", simulate: bool = False, duration: Optional[float] = None,
+                filter: Optional[str] = None, overflow: Optional[str] = None, format: Optional[str] = None,
+                batch_ms: float = 50.0):
+    # SSE is text-only: binary falls back to compact
+    fmt = _wire_format(format)
+    if fmt == "binary":
+        fmt = "compact"
+
+    async def event_gen():
+        sub = _live_subscribe(interface, simulate, duration, filter, overflow)
         try:
-            if simulate:
-                now = int(time.time())
-                simulated = [
-                    {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x123, data=01020304, t={now})"},
-                    {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x456, data=11223344, t={now})"},
-                    {"type": "inject", "status": "success", "details": "Injected test frame on vcan0"},
-                ]
-                for item in simulated:
-                    logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                    collected.append(item)
-                    yield _sse_event({"event": "result", "payload": item})
-                    time.sleep(0.3)
-            else:
-                # Real scan: stream sniff results first, then inject
-                sniff_results = sniff_can_packets(interface)
-                for item in sniff_results:
-                    logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                    collected.append(item)
-                    yield _sse_event({"event": "result", "payload": item})
-                    time.sleep(0.05)
-                inject_results = inject_can_packet(interface)
-                for item in inject_results:
-                    logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                    collected.append(item)
-                    yield _sse_event({"event": "result", "payload": item})
-                    time.sleep(0.05)
-            # Run detection at the end and stream findings
-            engine = DetectionEngine(SETTINGS)
-            findings = engine.analyze(collected)
-            for f in findings:
-                logger.log_result("finding", f.get("severity", "alert"), str(f))
-                yield _sse_event({"event": "finding", "payload": f})
-        except Exception as e:
-            err = {"type": "scan", "status": "failed", "error": str(e)}
-            logger.log_result("scan", "failed", str(err))
-            yield _sse_event({"event": "error", "payload": err})
+            async for text in _wire_messages(sub, fmt, batch_ms):
+                yield f"data: {text}\n\n"
         finally:
-            logger.close()
-            yield _sse_event({"event": "done"})
+            HUB.unsubscribe(sub)
 
     origin = allowed_origins[0] if allowed_origins else "*"
     headers = {"Cache-Control": "no-cache", "Connection": "keep-alive", "Access-Control-Allow-Origin": origin}
@@ -203,74 +657,50 @@ async def ws_scan(websocket: WebSocket):
     params = websocket.query_params
     interface = params.get("interface", "vcan0")
     simulate = params.get("simulate", "0") in ("1", "true", "True")
+    try:
+        duration = float(params["duration"]) if params.get("duration") else None
+    except ValueError:
+        duration = None
+    try:
+        batch_ms = float(params.get("batch_ms", 50.0))
+    except ValueError:
+        batch_ms = 50.0
 
-    logger = Logger()
+    sub = _live_subscribe(interface, simulate, duration, params.get("filter"), params.get("overflow"))
     try:
-        await websocket.send_json({"event": "start", "payload": {"interface": interface, "simulate": simulate}})
-        collected = []
-        if simulate:
-            now = int(time.time())
-            simulated = [
-                {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x123, data=01020304, t={now})"},
-                {"type": "sniff", "status": "detected", "packet": f"CAN(id=0x456, data=11223344, t={now})"},
-                {"type": "inject", "status": "success", "details": "Injected test frame on vcan0"},
-            ]
-            for item in simulated:
-                logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                collected.append(item)
-                await websocket.send_json({"event": "result", "payload": item})
-                await asyncio_sleep(0.3)
-        else:
-            # Send sniff results
-            sniff_results = sniff_can_packets(interface)
-            for item in sniff_results:
-                logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                collected.append(item)
-                await websocket.send_json({"event": "result", "payload": item})
-                await asyncio_sleep(0.05)
-            # Then inject
-            inject_results = inject_can_packet(interface)
-            for item in inject_results:
-                logger.log_result(item["type"], item.get("status", "detected"), str(item))
-                collected.append(item)
-                await websocket.send_json({"event": "result", "payload": item})
-                await asyncio_sleep(0.05)
-        # After streaming results, send findings
-        engine = DetectionEngine(SETTINGS)
-        findings = engine.analyze(collected)
-        for f in findings:
-            await websocket.send_json({"event": "finding", "payload": f})
-        await websocket.send_json({"event": "done"})
+        async for message in _wire_messages(sub, _wire_format(params.get("format")), batch_ms):
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
     except WebSocketDisconnect:
         pass
-    except Exception as e:
-        err = {"type": "scan", "status": "failed", "error": str(e)}
-        logger.log_result("scan", "failed", str(err))
-        try:
-            await websocket.send_json({"event": "error", "payload": err})
-        except Exception:
-            pass
     finally:
-        logger.close()
+        HUB.unsubscribe(sub)
         try:
             await websocket.close()
         except Exception:
             pass
 
-# Async friendly sleep for WS loop without importing asyncio globally
-def asyncio_sleep(seconds: float):
-    try:
-        import asyncio
-        return asyncio.sleep(seconds)
-    except Exception:
-        # Fallback: busy-wait (only used if asyncio unavailable which is unlikely)
-        time.sleep(seconds)
-        class _Dummy:
-            def __await__(self):
-                if False:
-                    yield None
-                return None
-        return _Dummy()
+
+@app.get("/api/scan/live")
+async def live_channels():
+    # Shared live captures and their subscribers' queue stats
+    return Response(content=dumps({"channels": HUB.channels()}), media_type="application/json")
+
+
+@app.get("/api/rules")
+async def list_rules():
+    # Registered rules and process-wide per-rule cost, most expensive first
+    disabled = set(SETTINGS.get("disabled_rules") or ())
+    rules = [{**spec.to_dict(), "active": spec.enabled and spec.name not in disabled} for spec in registered_rules()]
+    return {"rules": rules, "stats": rule_stats()}
+
+
+@app.delete("/api/rules/stats")
+async def clear_rule_stats():
+    reset_rule_stats()
+    return {"status": "ok"}
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -303,15 +733,21 @@ async def index():
         <h3>Health</h3>
         <ul>
           <li><a href="/health">/health</a></li>
+          <li><a href="/metrics">/metrics</a> (Prometheus)</li>
         </ul>
         <h3>API</h3>
         <ul>
           <li><code>POST</code> <a href="/api/scan">/api/scan</a></li>
           <li><code>GET</code> <a href="/api/scan/stream">/api/scan/stream</a> (SSE)</li>
           <li><code>WS</code> <a href="/api/scan/ws">/api/scan/ws</a> (WebSocket)</li>
+          <li><code>POST</code> <a href="/api/scans">/api/scans</a> (background scans; <code>GET /api/scans/{id}</code>, <code>/stream</code>, <code>/ws</code>)</li>
+          <li><code>POST</code> <a href="/api/replay">/api/replay</a></li>
           <li><code>GET</code> <a href="/api/report">/api/report</a></li>
           <li><code>GET</code> <a href="/api/results">/api/results</a></li>
           <li><code>DELETE</code> <a href="/api/results">/api/results</a></li>
+          <li><code>GET</code> <a href="/api/results/traffic">/api/results/traffic</a> (frames per minute and CAN ID)</li>
+          <li><code>GET</code> <a href="/api/storage">/api/storage</a> (partitions; <code>POST /api/storage/maintain</code>)</li>
+          <li><code>GET</code> <a href="/api/rules">/api/rules</a> (registered rules and per-rule cost)</li>
           <li><code>GET</code> <a href="/api/settings">/api/settings</a></li>
           <li><code>PUT</code> <a href="/api/settings">/api/settings</a></li>
         </ul>
@@ -330,6 +766,13 @@ class SettingsModel(BaseModel):
     whitelist: list[str | int] | None = None
     blacklist: list[str | int] | None = None
     rate_threshold: int | None = None
+    rate_window: float | None = None
+    period_min_samples: int | None = None
+    period_burst_ratio: float | None = None
+    period_gap_factor: float | None = None
+    capture_filter: list[str | int] | None = None
+    payload_learn_frames: int | None = None
+    disabled_rules: list[str] | None = None
 
 
 @app.put("/api/settings")
@@ -342,6 +785,15 @@ async def update_settings(cfg: SettingsModel):
         new_cfg["blacklist"] = cfg.blacklist
     if cfg.rate_threshold is not None:
         new_cfg["rate_threshold"] = cfg.rate_threshold
+    for key in ("rate_window", "period_min_samples", "period_burst_ratio", "period_gap_factor", "capture_filter",
+                "payload_learn_frames", "disabled_rules"):
+        value = getattr(cfg, key)
+        if value is not None:
+            new_cfg[key] = value
+    try:
+        POLICY.update(new_cfg)
+    except ValueError as e:
+        return _json_error(str(e), 400)
     SETTINGS = new_cfg
     try:
         save_settings(SETTINGS)
@@ -0,0 +1,539 @@
+"""Benchmark suite: throughput and latency of detection, storage, reports and live streams.
+
+Every benchmark runs on synthetic traffic from ``src/scanner/traffic.py``
+(fixed seed, so runs are comparable) and reports metrics with a unit and a
+direction (``higher`` or ``lower`` is better). Results are written as JSON;
+given a baseline from an earlier run on the same machine, each metric is
+compared against it and the run fails when one regressed by more than its
+tolerance (``benchmarks/thresholds.json``).
+
+    python -m benchmarks.run                       # full suite, results in benchmarks/results/
+    python -m benchmarks.run --quick --only detection_stream,logger
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json   # exit 1 on regression
+    python -m benchmarks.run --interface vcan0     # also replay traffic onto vcan0 (needs SocketCAN)
+
+Run from the repository root.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.scanner.traffic import Burst, TrafficProfile
+
+RESULTS_VERSION = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+THRESHOLDS_PATH = os.path.join(HERE, "thresholds.json")
+
+# Frame counts and stream durations per benchmark; --quick scales them down
+FULL = {
+    "ids": 100,
+    "traffic_frames": 2_000_000,
+    "stream_frames": 200_000,
+    "batch_frames": 2_000_000,
+    "log_rows": 100_000,
+    "stream_seconds": 5.0,
+    "stream_ids": 200,
+    "vcan_seconds": 5.0,
+}
+QUICK = {
+    "ids": 100,
+    "traffic_frames": 200_000,
+    "stream_frames": 20_000,
+    "batch_frames": 200_000,
+    "log_rows": 10_000,
+    "stream_seconds": 2.0,
+    "stream_ids": 100,
+    "vcan_seconds": 2.0,
+}
+SEED = 1234
+
+
+class Skip(Exception):
+    """Raised by a benchmark that cannot run here (missing dependency, no interface)."""
+
+
+def metric(value: float, unit: str, better: str = "higher") -> Dict[str, Any]:
+    return {"value": round(float(value), 6), "unit": unit, "better": better}
+
+
+def _percentiles(samples, scale: float, unit: str, prefix: str = "latency") -> Dict[str, Any]:
+    arr = np.frombuffer(samples, dtype=np.int64) if isinstance(samples, array) else np.asarray(samples, dtype=float)
+    if not arr.size:
+        return {}
+    p50, p99 = np.percentile(arr, [50, 99])
+    return {
+        f"{prefix}_p50_{unit}": metric(p50 * scale, unit, "lower"),
+        f"{prefix}_p99_{unit}": metric(p99 * scale, unit, "lower"),
+        f"{prefix}_max_{unit}": metric(arr.max() * scale, unit, "lower"),
+    }
+
+
+def _profile(params: Dict[str, Any], n_ids: Optional[int] = None) -> TrafficProfile:
+    # A spoofed blacklisted ID and an injection burst on the busiest ID
+    profile = TrafficProfile.default(n_ids=n_ids or params["ids"], seed=SEED)
+    busiest = min(profile.ids, key=lambda s: s.period).can_id
+    profile.bursts = [Burst(0x7DF, 1.0, 0.5, rate=2000), Burst(busiest, 3.0, 0.5, rate=1000)]
+    return profile
+
+
+def _whitelist(profile: TrafficProfile) -> Dict[str, Any]:
+    return {"whitelist": [hex(i) for i in profile.can_ids], "blacklist": ["0x7DF"], "rate_threshold": 200}
+
+
+# --------------------------------------------------------------------------- benchmarks
+
+
+def bench_traffic(params, ctx):
+    profile = _profile(params)
+    n = params["traffic_frames"]
+    start = time.perf_counter()
+    batch = profile.generate(frames=n)
+    generate = time.perf_counter() - start
+    start = time.perf_counter()
+    m = sum(1 for _ in profile.iter_frames(frames=n // 10))
+    iterate = time.perf_counter() - start
+    ctx["batch"] = batch
+    return {
+        "frames": metric(len(batch), "frames", "info"),
+        "generate_fps": metric(len(batch) / generate, "frames/s"),
+        "iter_frames_fps": metric(m / iterate, "frames/s"),
+    }
+
+
+def bench_detection_stream(params, ctx):
+    from src.scanner.detection.engine import DetectionEngine
+
+    profile = _profile(params)
+    events = list(profile.iter_events(frames=params["stream_frames"]))
+    engine = DetectionEngine(_whitelist(profile))
+    clock = time.perf_counter_ns
+    feed = engine.feed
+    lat = array("q")
+    findings = 0
+    for ev in events:
+        t = clock()
+        findings += len(feed(ev))
+        lat.append(clock() - t)
+    findings += len(engine.flush())
+    total = sum(lat) / 1e9
+    ctx["events"] = events
+    return {
+        "events_per_s": metric(len(events) / total, "events/s"),
+        **_percentiles(lat, 1e-3, "us"),
+        "findings": metric(findings, "findings", "info"),
+    }
+
+
+def bench_detection_batch(params, ctx):
+    from src.scanner.detection.engine import DetectionEngine
+
+    profile = _profile(params)
+    batch = ctx.get("batch")
+    if batch is None or len(batch) < params["batch_frames"]:
+        batch = profile.generate(frames=params["batch_frames"])
+    engine = DetectionEngine(_whitelist(profile))
+    engine.analyze_batch(profile.generate(frames=1000))  # warm up
+    start = time.perf_counter()
+    findings = engine.analyze_batch(batch)
+    elapsed = time.perf_counter() - start
+    return {
+        "frames_per_s": metric(len(batch) / elapsed, "frames/s"),
+        "seconds": metric(elapsed, "s", "lower"),
+        "findings": metric(len(findings), "findings", "info"),
+    }
+
+
+def bench_logger(params, ctx):
+    from src.reporting import logger as logger_module
+    from src.reporting.logger import Logger
+    from src.scanner.wire import dumps
+
+    events = ctx.get("events") or list(_profile(params).iter_events(frames=params["log_rows"]))
+    events = events[:params["log_rows"]]
+    db = os.path.join(ctx["tmp"], "bench.db")
+    writes: List[float] = []
+    logger_module.set_write_observer(lambda rows, seconds, queued: writes.append(seconds))
+    logger_module.set_serializer(dumps)
+    try:
+        logger = Logger(db)
+        start = time.perf_counter()
+        for ev in events:
+            logger.log_event(ev, scan_id="bench")
+        enqueue = time.perf_counter() - start
+        logger.flush()
+        elapsed = time.perf_counter() - start
+        logger.close()
+    finally:
+        logger_module.set_write_observer(None)
+        logger_module.set_serializer(None)
+    ctx["db"] = db
+    ctx["rows"] = len(events)
+    return {
+        "rows_per_s": metric(len(events) / elapsed, "rows/s"),
+        "enqueue_per_s": metric(len(events) / enqueue, "rows/s"),
+        **_percentiles(writes, 1e3, "ms", prefix="write"),
+        "write_batches": metric(len(writes), "batches", "info"),
+    }
+
+
+def bench_report(params, ctx):
+    from src.reporting.report_generator import REPORT_FORMATS, generate_report
+
+    db = ctx.get("db")
+    if db is None:
+        bench_logger(params, ctx)
+        db = ctx["db"]
+    out = {}
+    for fmt in REPORT_FORMATS:
+        start = time.perf_counter()
+        text = generate_report(db, fmt=fmt)
+        elapsed = time.perf_counter() - start
+        out[f"{fmt}_rows_per_s"] = metric(ctx["rows"] / elapsed, "rows/s")
+        out[f"{fmt}_bytes"] = metric(len(text), "bytes", "info")
+    return out
+
+
+def _backend(params, ctx):
+    # The FastAPI app, driven in-process: SSE/WS clients speak ASGI directly so
+    # every message is timestamped the moment the app sends it
+    if "app" in ctx:
+        return ctx["app"]
+    os.environ["RESULTS_DB"] = os.path.join(ctx["tmp"], "stream.db")
+    os.environ["SETTINGS_PATH"] = os.path.join(ctx["tmp"], "settings.json")
+    os.environ["SIMULATE_IDS"] = str(params["stream_ids"])
+    backend = os.path.join(os.path.dirname(HERE), "backend")
+    if backend not in sys.path:
+        sys.path.insert(0, backend)
+    try:
+        import main
+    except ImportError as e:  # fastapi missing
+        raise Skip(f"backend unavailable: {e}")
+    ctx["app"] = main.app
+    return ctx["app"]
+
+
+def _scope(kind: str, path: str, query: str) -> Dict[str, Any]:
+    return {
+        "type": kind, "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+
+
+def _asgi_sse(app, path: str, query: str, on_message: Callable[[Dict[str, Any], float], bool]):
+    # GET an SSE endpoint; on_message(msg, received_at) returns True to stop
+    async def client():
+        done = asyncio.Event()
+        buf = b""
+
+        async def receive():
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal buf
+            if message["type"] != "http.response.body":
+                return
+            now = time.time()
+            buf += message.get("body", b"")
+            *events, buf = buf.split(b"\n\n")
+            for event in events:
+                if event.startswith(b"data: ") and on_message(json.loads(event[6:]), now):
+                    done.set()
+            if not message.get("more_body") or done.is_set():
+                done.set()
+                raise asyncio.CancelledError
+
+        try:
+            await app(_scope("http", path, query), receive, send)
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(client())
+
+
+def _asgi_ws(app, path: str, query: str, on_message: Callable[[Any, float], bool]):
+    # Connect to a WebSocket endpoint; on_message(text_or_bytes, received_at) returns True to stop
+    async def client():
+        done = asyncio.Event()
+        connected = False
+
+        async def receive():
+            nonlocal connected
+            if not connected:
+                connected = True
+                return {"type": "websocket.connect"}
+            await done.wait()
+            return {"type": "websocket.disconnect", "code": 1000}
+
+        async def send(message):
+            if message["type"] == "websocket.close":
+                done.set()
+            elif message["type"] == "websocket.send":
+                payload = message.get("bytes")
+                if on_message(payload if payload is not None else message.get("text"), time.time()):
+                    done.set()
+            if done.is_set() and message["type"] != "websocket.close":
+                raise asyncio.CancelledError
+
+        try:
+            await app(_scope("websocket", path, query), receive, send)
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(client())
+
+
+def _stream_metrics(latencies: List[float], frames: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "frames_per_s": metric(frames / elapsed if elapsed else 0.0, "frames/s"),
+        "frames": metric(frames, "frames", "info"),
+        **_percentiles(latencies, 1e3, "ms"),
+    }
+
+
+def bench_sse(params, ctx):
+    app = _backend(params, ctx)
+    query = f"interface=bench-sse&simulate=1&duration={params['stream_seconds']}&format=compact"
+    latencies: List[float] = []
+    frames = [0]
+
+    def on_message(msg, now):
+        if msg.get("event") == "frames":
+            latencies.extend(now - row[0] for row in msg["rows"])
+            frames[0] += len(msg["rows"])
+        return msg.get("event") == "done"
+
+    start = time.perf_counter()
+    _asgi_sse(app, "/api/scan/stream", query, on_message)
+    return _stream_metrics(latencies, frames[0], time.perf_counter() - start)
+
+
+def bench_ws(params, ctx):
+    from src.scanner.wire import unpack_batch
+
+    app = _backend(params, ctx)
+    query = f"interface=bench-ws&simulate=1&duration={params['stream_seconds']}&format=binary"
+    latencies: List[float] = []
+    frames = [0]
+
+    def on_message(payload, now):
+        if isinstance(payload, bytes):
+            batch = unpack_batch(payload)
+            latencies.extend(now - f.timestamp for f in batch)
+            frames[0] += len(batch)
+            return False
+        return json.loads(payload).get("event") == "done"
+
+    start = time.perf_counter()
+    _asgi_ws(app, "/api/scan/ws", query, on_message)
+    return _stream_metrics(latencies, frames[0], time.perf_counter() - start)
+
+
+def bench_vcan(params, ctx):
+    interface = ctx.get("interface")
+    if not interface:
+        raise Skip("pass --interface (e.g. vcan0) to replay traffic onto a bus")
+    from src.scanner.attacks.sniff import CanSniffer
+    from src.scanner.traffic import send
+
+    seconds = params["vcan_seconds"]
+    profile = _profile(params)
+    # A match-all filter takes the raw-socket capture path
+    sniffer = CanSniffer(interface, timeout=seconds + 1.0, filters=[(0, 0)])
+    received = [0]
+
+    def drain():
+        for _ in sniffer:
+            received[0] += 1
+
+    try:
+        reader = threading.Thread(target=drain, daemon=True)
+        reader.start()
+        time.sleep(0.2)
+        stats = send(interface, profile.iter_frames(duration=seconds, start=time.time()))
+        reader.join(seconds + 2.0)
+    except Exception as e:
+        raise Skip(f"cannot use {interface}: {e}")
+    sent = stats["sent"] or 1
+    return {
+        "sent_fps": metric(stats["achieved_rate"], "frames/s"),
+        "received_ratio": metric(min(received[0], sent) / sent, "ratio"),
+        "socket_drops": metric(stats["dropped"], "frames", "lower"),
+        "sniffer_drops": metric(sniffer.dropped, "frames", "lower"),
+    }
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "traffic": bench_traffic,
+    "detection_stream": bench_detection_stream,
+    "detection_batch": bench_detection_batch,
+    "logger": bench_logger,
+    "report": bench_report,
+    "sse": bench_sse,
+    "ws": bench_ws,
+    "vcan": bench_vcan,
+}
+
+
+# --------------------------------------------------------------------------- results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(HERE), timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        import orjson  # noqa: F401
+        has_orjson = True
+    except ImportError:
+        has_orjson = False
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "orjson": has_orjson,
+        "commit": _git_commit(),
+    }
+
+
+def run(names: List[str], params: Dict[str, Any], interface: Optional[str] = None) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="can-bench-") as tmp:
+        ctx: Dict[str, Any] = {"tmp": tmp, "interface": interface}
+        for name in names:
+            print(f"[{name}] ...", file=sys.stderr, flush=True)
+            start = time.perf_counter()
+            try:
+                results[name] = {"metrics": BENCHMARKS[name](params, ctx)}
+            except Skip as e:
+                results[name] = {"skipped": str(e)}
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            results[name]["wall_seconds"] = round(time.perf_counter() - start, 3)
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+
+
+def load_thresholds(path: str = THRESHOLDS_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], thresholds: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One row per metric present in both runs; ``status`` is ``regressed``, ``improved`` or ``ok``.
+
+    A metric regresses when it moves in its worse direction by more than its
+    tolerance (fraction of the baseline): ``thresholds["metrics"]["bench.metric"]``,
+    else ``thresholds["default"]`` (0.2). ``info`` metrics are not compared.
+    """
+    default = float(thresholds.get("default", 0.2))
+    per_metric = thresholds.get("metrics", {})
+    rows = []
+    for bench, res in current.get("results", {}).items():
+        base_metrics = baseline.get("results", {}).get(bench, {}).get("metrics", {})
+        for name, m in res.get("metrics", {}).items():
+            base = base_metrics.get(name)
+            if base is None or m["better"] not in ("higher", "lower") or not base["value"]:
+                continue
+            change = (m["value"] - base["value"]) / abs(base["value"])
+            worse = -change if m["better"] == "higher" else change
+            limit = float(per_metric.get(f"{bench}.{name}", default))
+            status = "regressed" if worse > limit else "improved" if worse < -limit else "ok"
+            rows.append({"metric": f"{bench}.{name}", "baseline": base["value"], "value": m["value"],
+                         "unit": m["unit"], "change": round(change, 4), "tolerance": limit, "status": status})
+    return rows
+
+
+def _print_results(report: Dict[str, Any]):
+    for bench, res in report["results"].items():
+        if "metrics" not in res:
+            print(f"{bench:18} {res.get('skipped') or res.get('error')}")
+            continue
+        for name, m in res["metrics"].items():
+            print(f"{bench:18} {name:24} {m['value']:>16,.3f} {m['unit']}")
+
+
+def _print_comparison(rows: List[Dict[str, Any]]):
+    for row in rows:
+        flag = {"regressed": "REGRESSED", "improved": "improved", "ok": ""}[row["status"]]
+        print(f"{row['metric']:44} {row['baseline']:>14,.3f} -> {row['value']:>14,.3f} {row['unit']:9} "
+              f"{row['change']:+8.1%} {flag}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the detection/storage/streaming benchmark suite")
+    parser.add_argument("--only", help=f"Comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs (CI smoke run)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply frame counts by this factor")
+    parser.add_argument("--interface", help="Also replay synthetic traffic onto this interface (vcan)")
+    parser.add_argument("--out", help="Results JSON path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Compare against this results JSON; exit 1 on regression")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH, help="Per-metric regression tolerances")
+    parser.add_argument("--save-baseline", help="Also write the results to this path as the new baseline")
+    args = parser.parse_args(argv)
+
+    names = list(BENCHMARKS) if not args.only else [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+    params = dict(QUICK if args.quick else FULL)
+    for key, value in params.items():
+        if key.endswith(("_frames", "_rows")):
+            params[key] = max(1000, int(value * args.scale))
+
+    report = run(names, params, interface=args.interface)
+    _print_results(report)
+
+    out = args.out or os.path.join(HERE, "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    for path in filter(None, (out, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(f"results: {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("warning: baseline was run with different parameters", file=sys.stderr)
+        rows = compare(report, baseline, load_thresholds(args.thresholds))
+        _print_comparison(rows)
+        regressed = [r for r in rows if r["status"] == "regressed"]
+        if regressed:
+            print(f"{len(regressed)} metric(s) regressed beyond tolerance", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,15 +16,17 @@ function FindingsTable({ findings = [] }) {
             <TableCell>Rule</TableCell>
             <TableCell>Severity</TableCell>
             <TableCell>CAN ID</TableCell>
+            <TableCell align="right">Count</TableCell>
             <TableCell>Description</TableCell>
           </TableRow>
         </TableHead>
         <TableBody>
           {findings.map((f, idx) => (
-            <TableRow key={idx} hover>
+            <TableRow key={f.finding_id || idx} hover>
               <TableCell>{f.rule_id}</TableCell>
               <TableCell><SevChip severity={f.severity} /></TableCell>
               <TableCell>{f.affected_id || '-'}</TableCell>
+              <TableCell align="right">{f.count ?? 1}</TableCell>
               <TableCell>{f.description}</TableCell>
             </TableRow>
           ))}
@@ -4,6 +4,38 @@ import { Button, FormControlLabel, Switch, Stack } from '@mui/material';
 
 const API_BASE = process.env.REACT_APP_API_BASE || 'http://localhost:8000';
 
+// Findings are rolled up per rule and CAN ID; updates replace the earlier row
+const upsertFinding = (prev, f) => {
+  const idx = f.finding_id ? prev.findIndex((x) => x.finding_id === f.finding_id) : -1;
+  if (idx === -1) return [...prev, f];
+  const next = prev.slice();
+  next[idx] = f;
+  return next;
+};
+
+// Compact streams batch captured frames as rows of [timestamp, can_id, dlc, data_hex]
+const rowsToResults = (rows) => rows.map(([timestamp, can_id, dlc, data_hex]) => (
+  { type: 'sniff', status: 'detected', timestamp, can_id, dlc, data_hex }
+));
+
+// Binary WebSocket batches: "CF", version, pad, uint32 count, then 24-byte
+// records of float64 timestamp, uint32 can_id (bit 31 = extended), uint8 dlc, 3 pad, data[8]
+const decodeFrameBatch = (buf) => {
+  const view = new DataView(buf);
+  const count = view.getUint32(4, true);
+  const out = [];
+  for (let i = 0; i < count; i += 1) {
+    const off = 8 + i * 24;
+    const timestamp = view.getFloat64(off, true);
+    const can_id = view.getUint32(off + 8, true) & 0x7fffffff;
+    const dlc = view.getUint8(off + 12);
+    let data_hex = '';
+    for (let j = 0; j < Math.min(dlc, 8); j += 1) data_hex += view.getUint8(off + 16 + j).toString(16).padStart(2, '0');
+    out.push({ type: 'sniff', status: 'detected', timestamp: Number.isNaN(timestamp) ? null : timestamp, can_id, dlc, data_hex });
+  }
+  return out;
+};
+
 function ScanComponent({ setResults, setFindings, setReport, onScanningChange, notify, appendLog }) {
   const [loading, setLoading] = React.useState(false);
   const [simulate, setSimulate] = React.useState(true);
@@ -34,16 +66,20 @@ function ScanComponent({ setResults, setFindings, setReport, onScanningChange, n
     setLoading(true);
     onScanningChange?.(true);
     try {
-      const url = `${API_BASE}/api/scan/stream?interface=vcan0&simulate=${simulate ? 1 : 0}`;
+      const url = `${API_BASE}/api/scan/stream?interface=vcan0&simulate=${simulate ? 1 : 0}&format=compact`;
       const es = new EventSource(url);
       const handleMessage = (evt) => {
         try {
           const msg = JSON.parse(evt.data);
-          if (msg.event === 'result' && msg.payload) {
+          if (msg.event === 'frames' && msg.rows) {
+            const batch = rowsToResults(msg.rows);
+            setResults((prev) => [...prev, ...batch]);
+            appendLog?.({ t: Date.now(), level: 'info', msg: `Frames: ${batch.length}` });
+          } else if (msg.event === 'result' && msg.payload) {
             setResults((prev) => [...prev, msg.payload]);
             appendLog?.({ t: Date.now(), level: (msg.payload.status || 'info'), msg: `Result: ${msg.payload.type} (${msg.payload.status || ''})` });
           } else if (msg.event === 'finding' && msg.payload) {
-            setFindings((prev) => [...prev, msg.payload]);
+            setFindings((prev) => upsertFinding(prev, msg.payload));
             appendLog?.({ t: Date.now(), level: 'error', msg: `Finding: ${msg.payload.rule_id} (${msg.payload.severity})` });
           } else if (msg.event === 'error') {
             console.error('Stream error', msg.payload);
@@ -82,17 +118,25 @@ function ScanComponent({ setResults, setFindings, setReport, onScanningChange, n
     setLoading(true);
     onScanningChange?.(true);
     try {
-      const url = `${API_BASE.replace('http', 'ws')}/api/scan/ws?interface=vcan0&simulate=${simulate ? 1 : 0}`;
+      const url = `${API_BASE.replace('http', 'ws')}/api/scan/ws?interface=vcan0&simulate=${simulate ? 1 : 0}&format=binary`;
       const ws = new WebSocket(url);
+      ws.binaryType = 'arraybuffer';
       ws.onopen = () => {
         appendLog?.({ t: Date.now(), level: 'info', msg: 'WebSocket connected' });
       };
       ws.onmessage = (evt) => {
         try {
+          if (evt.data instanceof ArrayBuffer) {
+            const batch = decodeFrameBatch(evt.data);
+            setResults((prev) => [...prev, ...batch]);
+            return;
+          }
           const msg = JSON.parse(evt.data);
           if (msg.event === 'result' && msg.payload) {
             setResults((prev) => [...prev, msg.payload]);
             appendLog?.({ t: Date.now(), level: (msg.payload.status || 'info'), msg: `WS Result: ${msg.payload.type} (${msg.payload.status || ''})` });
+          } else if (msg.event === 'finding' && msg.payload) {
+            setFindings((prev) => upsertFinding(prev, msg.payload));
           } else if (msg.event === 'done') {
             ws.close();
             axios.get(`${API_BASE}/api/report`).then((r) => setReport(r.data.report)).catch(() => {});
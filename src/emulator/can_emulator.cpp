@@ -1,20 +1,66 @@
 #include "can_emulator.hpp"
 #include <linux/can/raw.h>
+#include <net/if.h>
+#include <poll.h>
 #include <sys/socket.h>
+#include <time.h>
 #include <unistd.h>
+#include <algorithm>
+#include <cerrno>
+#include <cstring>
+#include <memory>
 #include <stdexcept>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 
-CanEmulator::CanEmulator(const std::string& interface) : interface_(interface) {
+CanEmulator::CanEmulator(const std::string& interface, const CanFilterList* filters) : interface_(interface) {
     socket_ = socket(PF_CAN, SOCK_RAW, CAN_RAW);
     if (socket_ < 0) throw std::runtime_error("Failed to create CAN socket");
-    // Bind logic omitted for brevity
+    try {
+        // Filters go in before bind so no unmatched frame is ever queued
+        if (filters != nullptr) setFilters(*filters);
+        // Kernel receive timestamps for receiveFrames(); best effort
+        int on = 1;
+        setsockopt(socket_, SOL_SOCKET, SO_TIMESTAMPNS, &on, sizeof(on));
+        unsigned int ifindex = if_nametoindex(interface.c_str());
+        if (ifindex == 0) throw std::runtime_error("CAN interface not found: " + interface);
+        struct sockaddr_can addr = {};
+        addr.can_family = AF_CAN;
+        addr.can_ifindex = static_cast<int>(ifindex);
+        if (bind(socket_, reinterpret_cast<struct sockaddr*>(&addr), sizeof(addr)) < 0)
+            throw std::runtime_error("Failed to bind CAN socket to " + interface + ": " + std::strerror(errno));
+    } catch (...) {
+        close(socket_);
+        throw;
+    }
 }
 
 CanEmulator::~CanEmulator() {
     close(socket_);
 }
 
+void CanEmulator::setFilters(const CanFilterList& filters) {
+    // An empty list installs a zero-length filter (receive nothing), like a
+    // raw socket in Python; more than the kernel allows falls back to everything
+    if (filters.size() > CAN_RAW_FILTER_MAX) {
+        clearFilters();
+        return;
+    }
+    std::vector<struct can_filter> raw;
+    raw.reserve(filters.size());
+    for (const auto& f : filters) raw.push_back({f.first, f.second});
+    if (setsockopt(socket_, SOL_CAN_RAW, CAN_RAW_FILTER, raw.empty() ? nullptr : raw.data(),
+                   raw.size() * sizeof(struct can_filter)) < 0)
+        throw std::runtime_error(std::string("Failed to set CAN_RAW_FILTER: ") + std::strerror(errno));
+}
+
+void CanEmulator::clearFilters() {
+    // The kernel default: one filter matching every frame
+    struct can_filter all = {0, 0};
+    if (setsockopt(socket_, SOL_CAN_RAW, CAN_RAW_FILTER, &all, sizeof(all)) < 0)
+        throw std::runtime_error(std::string("Failed to set CAN_RAW_FILTER: ") + std::strerror(errno));
+}
+
 bool CanEmulator::sendFrame(uint32_t can_id, const char* data, size_t length) {
     struct can_frame frame = {};
     frame.can_id = can_id;
@@ -27,10 +73,143 @@ bool CanEmulator::receiveFrame(can_frame& frame) {
     return read(socket_, &frame, sizeof(frame)) == sizeof(frame);
 }
 
+static double now_seconds() {
+    struct timespec ts;
+    clock_gettime(CLOCK_REALTIME, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+size_t CanEmulator::receiveFrames(CanRecord* out, size_t n, int timeout_ms) {
+    // Wait up to timeout_ms for the first frame, then take whatever is queued
+    struct pollfd pfd = {socket_, POLLIN, 0};
+    int ready = poll(&pfd, 1, timeout_ms);
+    if (ready < 0) {
+        if (errno == EINTR) return 0;
+        throw std::runtime_error(std::string("poll failed: ") + std::strerror(errno));
+    }
+    if (ready == 0) return 0;
+
+    constexpr size_t kCtrl = CMSG_SPACE(sizeof(struct timespec));
+    std::vector<struct mmsghdr> msgs(std::min(n, kMaxBatch));
+    std::vector<struct iovec> iovs(msgs.size());
+    std::vector<char> ctrl(msgs.size() * kCtrl);
+    size_t total = 0;
+    while (total < n) {
+        size_t batch = std::min(n - total, msgs.size());
+        for (size_t i = 0; i < batch; ++i) {
+            iovs[i].iov_base = &out[total + i].frame;
+            iovs[i].iov_len = sizeof(can_frame);
+            std::memset(&msgs[i], 0, sizeof(msgs[i]));
+            msgs[i].msg_hdr.msg_iov = &iovs[i];
+            msgs[i].msg_hdr.msg_iovlen = 1;
+            msgs[i].msg_hdr.msg_control = &ctrl[i * kCtrl];
+            msgs[i].msg_hdr.msg_controllen = kCtrl;
+        }
+        int got = recvmmsg(socket_, msgs.data(), batch, MSG_DONTWAIT, nullptr);
+        if (got < 0) {
+            if (errno == EAGAIN || errno == EWOULDBLOCK || errno == EINTR) break;
+            throw std::runtime_error(std::string("recvmmsg failed: ") + std::strerror(errno));
+        }
+        double fallback = now_seconds();
+        for (int i = 0; i < got; ++i) {
+            double ts = fallback;
+            for (struct cmsghdr* c = CMSG_FIRSTHDR(&msgs[i].msg_hdr); c; c = CMSG_NXTHDR(&msgs[i].msg_hdr, c)) {
+                if (c->cmsg_level == SOL_SOCKET && c->cmsg_type == SCM_TIMESTAMPNS) {
+                    struct timespec t;
+                    std::memcpy(&t, CMSG_DATA(c), sizeof(t));
+                    ts = t.tv_sec + t.tv_nsec * 1e-9;
+                }
+            }
+            out[total + i].timestamp = ts;
+        }
+        total += static_cast<size_t>(got);
+        if (static_cast<size_t>(got) < batch) break;
+    }
+    return total;
+}
+
+size_t CanEmulator::sendFrames(const can_frame* frames, size_t n) {
+    std::vector<struct mmsghdr> msgs(std::min(n, kMaxBatch));
+    std::vector<struct iovec> iovs(msgs.size());
+    size_t sent = 0;
+    while (sent < n) {
+        size_t batch = std::min(n - sent, msgs.size());
+        for (size_t i = 0; i < batch; ++i) {
+            iovs[i].iov_base = const_cast<can_frame*>(&frames[sent + i]);
+            iovs[i].iov_len = sizeof(can_frame);
+            std::memset(&msgs[i], 0, sizeof(msgs[i]));
+            msgs[i].msg_hdr.msg_iov = &iovs[i];
+            msgs[i].msg_hdr.msg_iovlen = 1;
+        }
+        int done = sendmmsg(socket_, msgs.data(), batch, 0);
+        if (done < 0) {
+            if (errno == EINTR) continue;
+            // ENOBUFS: the interface TX queue is full; report what went out
+            if (errno == ENOBUFS || errno == EAGAIN) break;
+            throw std::runtime_error(std::string("sendmmsg failed: ") + std::strerror(errno));
+        }
+        sent += static_cast<size_t>(done);
+        if (static_cast<size_t>(done) < batch) break;
+    }
+    return sent;
+}
+
 namespace py = pybind11;
 PYBIND11_MODULE(can_emulator, m) {
+    m.attr("RECORD_SIZE") = sizeof(CanRecord);
+    m.attr("FRAME_SIZE") = sizeof(can_frame);
+
+    // Rows of RECORD_SIZE bytes: can_frame (id, dlc, 3 pad, data[8]) + float64 timestamp
+    py::class_<CanRecordBuffer>(m, "CanRecordBuffer", py::buffer_protocol())
+        .def("__len__", [](const CanRecordBuffer& b) { return b.count; })
+        .def_buffer([](CanRecordBuffer& b) -> py::buffer_info {
+            return py::buffer_info(
+                b.records.data(), 1, py::format_descriptor<uint8_t>::format(), 2,
+                {static_cast<py::ssize_t>(b.count), static_cast<py::ssize_t>(sizeof(CanRecord))},
+                {static_cast<py::ssize_t>(sizeof(CanRecord)), static_cast<py::ssize_t>(1)});
+        });
+
     py::class_<CanEmulator>(m, "CanEmulator")
-        .def(py::init<const std::string&>())
+        // filters=None receives every frame, [] receives none (as RawCanSocket)
+        .def(py::init([](const std::string& interface, py::object filters) {
+                 if (filters.is_none()) return std::make_unique<CanEmulator>(interface);
+                 auto list = filters.cast<CanFilterList>();
+                 return std::make_unique<CanEmulator>(interface, &list);
+             }), py::arg("interface"), py::arg("filters") = py::none())
         .def("send_frame", &CanEmulator::sendFrame)
-        .def("receive_frame", &CanEmulator::receiveFrame);
+        .def("receive_frame", &CanEmulator::receiveFrame)
+        .def("set_filters", [](CanEmulator& self, py::object filters) {
+            if (filters.is_none()) self.clearFilters();
+            else self.setFilters(filters.cast<CanFilterList>());
+        }, py::arg("filters"))
+        .def("receive_frames", [](CanEmulator& self, size_t n, double timeout) {
+            auto buf = std::make_unique<CanRecordBuffer>();
+            buf->records.resize(n);
+            int timeout_ms = timeout < 0 ? -1 : static_cast<int>(timeout * 1000);
+            {
+                py::gil_scoped_release release;
+                buf->count = self.receiveFrames(buf->records.data(), n, timeout_ms);
+            }
+            return buf;
+        }, py::arg("n"), py::arg("timeout") = 1.0)
+        .def("receive_into", [](CanEmulator& self, py::buffer out, double timeout) {
+            // Fill a caller-owned writable buffer of RECORD_SIZE-byte rows (e.g. a reused NumPy array)
+            py::buffer_info info = out.request(true);
+            size_t bytes = static_cast<size_t>(info.size * info.itemsize);
+            size_t n = bytes / sizeof(CanRecord);
+            auto* records = static_cast<CanRecord*>(info.ptr);
+            int timeout_ms = timeout < 0 ? -1 : static_cast<int>(timeout * 1000);
+            py::gil_scoped_release release;
+            return self.receiveFrames(records, n, timeout_ms);
+        }, py::arg("out"), py::arg("timeout") = 1.0)
+        .def("send_frames", [](CanEmulator& self, py::buffer batch) {
+            // Contiguous rows of FRAME_SIZE-byte struct can_frame
+            py::buffer_info info = batch.request();
+            size_t bytes = static_cast<size_t>(info.size * info.itemsize);
+            if (bytes % sizeof(can_frame) != 0)
+                throw std::invalid_argument("send_frames expects a multiple of 16 bytes (struct can_frame rows)");
+            const auto* frames = static_cast<const can_frame*>(info.ptr);
+            py::gil_scoped_release release;
+            return self.sendFrames(frames, bytes / sizeof(can_frame));
+        }, py::arg("batch"));
 }
@@ -1,13 +1,39 @@
 #pragma once
 #include <string>
+#include <utility>
+#include <vector>
 #include <linux/can.h>
 
+// (can_id, can_mask) pairs installed as CAN_RAW_FILTER
+using CanFilterList = std::vector<std::pair<uint32_t, uint32_t>>;
+
+// One received frame plus its kernel receive time (epoch seconds); 24 bytes, no padding
+struct CanRecord {
+    can_frame frame;
+    double timestamp;
+};
+
+// Owns the records filled by one receiveFrames() call; exposed to Python
+// through the buffer protocol so NumPy can view it without copying
+struct CanRecordBuffer {
+    std::vector<CanRecord> records;
+    size_t count = 0;
+};
+
 class CanEmulator {
 public:
-    CanEmulator(const std::string& interface);
+    // filters == nullptr receives every frame; an empty list receives none
+    explicit CanEmulator(const std::string& interface, const CanFilterList* filters = nullptr);
     ~CanEmulator();
     bool sendFrame(uint32_t can_id, const char* data, size_t length);
     bool receiveFrame(can_frame& frame);
+    void setFilters(const CanFilterList& filters);
+    void clearFilters();
+    // Batch I/O: one recvmmsg/sendmmsg per up to kMaxBatch frames. Callers
+    // are expected to drop the GIL around these (see the bindings).
+    size_t receiveFrames(CanRecord* out, size_t n, int timeout_ms);
+    size_t sendFrames(const can_frame* frames, size_t n);
+    static constexpr size_t kMaxBatch = 1024;
 private:
     int socket_;
     std::string interface_;
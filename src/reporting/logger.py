@@ -1,36 +1,283 @@
 import sqlite3
 import datetime
+import json
 import os
+import queue
+import threading
+import time
+import atexit
+import weakref
+from .partitions import PARTITION_MODES, open_partition, partition_for, partition_mode
+from .schema import ensure_schema
+
+_INSERT = (
+    "INSERT INTO results (timestamp, test_type, status, details, scan_id, can_id, severity, rule_id, ts) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _as_can_id(value):
+    if value is None:
+        return None
+    try:
+        if isinstance(value, str):
+            return int(value, 16) if value.lower().startswith("0x") else int(value)
+        return int(value)
+    except Exception:
+        return None
+
+
+# Loggers still open at interpreter exit get flushed and closed
+_LIVE_LOGGERS = weakref.WeakSet()
+
+# observer(rows, seconds, queued) after every committed write, e.g. for metrics
+_write_observer = None
+
+# dumps(details) -> str for non-string details; None: the standard library
+_serializer = None
+
+
+def set_write_observer(fn):
+    """Call ``fn(rows, seconds, queued)`` after each commit, on the writing thread.
+
+    ``queued`` is the writer's backlog (0 without a background writer). Pass
+    ``None`` to remove it.
+    """
+    global _write_observer
+    _write_observer = fn
+
+
+def set_serializer(fn):
+    """Encode non-string ``details`` with ``fn(details) -> str``.
+
+    The backend installs the scanner's stream encoder (``wire.dumps``) so rows
+    are stored exactly as they are streamed. Details ``fn`` rejects, and all
+    details while none is set, go through ``json.dumps`` with ``str()`` for
+    anything it can't encode. Pass ``None`` to remove it.
+    """
+    global _serializer
+    _serializer = fn
+
+
+def serialize_details(details) -> str:
+    if isinstance(details, str):
+        return details
+    dumps = _serializer
+    if dumps is not None:
+        try:
+            return dumps(details)
+        except (TypeError, ValueError):  # e.g. integers beyond 64 bits under orjson
+            pass
+    return json.dumps(details, default=str)
+
+
+def live_loggers():
+    return list(_LIVE_LOGGERS)
+
+
+@atexit.register
+def _close_live_loggers():
+    for logger in list(_LIVE_LOGGERS):
+        try:
+            logger.close()
+        except Exception:
+            pass
+
 
 class Logger:
-    def __init__(self, db_path=None):
+    """SQLite result logger.
+
+    By default rows are handed to a background writer thread through a bounded
+    queue and written with ``executemany`` in batches of up to ``batch_size``
+    rows, committed at least every ``flush_interval`` seconds. The database runs
+    in WAL mode with ``synchronous=NORMAL`` so readers (reports, /api/results)
+    never block the writer. ``flush()`` waits until everything queued so far is
+    committed; ``close()`` (also run at interpreter exit) flushes and stops the
+    writer. Pass ``background=False`` to write and commit on the caller thread.
+
+    With ``partition="day"`` or ``"hour"`` (default: ``RESULTS_PARTITION``) rows
+    go to the time partition of ``db_path`` for the moment they are written
+    (see ``partitions``); the logger opens the next one when the period ends.
+    """
+
+    def __init__(self, db_path=None, batch_size=1000, flush_interval=0.25, background=True, max_queue=100_000,
+                 partition=None):
         # Allow overriding DB path via env var
         if db_path is None:
             db_path = os.getenv("RESULTS_DB", "data/results.db")
         # Ensure DB directory exists for containerized runs
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.conn = sqlite3.connect(db_path)
-        self.create_table()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.partition = partition if partition is not None else partition_mode()
+        if self.partition not in PARTITION_MODES:
+            raise ValueError(f"partition must be one of {', '.join(PARTITION_MODES)}, got {self.partition!r}")
+        self._part = None
+        self._part_inode = None
+        # The writer thread owns the connection once started
+        if self.partition == "none":
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.create_table()
+        else:
+            self.conn = None
+            self._connection()
+        self._closed = False
+        self.rows_written = 0
+        self._queue = None
+        self._writer = None
+        self._error = None
+        if background:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._writer = threading.Thread(target=self._run, name="results-writer", daemon=True)
+            self._writer.start()
+        _LIVE_LOGGERS.add(self)
 
     def create_table(self):
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                test_type TEXT,
-                status TEXT,
-                details TEXT
-            )
-        """)
-        self.conn.commit()
-
-    def log_result(self, test_type, status, details):
-        timestamp = datetime.datetime.now().isoformat()
-        self.conn.execute(
-            "INSERT INTO results (timestamp, test_type, status, details) VALUES (?, ?, ?, ?)",
-            (timestamp, test_type, status, details)
+        ensure_schema(self._connection())
+
+    def _row(self, test_type, status, details, scan_id=None, can_id=None, severity=None, rule_id=None, ts=None):
+        now = time.time()
+        timestamp = datetime.datetime.fromtimestamp(now).isoformat()
+        return (
+            timestamp, test_type, status, serialize_details(details),
+            scan_id, can_id, severity, rule_id, now if ts is None else ts,
+        )
+
+    def _connection(self):
+        if self.partition == "none":
+            return self.conn
+        part = partition_for(self.db_path, self.partition)
+        try:
+            inode = os.stat(part.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        # Next period, or the file was dropped/compacted under us: (re)open
+        if self._part is None or part.key != self._part.key or inode != self._part_inode:
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = open_partition(part)
+            self._part = part
+            self._part_inode = os.stat(part.path).st_ino
+        return self.conn
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        conn = self._connection()
+        conn.executemany(_INSERT, rows)
+        conn.commit()
+        self.rows_written += len(rows)
+        observer = _write_observer
+        if observer is not None:
+            try:
+                observer(len(rows), time.perf_counter() - start, self.queued)
+            except Exception:  # metrics must never fail a write
+                pass
+
+    @property
+    def queued(self):
+        """Rows handed to the background writer and not yet taken."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _put(self, row):
+        if self._queue is None:
+            self._write([row])
+        else:
+            # Blocks only if the writer is more than max_queue rows behind
+            self._queue.put(row)
+
+    def log_result(self, test_type, status, details, scan_id=None, can_id=None, severity=None, rule_id=None, ts=None):
+        self._put(self._row(test_type, status, details, scan_id, can_id, severity, rule_id, ts))
+
+    def log_event(self, event, scan_id=None, details=None):
+        """Log a scan event dict, lifting CAN ID and capture time into columns.
+
+        ``details`` overrides what is stored (e.g. an already flattened copy).
+        """
+        frame = event.get("frame")
+        if frame is not None:
+            can_id, ts = frame.can_id, frame.timestamp
+        else:
+            can_id, ts = _as_can_id(event.get("can_id")), event.get("timestamp")
+        self.log_result(
+            event.get("type", "event"), event.get("status", "detected"),
+            event if details is None else details,
+            scan_id=scan_id, can_id=can_id, ts=ts,
         )
-        self.conn.commit()
+
+    def log_finding(self, finding, scan_id=None):
+        severity = finding.get("severity", "alert")
+        self.log_result(
+            "finding", severity, finding,
+            scan_id=scan_id, can_id=_as_can_id(finding.get("affected_id")),
+            severity=severity, rule_id=finding.get("rule_id"),
+        )
+
+    def log_many(self, entries):
+        """Log an iterable of ``(test_type, status, details)`` tuples."""
+        rows = [self._row(*e) for e in entries]
+        if self._queue is None:
+            self._write(rows)
+        else:
+            for row in rows:
+                self._queue.put(row)
+
+    def _run(self):
+        q = self._queue
+        stop = False
+        while not stop:
+            batch = []
+            waiters = []
+            try:
+                item = q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                # Keep draining without waiting once a flush was requested
+                timeout = 0 if waiters else deadline - time.monotonic()
+                try:
+                    item = q.get(timeout=timeout) if timeout > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:  # keep the writer alive; surface on flush/close
+                    self._error = e
+            for ev in waiters:
+                ev.set()
+
+    def flush(self, timeout=None):
+        """Block until all rows logged so far are committed."""
+        if self._queue is None or self._writer is None or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
 
     def close(self):
-        self.conn.close()
+        if self._closed:
+            return
+        self._closed = True
+        _LIVE_LOGGERS.discard(self)
+        try:
+            if self._writer is not None and self._writer.is_alive():
+                self._queue.put(None)
+                self._writer.join()
+        finally:
+            if self.conn is not None:
+                self.conn.close()
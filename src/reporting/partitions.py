@@ -0,0 +1,360 @@
+"""Time-partitioned result storage: one SQLite file per day or hour.
+
+With ``RESULTS_PARTITION=day`` (or ``hour``) a ``Logger`` for
+``data/results.db`` writes into ``data/results.d/20261018.db`` (UTC, by write
+time) and moves to a new file when the period ends. A pre-existing
+``data/results.db`` stays readable as the oldest partition. Each partition
+seeds its row ids from its start time (``start << ID_SHIFT``), so ids keep
+growing across partitions and keyset pagination on ``id`` works over all of
+them.
+
+Old partitions are maintained by ``maintain()``:
+
+- after ``compact_after_hours`` the raw captured frames of a partition are
+  folded into ``frame_minutes`` (frames per minute, scan and CAN ID); findings
+  and other events are kept. The rewrite is one write transaction that
+  truncates and refills the table, so no rows are deleted one by one and no
+  concurrent write is lost.
+- after ``retention_days`` the partition file is removed.
+
+Readers (``query``, ``report_generator``) go through ``list_partitions()`` and
+see all partitions as one table; with partitioning off it returns only the
+single database file.
+"""
+import calendar
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .schema import EVENT_TS, FRAME_ROWS, ensure_schema
+
+PARTITION_MODES = ("none", "day", "hour")
+SPANS = {"day": 86400, "hour": 3600}
+_KEY_FORMATS = {"day": "%Y%m%d", "hour": "%Y%m%dT%H"}
+
+# Ids in a partition start at start_epoch << ID_SHIFT: room for 1M rows per
+# second of the period, and ids stay below 2**53 (JSON-safe) until ~2255
+ID_SHIFT = 20
+
+# user_version of a partition whose raw frames were compacted
+COMPACTED = 1
+
+_COLUMNS = "id, timestamp, test_type, status, details, scan_id, can_id, severity, rule_id, ts"
+
+
+def default_db_path() -> str:
+    return os.getenv("RESULTS_DB", "data/results.db")
+
+
+def partition_mode() -> str:
+    mode = os.getenv("RESULTS_PARTITION", "none").strip().lower() or "none"
+    if mode not in PARTITION_MODES:
+        raise ValueError(f"RESULTS_PARTITION must be one of {', '.join(PARTITION_MODES)}, got {mode!r}")
+    return mode
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    value = float(value)
+    return value if value > 0 else None
+
+
+def retention_days() -> Optional[float]:
+    """``RESULTS_RETENTION_DAYS`` (default 30); 0 keeps partitions forever."""
+    return _env_float("RESULTS_RETENTION_DAYS", 30.0)
+
+
+def compact_after_hours() -> Optional[float]:
+    """``RESULTS_COMPACT_AFTER_HOURS`` (default 24); 0 never compacts."""
+    return _env_float("RESULTS_COMPACT_AFTER_HOURS", 24.0)
+
+
+def partition_dir(db_path: str) -> str:
+    return os.path.splitext(db_path)[0] + ".d"
+
+
+class Partition:
+    """One database file: a time partition, or the unpartitioned base file (``key == ""``)."""
+
+    __slots__ = ("key", "path", "start", "end")
+
+    def __init__(self, key: str, path: str, start: float, end: float):
+        self.key = key
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def first_id(self) -> int:
+        """Every row id in the partition is greater than this."""
+        return int(self.start) << ID_SHIFT
+
+    @property
+    def compacted(self) -> bool:
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0] >= COMPACTED
+        finally:
+            conn.close()
+
+    def to_dict(self) -> Dict[str, Any]:
+        try:
+            size = sum(os.path.getsize(self.path + s) for s in ("", "-wal") if os.path.exists(self.path + s))
+        except OSError:
+            size = 0
+        return {
+            "partition": self.key or "base",
+            "path": self.path,
+            "start": self.start,
+            "end": self.end,
+            "bytes": size,
+            "compacted": self.compacted if os.path.exists(self.path) else False,
+        }
+
+
+def partition_for(db_path: str, mode: str, now: Optional[float] = None) -> Partition:
+    """The partition that rows written at ``now`` go to."""
+    span = SPANS[mode]
+    start = int(time.time() if now is None else now) // span * span
+    key = time.strftime(_KEY_FORMATS[mode], time.gmtime(start))
+    return Partition(key, os.path.join(partition_dir(db_path), key + ".db"), start, start + span)
+
+
+def _parse_key(key: str) -> Optional[Partition]:
+    for mode, fmt in _KEY_FORMATS.items():
+        try:
+            start = calendar.timegm(time.strptime(key, fmt))
+        except ValueError:
+            continue
+        return Partition(key, "", start, start + SPANS[mode])
+    return None
+
+
+def list_partitions(db_path: Optional[str] = None) -> List[Partition]:
+    """Existing database files for ``db_path``, oldest first."""
+    db_path = db_path if db_path is not None else default_db_path()
+    parts = []
+    if os.path.exists(db_path):
+        parts.append(Partition("", db_path, 0, os.path.getmtime(db_path)))
+    directory = partition_dir(db_path)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    timed = []
+    for name in names:
+        if not name.endswith(".db"):
+            continue
+        part = _parse_key(name[:-3])
+        if part is not None:
+            part.path = os.path.join(directory, name)
+            timed.append(part)
+    timed.sort(key=lambda p: p.start)
+    return parts + timed
+
+
+def open_partition(part: Partition) -> sqlite3.Connection:
+    """Connect for writing, creating the file and seeding its row ids if new."""
+    os.makedirs(os.path.dirname(part.path) or ".", exist_ok=True)
+    conn = sqlite3.connect(part.path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    ensure_schema(conn)
+    if part.key:
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'results', ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'results')",
+            (part.first_id,),
+        )
+        conn.commit()
+    return conn
+
+
+def _remove(path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def count_rows(part: Partition, scan_id: Optional[str] = None) -> int:
+    conn = sqlite3.connect(part.path)
+    try:
+        ensure_schema(conn)
+        if scan_id is None:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return conn.execute("SELECT COUNT(*) FROM results WHERE scan_id = ?", (scan_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def drop_partition(part: Partition):
+    """Remove the partition's files. Loggers writing to it reopen a fresh file."""
+    _remove(part.path)
+
+
+def _fold_frames(conn: sqlite3.Connection) -> Dict[str, int]:
+    # Runs inside the caller's write transaction, so no rows land meanwhile
+    frames = conn.execute(f"SELECT COUNT(*) FROM results WHERE {FRAME_ROWS}").fetchone()[0]
+    conn.execute(f"""
+        CREATE TEMP TABLE folded AS
+        SELECT minute, scan_id, can_id, SUM(frames) AS frames, MIN(first_ts) AS first_ts, MAX(last_ts) AS last_ts
+        FROM (
+            SELECT CAST({EVENT_TS} / 60 AS INTEGER) AS minute, scan_id, can_id,
+                   1 AS frames, {EVENT_TS} AS first_ts, {EVENT_TS} AS last_ts
+            FROM main.results WHERE {FRAME_ROWS}
+            UNION ALL
+            SELECT minute, scan_id, can_id, frames, first_ts, last_ts FROM main.frame_minutes
+        ) GROUP BY minute, scan_id, can_id
+    """)
+    conn.execute(f"CREATE TEMP TABLE kept AS SELECT {_COLUMNS} FROM main.results WHERE NOT ({FRAME_ROWS})")
+    # Unqualified DELETEs truncate the tables instead of deleting row by row;
+    # sqlite_sequence is left alone, so later rows never reuse an id
+    conn.execute("DELETE FROM main.results")
+    conn.execute(f"INSERT INTO main.results ({_COLUMNS}) SELECT {_COLUMNS} FROM temp.kept")
+    conn.execute("DELETE FROM main.frame_minutes")
+    conn.execute("INSERT INTO main.frame_minutes SELECT * FROM temp.folded")
+    aggregates = conn.execute("SELECT COUNT(*) FROM temp.folded").fetchone()[0]
+    conn.execute("DROP TABLE temp.kept")
+    conn.execute("DROP TABLE temp.folded")
+    conn.execute(f"PRAGMA user_version = {COMPACTED}")
+    return {"frames": frames, "aggregates": aggregates}
+
+
+def compact_partition(part: Partition) -> Dict[str, Any]:
+    """Fold raw frames into ``frame_minutes``, in place and in one transaction.
+
+    Findings and non-frame events are kept with their ids; aggregates already
+    in the partition are merged with the new ones. The partition stays
+    write-locked from the first read to the commit, so a concurrent write
+    either lands before (and is compacted) or waits and lands after.
+    Connections that have the partition open (loggers, streaming reports)
+    keep working and see either version whole. ``VACUUM`` then returns the
+    freed pages to the filesystem.
+    """
+    conn = sqlite3.connect(part.path, isolation_level=None)
+    try:
+        ensure_schema(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            counts = _fold_frames(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"partition": part.key or "base", **counts}
+    finally:
+        conn.close()
+
+
+def maintain(db_path: Optional[str] = None, retention_days: Optional[float] = None,
+             compact_after_hours: Optional[float] = None, now: Optional[float] = None) -> Dict[str, Any]:
+    """Drop partitions past retention and compact those past ``compact_after_hours``.
+
+    Age is measured from the end of a partition's period, so the partition
+    being written is never touched. The unpartitioned base file is never
+    dropped or compacted.
+    """
+    db_path = db_path if db_path is not None else default_db_path()
+    now = time.time() if now is None else now
+    dropped, compacted = [], []
+    for part in list_partitions(db_path):
+        if not part.key:
+            continue
+        age = now - part.end
+        if retention_days is not None and age >= retention_days * 86400:
+            drop_partition(part)
+            dropped.append(part.key)
+        elif compact_after_hours is not None and age >= compact_after_hours * 3600 and not part.compacted:
+            compacted.append(compact_partition(part))
+    return {"dropped": dropped, "compacted": compacted}
+
+
+class Maintainer:
+    """Run ``maintain()`` every ``interval`` seconds on a daemon thread.
+
+    Settings are read from the environment at each run unless given here.
+    With partitioning off (``partition="none"``) runs do nothing. ``last``
+    holds the latest result (or error).
+
+    The thread also measures the storage every ``usage_interval`` seconds,
+    partitioning on or off, so metrics read ``usage`` (file count and bytes,
+    WAL included) without touching the filesystem.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, interval: float = 300.0, partition: Optional[str] = None,
+                 retention_days: Optional[float] = None, compact_after_hours: Optional[float] = None,
+                 usage_interval: float = 30.0):
+        self.db_path = db_path
+        self.partition = partition
+        self.interval = interval
+        self.usage_interval = usage_interval
+        self.retention_days = retention_days
+        self.compact_after_hours = compact_after_hours
+        self.last: Optional[Dict[str, Any]] = None
+        self.usage: Dict[str, int] = {"partitions": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return (self.partition if self.partition is not None else partition_mode()) != "none"
+
+    def run_once(self) -> Dict[str, Any]:
+        with self._lock:
+            start = time.perf_counter()
+            if not self.enabled:
+                return {"skipped": "partitioning is off (RESULTS_PARTITION=none)"}
+            try:
+                result = maintain(
+                    self.db_path,
+                    retention_days=self.retention_days if self.retention_days is not None else retention_days(),
+                    compact_after_hours=(self.compact_after_hours if self.compact_after_hours is not None
+                                         else compact_after_hours()),
+                )
+            except Exception as e:  # keep the thread alive; report through `last`
+                result = {"error": str(e)}
+            result.update(finished=time.time(), seconds=round(time.perf_counter() - start, 3))
+            self.last = result
+            return result
+
+    def measure(self) -> Dict[str, int]:
+        parts = list_partitions(self.db_path)
+        size = 0
+        for part in parts:
+            for path in (part.path, part.path + "-wal"):
+                try:
+                    size += os.path.getsize(path)
+                except OSError:
+                    pass
+        self.usage = {"partitions": len(parts), "bytes": size}
+        return self.usage
+
+    def start(self) -> "Maintainer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="results-maintenance", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        due = 0.0
+        while not self._halt.is_set():
+            if time.monotonic() >= due:
+                self.run_once()
+                due = time.monotonic() + self.interval
+            try:
+                self.measure()
+            except OSError:
+                pass
+            self._halt.wait(max(0.0, min(self.usage_interval, due - time.monotonic())))
+
+    def stop(self):
+        self._halt.set()
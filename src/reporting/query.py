@@ -0,0 +1,191 @@
+"""Filtered, keyset-paginated reads of the results table, across time partitions."""
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from .partitions import count_rows, drop_partition, list_partitions
+from .schema import EVENT_TS, FRAME_ROWS, ensure_schema
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+_COLUMNS = "id, timestamp, test_type, status, details, scan_id, can_id, severity, rule_id, ts"
+
+
+def _db_path(db_path: Optional[str]) -> str:
+    return db_path if db_path is not None else os.getenv("RESULTS_DB", "data/results.db")
+
+
+def _row_to_dict(r) -> Dict[str, Any]:
+    return {
+        "id": r[0],
+        "timestamp": r[1],
+        "type": r[2],
+        "status": r[3],
+        "details": r[4],
+        "scan_id": r[5],
+        "can_id": hex(r[6]) if r[6] is not None else None,
+        "severity": r[7],
+        "rule_id": r[8],
+        "ts": r[9],
+    }
+
+
+def query_results(
+    db_path: Optional[str] = None,
+    *,
+    scan_id: Optional[str] = None,
+    test_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    can_id: Optional[int] = None,
+    rule_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    before_id: Optional[int] = None,
+    limit: int = DEFAULT_LIMIT,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Return ``(rows, next_cursor)``, newest first.
+
+    Pagination is keyset-based on ``id``: pass the returned ``next_cursor`` back
+    as ``before_id`` for the next page (None when there are no more rows).
+    ``since``/``until`` filter on the event time ``ts`` in epoch seconds.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    where, args = [], []
+    for col, value in (
+        ("scan_id", scan_id), ("test_type", test_type), ("severity", severity),
+        ("can_id", can_id), ("rule_id", rule_id),
+    ):
+        if value is not None:
+            where.append(f"{col} = ?")
+            args.append(value)
+    if since is not None:
+        where.append("ts >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("ts < ?")
+        args.append(until)
+    if before_id is not None:
+        where.append("id < ?")
+        args.append(before_id)
+    sql = f"SELECT {_COLUMNS} FROM results"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    # Ids grow across partitions: read newest first until the page is full
+    rows: List[tuple] = []
+    for part in reversed(list_partitions(_db_path(db_path))):
+        if before_id is not None and before_id <= part.first_id + 1:
+            continue
+        conn = sqlite3.connect(part.path)
+        try:
+            ensure_schema(conn)
+            rows.extend(conn.execute(sql, args + [limit + 1 - len(rows)]).fetchall())
+        finally:
+            conn.close()
+        if len(rows) > limit:
+            break
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = rows[-1][0] if more and rows else None
+    return [_row_to_dict(r) for r in rows], next_cursor
+
+
+def query_traffic(
+    db_path: Optional[str] = None,
+    *,
+    scan_id: Optional[str] = None,
+    can_id: Optional[int] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = DEFAULT_LIMIT,
+) -> List[Dict[str, Any]]:
+    """Captured frames per minute, scan and CAN ID, newest minute first.
+
+    Compacted partitions answer from their ``frame_minutes`` aggregates and the
+    others from their raw frames, so the result does not depend on which
+    partitions were compacted yet.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    where, args = [], []
+    for col, value in (("scan_id", scan_id), ("can_id", can_id)):
+        if value is not None:
+            where.append(f"{col} = ?")
+            args.append(value)
+    raw, agg = list(where), list(where)
+    raw_args, agg_args = list(args), list(args)
+    if since is not None:
+        raw.append(f"{EVENT_TS} >= ?")
+        agg.append("minute >= ?")
+        raw_args.append(since)
+        agg_args.append(int(since // 60))
+    if until is not None:
+        raw.append(f"{EVENT_TS} < ?")
+        agg.append("minute * 60 < ?")
+        raw_args.append(until)
+        agg_args.append(until)
+    sql = f"""
+        SELECT minute, scan_id, can_id, SUM(frames), MIN(first_ts), MAX(last_ts) FROM (
+            SELECT CAST({EVENT_TS} / 60 AS INTEGER) AS minute, scan_id, can_id, 1 AS frames,
+                   {EVENT_TS} AS first_ts, {EVENT_TS} AS last_ts
+            FROM results WHERE {" AND ".join([FRAME_ROWS] + raw)}
+            UNION ALL
+            SELECT minute, scan_id, can_id, frames, first_ts, last_ts FROM frame_minutes
+            {"WHERE " + " AND ".join(agg) if agg else ""}
+        ) GROUP BY minute, scan_id, can_id ORDER BY minute DESC LIMIT ?
+    """
+    merged: Dict[tuple, list] = {}
+    for part in list_partitions(_db_path(db_path)):
+        conn = sqlite3.connect(part.path)
+        try:
+            ensure_schema(conn)
+            found = conn.execute(sql, raw_args + agg_args + [limit]).fetchall()
+        finally:
+            conn.close()
+        # A minute can straddle two partitions (or the base file): add them up
+        for minute, scan, cid, frames, first_ts, last_ts in found:
+            entry = merged.get((minute, scan, cid))
+            if entry is None:
+                merged[(minute, scan, cid)] = [frames, first_ts, last_ts]
+            else:
+                entry[0] += frames
+                entry[1] = min(entry[1], first_ts)
+                entry[2] = max(entry[2], last_ts)
+    keys = sorted(merged, key=lambda k: (-k[0], k[1] or "", k[2]))[:limit]
+    return [
+        {
+            "minute": k[0] * 60, "scan_id": k[1], "can_id": hex(k[2]),
+            "frames": merged[k][0], "first_ts": merged[k][1], "last_ts": merged[k][2],
+        }
+        for k in keys
+    ]
+
+
+def clear_results(db_path: Optional[str] = None, scan_id: Optional[str] = None) -> int:
+    """Delete rows (of one scan); returns how many.
+
+    Clearing everything removes partition files instead of deleting rows; the
+    base file is emptied in place. Per-scan clears delete that scan's rows and
+    aggregates in every partition.
+    """
+    cleared = 0
+    for part in list_partitions(_db_path(db_path)):
+        if scan_id is None and part.key:
+            cleared += count_rows(part)
+            drop_partition(part)
+            continue
+        conn = sqlite3.connect(part.path)
+        try:
+            ensure_schema(conn)
+            cur = conn.cursor()
+            if scan_id is None:
+                cur.execute("DELETE FROM results")
+                conn.execute("DELETE FROM frame_minutes")
+            else:
+                cur.execute("DELETE FROM results WHERE scan_id = ?", (scan_id,))
+                conn.execute("DELETE FROM frame_minutes WHERE scan_id = ?", (scan_id,))
+            conn.commit()
+            cleared += cur.rowcount
+        finally:
+            conn.close()
+    return cleared
@@ -1,32 +1,271 @@
 import sqlite3
 import os
+import json
+import html
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+from .partitions import list_partitions
+from .schema import ensure_schema
 
-def generate_report(db_path=None):
+REPORT_FORMATS = ("markdown", "jsonl", "html")
+
+# Rows are pulled from the cursor in chunks of this size while streaming
+FETCH_ROWS = 500
+
+REMEDIATION = "Implement validation and encryption for CAN packets."
+
+
+class _Summary:
+    """Running per-scan counters, updated only with rows newer than ``last_id``."""
+
+    __slots__ = ("last_id", "total", "by_type", "by_status", "by_severity", "by_rule")
+
+    def __init__(self):
+        self.last_id = 0
+        self.total = 0
+        self.by_type: Dict[str, int] = {}
+        self.by_status: Dict[str, int] = {}
+        self.by_severity: Dict[str, int] = {}
+        self.by_rule: Dict[str, int] = {}
+
+    def add(self, test_type, status, severity, rule_id):
+        self.total += 1
+        self.by_type[test_type] = self.by_type.get(test_type, 0) + 1
+        if test_type == "finding":
+            sev = severity or status or "alert"
+            self.by_severity[sev] = self.by_severity.get(sev, 0) + 1
+            if rule_id:
+                self.by_rule[rule_id] = self.by_rule.get(rule_id, 0) + 1
+        else:
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+
+    def to_dict(self):
+        return {
+            "rows": self.total,
+            "last_id": self.last_id,
+            "by_type": dict(self.by_type),
+            "by_status": dict(self.by_status),
+            "findings_by_severity": dict(self.by_severity),
+            "findings_by_rule": dict(self.by_rule),
+        }
+
+
+# (db file, inode, user_version, scan_id) -> _Summary; bounded LRU. Compaction
+# rewrites a partition in place (same inode, same max id) but bumps its
+# user_version, which restarts the count; a replaced file restarts it too.
+_SUMMARY_CACHE: "OrderedDict[tuple, _Summary]" = OrderedDict()
+_SUMMARY_CACHE_SIZE = 128
+_SUMMARY_LOCK = threading.Lock()
+
+
+def _scan_filter(scan_id: Optional[str]):
+    return (" AND scan_id = ?", (scan_id,)) if scan_id is not None else ("", ())
+
+
+def summarize(conn: sqlite3.Connection, db_path: str, scan_id: Optional[str] = None) -> dict:
+    """Per-scan summary of one database file, processing only rows added since the cached ``last_id``."""
+    try:
+        inode = os.stat(db_path).st_ino
+    except OSError:
+        inode = None
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    key = (os.path.abspath(db_path), inode, version, scan_id)
+    with _SUMMARY_LOCK:
+        summary = _SUMMARY_CACHE.pop(key, None)
+        max_id = conn.execute("SELECT MAX(id) FROM results").fetchone()[0] or 0
+        if summary is None or max_id < summary.last_id:
+            # First request, or the table was cleared since: start over
+            summary = _Summary()
+        clause, args = _scan_filter(scan_id)
+        cur = conn.execute(
+            "SELECT id, test_type, status, severity, rule_id FROM results WHERE id > ? AND id <= ?" + clause,
+            (summary.last_id, max_id) + args,
+        )
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            for _id, test_type, status, severity, rule_id in rows:
+                summary.add(test_type, status, severity, rule_id)
+        summary.last_id = max_id
+        _SUMMARY_CACHE[key] = summary
+        while len(_SUMMARY_CACHE) > _SUMMARY_CACHE_SIZE:
+            _SUMMARY_CACHE.popitem(last=False)
+        return summary.to_dict()
+
+
+def _merge(summaries: List[dict], compacted_frames: int) -> dict:
+    # Partitions are summarized separately; the report shows their sum
+    merged = _Summary().to_dict()
+    for s in summaries:
+        merged["rows"] += s["rows"]
+        merged["last_id"] = max(merged["last_id"], s["last_id"])
+        for field in ("by_type", "by_status", "findings_by_severity", "findings_by_rule"):
+            for k, v in s[field].items():
+                merged[field][k] = merged[field].get(k, 0) + v
+    merged["compacted_frames"] = compacted_frames
+    return merged
+
+
+def _compacted_frames(conn: sqlite3.Connection, scan_id: Optional[str]) -> int:
+    clause, args = _scan_filter(scan_id)
+    return conn.execute("SELECT COALESCE(SUM(frames), 0) FROM frame_minutes WHERE 1=1" + clause, args).fetchone()[0]
+
+
+def _iter_rows(cur: sqlite3.Cursor) -> Iterator[tuple]:
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def _select(conns: List[sqlite3.Connection], sql: str, args, newest_first: bool = False) -> Iterator[tuple]:
+    # Run the query on every partition in id order (connections are oldest first)
+    for conn in reversed(conns) if newest_first else conns:
+        yield from _iter_rows(conn.execute(sql, args))
+
+
+def _markdown(conns, summary, scan_id) -> Iterator[str]:
+    clause, args = _scan_filter(scan_id)
+    yield "# Vulnerability Test Report\n\n"
+    if summary["rows"]:
+        sev = ", ".join(f"{k}: {v}" for k, v in sorted(summary["findings_by_severity"].items())) or "none"
+        types = ", ".join(f"{k}: {v}" for k, v in sorted(summary["by_type"].items()))
+        yield f"\n## Summary\n\n- Rows: {summary['rows']} ({types})\n\n- Findings by severity: {sev}\n\n"
+        if summary.get("compacted_frames"):
+            yield f"- Compacted frames: {summary['compacted_frames']} (kept as per-ID/per-minute counts)\n\n"
+    # Findings summary
+    rows = _select(
+        conns, "SELECT timestamp, status, details FROM results WHERE test_type='finding'" + clause + " ORDER BY id DESC",
+        args, newest_first=True,
+    )
+    first = True
+    for ts, severity, details in rows:
+        if first:
+            yield "\n## Findings Summary\n\n"
+            first = False
+        yield f"- [{(severity or 'alert').upper()}] {ts} — {details}\n\n"
+    has_findings = not first
+    rows = _select(
+        conns, "SELECT id, timestamp, test_type, status, details FROM results WHERE test_type!='finding'" + clause, args
+    )
+    first = True
+    for row in rows:
+        first = False
+        yield f"- Test ID: {row[0]} | Timestamp: {row[1]} | Type: {row[2]} | Status: {row[3]} | Details: {row[4]}\n\n"
+        yield f"  Remediation: {REMEDIATION}\n\n"
+    if first and not has_findings:
+        yield "No results yet. Run a scan to populate data.\n"
+
+
+def _jsonl(conns, summary, scan_id) -> Iterator[str]:
+    clause, args = _scan_filter(scan_id)
+    yield json.dumps({"kind": "summary", "scan_id": scan_id, **summary}) + "\n"
+    rows = _select(
+        conns,
+        "SELECT id, timestamp, test_type, status, details, scan_id, can_id, severity, rule_id, ts "
+        "FROM results WHERE 1=1" + clause + " ORDER BY id",
+        args,
+    )
+    for r in rows:
+        yield json.dumps({
+            "kind": "finding" if r[2] == "finding" else "result",
+            "id": r[0], "timestamp": r[1], "type": r[2], "status": r[3], "details": r[4],
+            "scan_id": r[5], "can_id": hex(r[6]) if r[6] is not None else None,
+            "severity": r[7], "rule_id": r[8], "ts": r[9],
+        }) + "\n"
+
+
+def _html(conns, summary, scan_id) -> Iterator[str]:
+    clause, args = _scan_filter(scan_id)
+    esc = html.escape
+    yield (
+        "<!doctype html><html><head><meta charset='utf-8'/><title>Vulnerability Test Report</title>"
+        "<style>body{font-family:system-ui,sans-serif;padding:1.5rem}table{border-collapse:collapse}"
+        "td,th{border:1px solid #ddd;padding:.25rem .5rem;font-size:.85rem;vertical-align:top}</style>"
+        "</head><body><h1>Vulnerability Test Report</h1>"
+    )
+    if not summary["rows"]:
+        yield "<p>No results yet. Run a scan to populate data.</p></body></html>"
+        return
+    yield "<h2>Summary</h2><ul>"
+    yield f"<li>Rows: {summary['rows']}</li>"
+    for k, v in sorted(summary["by_type"].items()):
+        yield f"<li>{esc(str(k))}: {v}</li>"
+    for k, v in sorted(summary["findings_by_severity"].items()):
+        yield f"<li>Findings ({esc(str(k))}): {v}</li>"
+    if summary.get("compacted_frames"):
+        yield f"<li>Compacted frames: {summary['compacted_frames']}</li>"
+    yield "</ul>"
+    for title, cond, order in (("Findings", "test_type='finding'", " ORDER BY id DESC"), ("Results", "test_type!='finding'", "")):
+        rows = _select(
+            conns, f"SELECT id, timestamp, test_type, status, details FROM results WHERE {cond}" + clause + order, args,
+            newest_first=bool(order),
+        )
+        yield f"<h2>{title}</h2><table><tr><th>ID</th><th>Timestamp</th><th>Type</th><th>Status</th><th>Details</th></tr>"
+        for r in rows:
+            yield "<tr>" + "".join(f"<td>{esc(str(c))}</td>" for c in r) + "</tr>"
+        yield "</table>"
+    yield f"<p>Remediation: {esc(REMEDIATION)}</p></body></html>"
+
+
+_FORMATTERS = {"markdown": _markdown, "jsonl": _jsonl, "html": _html}
+
+# Per-row fragments are coalesced into chunks of about this many characters
+CHUNK_CHARS = 64 * 1024
+
+
+def _coalesce(parts: Iterator[str]) -> Iterator[str]:
+    buf, size = [], 0
+    for part in parts:
+        buf.append(part)
+        size += len(part)
+        if size >= CHUNK_CHARS:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def iter_report(db_path=None, fmt: str = "markdown", scan_id: Optional[str] = None) -> Iterator[str]:
+    """Yield the report in chunks, reading rows from a streaming cursor.
+
+    Memory stays flat regardless of table size; a per-scan summary is kept in a
+    small cache keyed by scan id and last row id so repeated requests only count
+    rows added since the previous one. Time partitions of ``db_path`` are read
+    in order as one table.
+    """
+    if fmt not in _FORMATTERS:
+        raise ValueError(f"Unsupported report format {fmt!r}; expected one of {', '.join(REPORT_FORMATS)}")
     if db_path is None:
         db_path = os.getenv("RESULTS_DB", "data/results.db")
-    report = ["# Vulnerability Test Report\n"]
-    if not os.path.exists(db_path):
-        report.append("No results yet. Run a scan to populate data.\n")
-        return "\n".join(report)
-    conn = sqlite3.connect(db_path)
-    try:
-        cursor = conn.cursor()
-        # Findings summary
-        cursor.execute("SELECT timestamp, status, details FROM results WHERE test_type='finding' ORDER BY id DESC")
-        findings = cursor.fetchall()
-        if findings:
-            report.append("\n## Findings Summary\n")
-            for ts, severity, details in findings:
-                report.append(f"- [{severity.upper()}] {ts} — {details}\n")
-
-        cursor.execute("SELECT * FROM results WHERE test_type!='finding'")
-        results = cursor.fetchall()
-        if not results and not findings:
-            report.append("No results yet. Run a scan to populate data.\n")
+    parts = list_partitions(db_path)
+    if not parts:
+        if fmt == "markdown":
+            yield "# Vulnerability Test Report\n\nNo results yet. Run a scan to populate data.\n"
+        elif fmt == "jsonl":
+            yield json.dumps({"kind": "summary", "scan_id": scan_id, **_Summary().to_dict()}) + "\n"
         else:
-            for row in results:
-                report.append(f"- Test ID: {row[0]} | Timestamp: {row[1]} | Type: {row[2]} | Status: {row[3]} | Details: {row[4]}\n")
-                report.append("  Remediation: Implement validation and encryption for CAN packets.\n")
-        return "\n".join(report)
+            yield from _html(None, _Summary().to_dict(), scan_id)
+        return
+    # Streaming responses may resume the generator on different worker threads
+    conns = []
+    try:
+        summaries, compacted = [], 0
+        for part in parts:
+            conn = sqlite3.connect(part.path, check_same_thread=False)
+            conns.append(conn)
+            ensure_schema(conn)
+            summaries.append(summarize(conn, part.path, scan_id))
+            compacted += _compacted_frames(conn, scan_id)
+        summary = _merge(summaries, compacted)
+        yield from _coalesce(_FORMATTERS[fmt](conns, summary, scan_id))
     finally:
-        conn.close()
+        for conn in conns:
+            conn.close()
+
+
+def generate_report(db_path=None, fmt: str = "markdown", scan_id: Optional[str] = None) -> str:
+    return "".join(iter_report(db_path, fmt=fmt, scan_id=scan_id))
@@ -0,0 +1,72 @@
+"""Results table schema and in-place migration of older databases.
+
+Besides the original ``timestamp``/``test_type``/``status``/``details`` columns,
+rows carry the fields the API filters on as real, indexed columns: ``scan_id``,
+``can_id``, ``severity``, ``rule_id`` and ``ts`` (event time, epoch seconds).
+``details`` holds the JSON-serialized event or finding.
+
+``frame_minutes`` holds captured frames after compaction (see ``partitions``):
+one row per minute of event time, scan and CAN ID with the frame count and
+first/last timestamp.
+"""
+import sqlite3
+
+COLUMNS = (
+    ("scan_id", "TEXT"),
+    ("can_id", "INTEGER"),
+    ("severity", "TEXT"),
+    ("rule_id", "TEXT"),
+    ("ts", "REAL"),
+)
+
+# Composite (col, id) indexes serve both the filter and keyset pagination on id.
+# Captured frames are most of the rows, so only scan_id is indexed for them:
+# can_id/severity/rule_id are indexed for findings only (partial indexes cost
+# nothing on the per-frame insert path), and test_type/time filters walk the
+# id order, which newest-first pages read anyway.
+INDEXES = (
+    ("idx_results_scan", "scan_id, id", None),
+    ("idx_results_findings", "id", "test_type = 'finding'"),
+    ("idx_results_finding_can", "can_id, id", "test_type = 'finding'"),
+    ("idx_results_severity", "severity, id", "severity IS NOT NULL"),
+    ("idx_results_rule", "rule_id, id", "rule_id IS NOT NULL"),
+)
+
+
+# Raw rows that compaction folds into frame_minutes
+FRAME_ROWS = "test_type = 'sniff' AND can_id IS NOT NULL"
+
+# Event time of a row in epoch seconds. The logger always fills ts; rows from
+# older writers only have the local-time ISO ``timestamp``, converted to UTC
+EVENT_TS = "COALESCE(ts, CAST(strftime('%s', timestamp, 'utc') AS REAL))"
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            test_type TEXT,
+            status TEXT,
+            details TEXT
+        )
+    """)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+    for name, decl in COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE results ADD COLUMN {name} {decl}")
+    for name, cols, where in INDEXES:
+        partial = f" WHERE {where}" if where else ""
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON results ({cols}){partial}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS frame_minutes (
+            minute INTEGER,
+            scan_id TEXT,
+            can_id INTEGER,
+            frames INTEGER,
+            first_ts REAL,
+            last_ts REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_frame_minutes_minute ON frame_minutes (minute)")
+    conn.commit()
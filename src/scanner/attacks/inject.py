@@ -1,19 +1,227 @@
-import scapy.all as scapy
+"""Frame injection: lazy frame generators and a paced, batched sender.
 
-def inject_can_packet(interface):
+Generators (``id_sweep``, ``payload_mutations``, ``replay``) yield ``CanFrame``
+objects one at a time, so a campaign over millions of frames never exists as
+a list. ``InjectionEngine`` keeps one raw socket open for its lifetime
+(``open_bulk_socket``: ``sendmmsg`` through the compiled emulator when built)
+and sends in batches paced to a target rate: each batch waits until
+``start + frames_so_far / rate``, sleeping for most of the gap and spinning for
+the last fraction of a millisecond. Frames the interface refuses (TX queue
+full) are counted as dropped, not retried.
+
+Sent frames go to an ``InjectionRecord`` so detection can tell injected
+traffic apart from what the bus produced on its own.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from ..frame import CanFrame
+from .socketcan import open_bulk_socket, pack_frames
+
+# Below this much remaining wait, spin instead of sleeping
+_SPIN = 0.0005
+
+
+def id_sweep(lo: int, hi: int, data: bytes = b"", step: int = 1, extended: Optional[bool] = None) -> Iterator[CanFrame]:
+    """One frame per CAN ID in ``[lo, hi]``."""
+    for can_id in range(lo, hi + 1, step):
+        yield CanFrame(can_id, data, extended=extended)
+
+
+def payload_mutations(can_id: int, base: bytes = b"\x00" * 8, mode: str = "random",
+                      count: Optional[int] = None, seed: Optional[int] = None) -> Iterator[CanFrame]:
+    """Mutated payloads for one ID.
+
+    ``random`` draws fresh bytes of ``len(base)``, ``bitflip`` flips each bit
+    of ``base`` in turn (cycling), ``increment`` treats ``base`` as a
+    big-endian counter. ``count=None`` never stops.
+    """
+    if mode not in ("random", "bitflip", "increment"):
+        raise ValueError(f"Unknown mutation mode {mode!r}")
+    rng = random.Random(seed)
+    size = len(base)
+    value = int.from_bytes(base, "big") if size else 0
+    n = 0
+    while count is None or n < count:
+        if mode == "random":
+            data = rng.randbytes(size)
+        elif mode == "bitflip":
+            bit = n % (size * 8) if size else 0
+            data = bytearray(base)
+            if size:
+                data[bit // 8] ^= 0x80 >> (bit % 8)
+            data = bytes(data)
+        else:
+            data = ((value + n) % (1 << (8 * size))).to_bytes(size, "big") if size else b""
+        yield CanFrame(can_id, data)
+        n += 1
+
+
+def replay(frames: Iterable[CanFrame], loops: Optional[int] = 1) -> Iterator[CanFrame]:
+    """Re-send a recorded sequence ``loops`` times (``None``: forever).
+
+    The first pass is streamed; later passes reuse a copy kept from it.
+    """
+    kept = []
+    for frame in frames:
+        kept.append(frame)
+        yield CanFrame(frame.can_id, frame.data, dlc=frame.dlc, extended=frame.extended)
+    n = 1
+    while kept and (loops is None or n < loops):
+        for frame in kept:
+            yield CanFrame(frame.can_id, frame.data, dlc=frame.dlc, extended=frame.extended)
+        n += 1
+
+
+class InjectionRecord:
+    """Recently injected frames keyed by (can_id, payload), bounded LRU.
+
+    ``matches(frame)`` tells whether a captured frame was (very likely) one
+    of ours: same ID and payload, seen within ``window`` seconds of sending.
+    """
+
+    def __init__(self, max_entries: int = 65536, window: float = 2.0):
+        self.max_entries = max_entries
+        self.window = window
+        self.total = 0
+        self._seen: "OrderedDict[Tuple[int, bytes], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, frames: Iterable[CanFrame], ts: Optional[float] = None):
+        now = time.time() if ts is None else ts
+        seen = self._seen
+        with self._lock:
+            for f in frames:
+                key = (f.can_id, f.data)
+                seen[key] = now
+                seen.move_to_end(key)
+                self.total += 1
+            while len(seen) > self.max_entries:
+                seen.popitem(last=False)
+
+    def matches(self, frame: CanFrame) -> bool:
+        sent = self._seen.get((frame.can_id, frame.data))
+        if sent is None:
+            return False
+        if frame.timestamp is None:
+            return True
+        return -self.window <= frame.timestamp - sent <= self.window
+
+
+def _sleep_until(deadline: float):
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > _SPIN:
+            time.sleep(remaining - _SPIN)
+
+
+class InjectionEngine:
+    """Paced, batched injection over one reused raw socket.
+
+    ``rate`` is the target in frames per second (``None`` sends as fast as the
+    socket accepts). At low rates batches shrink so pacing stays within a few
+    milliseconds. ``run()`` returns the achieved statistics; ``stop()`` ends a
+    run from another thread.
+    """
+
+    def __init__(self, interface: str, rate: Optional[float] = None, batch_size: int = 64,
+                 record: Optional[InjectionRecord] = None, sock=None):
+        self.interface = interface
+        self.rate = rate
+        self.batch_size = max(1, int(batch_size))
+        self.record = InjectionRecord() if record is None else record
+        self._sock = sock
+        self._owns_sock = sock is None
+        self._stop = threading.Event()
+        self.last_frame: Optional[CanFrame] = None
+
+    def open(self) -> "InjectionEngine":
+        if self._sock is None:
+            self._sock = open_bulk_socket(self.interface)
+        return self
+
+    def close(self):
+        if self._sock is not None and self._owns_sock:
+            close = getattr(self._sock, "close", None)
+            if close is not None:
+                close()
+            self._sock = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _batch(self) -> int:
+        if not self.rate:
+            return self.batch_size
+        # About 5 ms worth of frames per batch, at least one
+        return max(1, min(self.batch_size, int(self.rate * 0.005)))
+
+    def run(self, frames: Iterable[CanFrame], count: Optional[int] = None,
+            duration: Optional[float] = None) -> Dict[str, float]:
+        self.open()
+        self._stop.clear()
+        it = iter(frames) if count is None else islice(frames, count)
+        batch_n = self._batch()
+        sent = dropped = attempted = 0
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            batch = list(islice(it, batch_n))
+            if not batch:
+                break
+            if self.rate:
+                _sleep_until(start + attempted / self.rate)
+            # Recorded before sending: a capture on the same bus must never
+            # see one of our frames ahead of its record
+            self.record.add(batch)
+            n = self._sock.send_frames(pack_frames(batch))
+            if n:
+                self.last_frame = batch[n - 1]
+            attempted += len(batch)
+            sent += n
+            dropped += len(batch) - n
+            if duration is not None and time.perf_counter() - start >= duration:
+                break
+        elapsed = time.perf_counter() - start
+        return {
+            "sent": sent,
+            "dropped": dropped,
+            "attempted": attempted,
+            "elapsed": round(elapsed, 6),
+            "target_rate": self.rate,
+            "achieved_rate": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    def __enter__(self) -> "InjectionEngine":
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def inject_can_packet(interface, frames=None, rate=None, record=None):
     try:
-        # Some environments may not have CAN layers; construct defensively
-        CAN = getattr(scapy, "CAN", None)
-        if CAN is None:
-            raise RuntimeError("Scapy CAN layer not available")
-        packet = CAN(identifier=0x123, data=b"\x01\x02\x03\x04")
-        scapy.sendp(packet, iface=interface, verbose=False)
+        if frames is None:
+            frames = [CanFrame(0x123, b"\x01\x02\x03\x04")]
+        with InjectionEngine(interface, rate=rate, record=record) as engine:
+            stats = engine.run(frames)
+        frame = engine.last_frame
+        if not stats["sent"]:
+            return [{"type": "inject", "status": "failed", "error": "No frames accepted by the interface", "stats": stats}]
+        frame.timestamp = time.time()
         return [{
             "type": "inject",
             "status": "success",
-            "packet": str(packet),
-            "can_id": 0x123,
-            "data_hex": "01020304",
+            "frame": frame,
+            "stats": stats,
         }]
     except Exception as e:
         return [{"type": "inject", "status": "failed", "error": str(e)}]
@@ -1,28 +1,288 @@
+import queue
+import threading
+import time
+import weakref
 import scapy.all as scapy
+from ..frame import CanFrame
+from ..metrics import Sample, counter, register_collector
+from .socketcan import iter_record_frames, open_bulk_socket
 
+# How often a waiting consumer re-checks whether the sniffer has stopped
+_POLL = 0.25
 
-def sniff_can_packets(interface, count=10, timeout=3):
+FRAMES_CAPTURED = counter("can_frames_captured_total", "CAN frames received by sniffers", ("interface",))
+FRAMES_DROPPED = counter("can_frames_dropped_total", "CAN frames dropped because the consumer was a full queue behind",
+                         ("interface",))
+
+_LIVE_SNIFFERS = weakref.WeakSet()
+
+
+@register_collector
+def _sniffer_samples():
+    depth = {}
+    for sniffer in list(_LIVE_SNIFFERS):
+        key = (sniffer.interface,)
+        depth[key] = depth.get(key, 0) + sniffer._queue.qsize()
+    return [Sample("can_capture_queue_depth", "gauge", "Captured frames waiting for the consumer", ("interface",), depth)]
+
+
+def _can_layer():
+    # scapy.all only exposes CAN once the layer is loaded
+    CAN = getattr(scapy, "CAN", None)
+    if CAN is None:
+        try:
+            from scapy.layers.can import CAN
+        except Exception:
+            CAN = None
+    return CAN
+
+
+def _packet_event(pkt, CAN):
+    # Parse the CAN layer once here; downstream code reads the frame fields
+    frame = None
     try:
-        packets = scapy.sniff(iface=interface, filter="can", count=count, timeout=timeout)
-        results = []
-        for pkt in packets:
-            entry = {"type": "sniff", "status": "detected", "packet": str(pkt)}
-            # Try to enrich with CAN fields if present
+        if CAN is not None and pkt.haslayer(CAN):
+            frame = CanFrame.from_scapy(pkt, CAN)
+    except Exception:
+        frame = None
+    if frame is not None:
+        return {"type": "sniff", "status": "detected", "frame": frame}
+    return {"type": "sniff", "status": "detected", "packet": str(pkt)}
+
+
+# Frames taken per bulk receive call on the raw socket path
+_BULK = 256
+
+
+class _RawReader:
+    """Reader thread over a filtered raw socket, driven like ``AsyncSniffer``.
+
+    Uses the compiled ``CanEmulator`` (``recvmmsg``, GIL released) when built.
+    """
+
+    def __init__(self, interface, filters, prn, count=0, started_callback=None):
+        self.interface = interface
+        self.filters = filters
+        self.prn = prn
+        self.count = count
+        self.started_callback = started_callback
+        self.exception = None
+        self._halt = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="can-raw-reader", daemon=True)
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        try:
+            sock = open_bulk_socket(self.interface, self.filters)
+            if self.started_callback is not None:
+                self.started_callback()
             try:
-                CAN = getattr(scapy, "CAN", None)
-                if CAN is not None and pkt.haslayer(CAN):
-                    layer = pkt[CAN]
-                    entry.update({
-                        "can_id": int(layer.identifier),
-                        "dlc": int(layer.length) if hasattr(layer, "length") else None,
-                        "data_hex": getattr(layer, "data", b"").hex() if hasattr(layer, "data") else None,
-                        "timestamp": getattr(pkt, "time", None),
-                    })
+                n = 0
+                while not self._halt.is_set():
+                    want = min(_BULK, self.count - n) if self.count else _BULK
+                    for frame in iter_record_frames(sock.receive_frames(want, _POLL)):
+                        self.prn(frame)
+                        n += 1
+                    if self.count and n >= self.count:
+                        break
+            finally:
+                close = getattr(sock, "close", None)
+                if close is not None:
+                    close()
+        except Exception as e:
+            self.exception = e
+
+    def stop(self, join=True):
+        self._halt.set()
+        if join:
+            self.thread.join()
+
+
+class CanSniffer:
+    """Continuous capture on ``interface`` with start/stop control.
+
+    Packets are parsed in scapy's ``AsyncSniffer`` callback (``store=False``, so
+    scapy keeps nothing) and handed over through a queue bounded by
+    ``max_queue``; frames arriving while the consumer is that far behind are
+    counted in ``dropped`` instead of buffered. ``count``/``timeout`` bound the
+    capture like ``scapy.sniff``; leave both ``None`` to capture until
+    ``stop()``. Iterate the sniffer for single events or use ``chunks()`` to
+    rotate them into bounded lists.
+
+    With ``filters`` (``(can_id, mask)`` pairs, see ``socketcan.compile_filters``)
+    frames are read from a raw SocketCAN socket with those filters installed
+    in the kernel instead of through scapy, so unmatched frames never reach
+    Python.
+    """
+
+    def __init__(self, interface, count=None, timeout=None, max_queue=10000, bpf_filter="can", filters=None):
+        self.interface = interface
+        self.count = count
+        self.timeout = timeout
+        self.bpf_filter = bpf_filter
+        self.filters = filters
+        self.received = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._sniffer = None
+        self._listening = threading.Event()
+        self._deadline = None
+        self._CAN = _can_layer()
+        self._captured = FRAMES_CAPTURED.labels(interface)
+        self._dropped = FRAMES_DROPPED.labels(interface)
+        _LIVE_SNIFFERS.add(self)
+
+    def start(self):
+        if self._sniffer is not None or self._stopped.is_set():
+            return self
+        if self.filters is not None:
+            self._sniffer = _RawReader(self.interface, self.filters, self._on_frame, count=self.count or 0,
+                                       started_callback=self._listening.set)
+        else:
+            self._sniffer = scapy.AsyncSniffer(
+                iface=self.interface,
+                filter=self.bpf_filter,
+                prn=self._on_packet,
+                store=False,
+                count=self.count or 0,
+                started_callback=self._listening.set,
+            )
+        # AsyncSniffer has no timeout of its own; running checks the deadline
+        if self.timeout is not None:
+            self._deadline = time.monotonic() + self.timeout
+        self._sniffer.start()
+        return self
+
+    def wait_listening(self, timeout=None):
+        """Block until the capture socket is open; False if capture ended or timed out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._listening.wait(0.01):
+            if not self.running or (deadline is not None and time.monotonic() >= deadline):
+                return self._listening.is_set()
+        return True
+
+    def _on_packet(self, pkt):
+        self.received += 1
+        self._captured.inc()
+        try:
+            self._queue.put_nowait(_packet_event(pkt, self._CAN))
+        except queue.Full:
+            self.dropped += 1
+            self._dropped.inc()
+
+    def _on_frame(self, frame):
+        self.received += 1
+        self._captured.inc()
+        try:
+            self._queue.put_nowait({"type": "sniff", "status": "detected", "frame": frame})
+        except queue.Full:
+            self.dropped += 1
+            self._dropped.inc()
+
+    def _halt(self):
+        sniffer = self._sniffer
+        if sniffer is not None and sniffer.running:
+            try:
+                sniffer.stop(join=False)
             except Exception:
                 pass
-            results.append(entry)
-        if not results:
-            return [{"type": "sniff", "status": "no_traffic", "details": f"No CAN traffic observed on {interface}"}]
-        return results
+
+    def stop(self):
+        """Stop capturing; events already queued are still delivered."""
+        self._stopped.set()
+        self._halt()
+
+    @property
+    def running(self):
+        sniffer = self._sniffer
+        if sniffer is None or self._stopped.is_set():
+            return False
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self._halt()
+            return False
+        thread = getattr(sniffer, "thread", None)
+        return thread is not None and thread.is_alive()
+
+    def __iter__(self):
+        self.start()
+        q = self._queue
+        while True:
+            try:
+                yield q.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+            # Checked per frame too: a busy bus never leaves the queue empty
+            if not self.running:
+                break
+        # Drain what arrived before the sniffer stopped
+        while True:
+            try:
+                yield q.get_nowait()
+            except queue.Empty:
+                break
+        error = getattr(self._sniffer, "exception", None)
+        if error is not None and not self._stopped.is_set():
+            raise error
+
+    def chunks(self, max_frames=1000, max_seconds=1.0):
+        """Yield lists of at most ``max_frames`` events, rotated at least every ``max_seconds``."""
+        self.start()
+        q = self._queue
+        chunk = []
+        deadline = time.monotonic() + max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                chunk.append(q.get(timeout=max(0.0, min(remaining, _POLL))))
+            except queue.Empty:
+                pass
+            if not self.running and q.empty():
+                break
+            if len(chunk) >= max_frames or time.monotonic() >= deadline:
+                if chunk:
+                    yield chunk
+                chunk = []
+                deadline = time.monotonic() + max_seconds
+        if chunk:
+            yield chunk
+        error = getattr(self._sniffer, "exception", None)
+        if error is not None and not self._stopped.is_set():
+            raise error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def iter_can_packets(interface, count=None, timeout=None, sniffer=None, filters=None):
+    """Yield sniff events incrementally; ``sniffer`` lets the caller stop() it.
+
+    Emits a single ``no_traffic`` entry when nothing was captured and a
+    ``failed`` entry if capture could not run, like ``sniff_can_packets``.
+    """
+    if sniffer is None:
+        sniffer = CanSniffer(interface, count=count, timeout=timeout, filters=filters)
+    seen = False
+    try:
+        with sniffer:
+            for event in sniffer:
+                seen = True
+                yield event
     except Exception as e:
-        return [{"type": "sniff", "status": "failed", "error": str(e)}]
+        yield {"type": "sniff", "status": "failed", "error": str(e)}
+        return
+    if not seen:
+        yield {"type": "sniff", "status": "no_traffic", "details": f"No CAN traffic observed on {interface}"}
+
+
+def sniff_can_packets(interface, count=10, timeout=3, filters=None):
+    return list(iter_can_packets(interface, count=count, timeout=timeout, filters=filters))
@@ -0,0 +1,273 @@
+"""Raw SocketCAN sockets with kernel-side ID/mask filtering.
+
+A ``CAN_RAW`` socket only wakes userspace for frames that match at least one
+of its ``CAN_RAW_FILTER`` entries (``received_id & mask == filter_id & mask``),
+so on a busy bus where only a few dozen IDs matter most frames never reach
+Python. ``compile_filters`` turns the same entries the ID policy accepts
+(``0x123``, ``0x100-0x1FF``, ``0x700/0x7F0``, see ``detection.policy``) into
+kernel filters; ranges are split into aligned power-of-two blocks.
+
+Bulk I/O moves whole batches per call: ``receive_frames``/``receive_into`` fill
+rows of ``RECORD_SIZE`` bytes (``struct can_frame`` plus a float64 receive
+time) that NumPy views in place (``records_array``), and ``send_frames``
+takes contiguous ``struct can_frame`` rows (see ``pack_frames``). The compiled
+``can_emulator.CanEmulator`` implements the same calls with ``recvmmsg``/
+``sendmmsg`` and the GIL released; ``open_bulk_socket`` prefers it and falls
+back to ``RawCanSocket``.
+
+Linux only; elsewhere ``RawCanSocket`` raises on construction.
+"""
+import errno
+import select
+import socket
+import struct
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from ..frame import CAN_EFF_MASK, CAN_SFF_MASK, CanFrame
+from ..detection.policy import parse_id_entry
+
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_INV_FILTER = 0x20000000
+
+# Kernel limit on the number of filters per socket (CAN_RAW_FILTER_MAX)
+CAN_RAW_FILTER_MAX = 512
+
+# struct can_frame: can_id, can_dlc, 3 pad bytes, data[8]
+CAN_FRAME_FMT = "=IB3x8s"
+CAN_FRAME_SIZE = struct.calcsize(CAN_FRAME_FMT)
+
+# Bulk receive rows: struct can_frame followed by the receive time
+RECORD_FMT = CAN_FRAME_FMT + "d"
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+
+_SOL_CAN_RAW = getattr(socket, "SOL_CAN_RAW", 101)
+_CAN_RAW_FILTER = getattr(socket, "CAN_RAW_FILTER", 1)
+
+CanFilter = Tuple[int, int]
+
+
+def _aligned_blocks(lo: int, hi: int, width_mask: int) -> List[CanFilter]:
+    # Cover [lo, hi] with blocks of 2**k IDs starting at multiples of 2**k
+    out = []
+    while lo <= hi:
+        size = lo & -lo if lo else width_mask + 1
+        while size > hi - lo + 1:
+            size >>= 1
+        out.append((lo, ~(size - 1) & width_mask))
+        lo += size
+    return out
+
+
+def compile_filters(entries: Optional[Iterable]) -> List[CanFilter]:
+    """Translate policy-style ID entries into ``(can_id, can_mask)`` kernel filters.
+
+    Standard and extended IDs are told apart with ``CAN_EFF_FLAG`` in both id
+    and mask; ``id/mask`` entries leave the flag out of the mask and match
+    either frame format, like the policy does. Malformed entries are skipped.
+    """
+    filters: List[CanFilter] = []
+    for entry in entries or []:
+        parsed = parse_id_entry(entry)
+        if parsed is None:
+            continue
+        kind, a, b = parsed
+        if kind == "mask":
+            filters.append((a, b))
+            continue
+        lo, hi = max(a, 0), min(b, CAN_EFF_MASK)
+        if lo <= CAN_SFF_MASK:
+            for can_id, mask in _aligned_blocks(lo, min(hi, CAN_SFF_MASK), CAN_SFF_MASK):
+                filters.append((can_id, mask | CAN_EFF_FLAG))
+        if hi > CAN_SFF_MASK:
+            for can_id, mask in _aligned_blocks(max(lo, CAN_SFF_MASK + 1), hi, CAN_EFF_MASK):
+                filters.append((can_id | CAN_EFF_FLAG, mask | CAN_EFF_FLAG))
+    return filters
+
+
+def pack_filters(filters: Iterable[CanFilter]) -> bytes:
+    """``struct can_filter[]`` as passed to ``setsockopt(CAN_RAW_FILTER)``."""
+    flat = []
+    for can_id, mask in filters:
+        flat.extend((can_id & 0xFFFFFFFF, mask & 0xFFFFFFFF))
+    return struct.pack(f"={len(flat)}I", *flat)
+
+
+def filter_matches(filters: Iterable[CanFilter], can_id: int, extended: Optional[bool] = None) -> bool:
+    """Userspace equivalent of the kernel check, for tests and fallbacks."""
+    if extended is None:
+        extended = can_id > CAN_SFF_MASK
+    raw = can_id | CAN_EFF_FLAG if extended else can_id
+    for f_id, f_mask in filters:
+        if f_id & CAN_INV_FILTER:
+            if (raw & f_mask) != (f_id & ~CAN_INV_FILTER & f_mask):
+                return True
+        elif (raw & f_mask) == (f_id & f_mask):
+            return True
+    return False
+
+
+class RawCanSocket:
+    """``AF_CAN``/``CAN_RAW`` socket bound to ``interface``.
+
+    ``filters`` (``(can_id, mask)`` pairs) are installed before binding, so no
+    unmatched frame is ever queued for the socket; ``None`` receives every
+    frame and an empty list receives none. Lists longer than the kernel limit
+    fall back to receiving everything.
+    """
+
+    def __init__(self, interface: str, filters: Optional[List[CanFilter]] = None, timeout: Optional[float] = None):
+        self.interface = interface
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        try:
+            if filters is not None:
+                self.set_filters(filters)
+            self.sock.bind((interface,))
+            self.sock.settimeout(timeout)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def set_filters(self, filters: Optional[List[CanFilter]]):
+        """Replace the socket's filters; takes effect for the next frame."""
+        if filters is None or len(filters) > CAN_RAW_FILTER_MAX:
+            filters = [(0, 0)]
+        self.sock.setsockopt(_SOL_CAN_RAW, _CAN_RAW_FILTER, pack_filters(filters))
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def recv_frame(self) -> CanFrame:
+        """Block for the next frame (``socket.timeout`` after ``timeout`` seconds)."""
+        raw = self.sock.recv(CAN_FRAME_SIZE)
+        ts = time.time()
+        can_id, dlc, data = struct.unpack(CAN_FRAME_FMT, raw)
+        extended = bool(can_id & CAN_EFF_FLAG)
+        can_id &= CAN_EFF_MASK if extended else CAN_SFF_MASK
+        return CanFrame(can_id, data[:min(dlc, 8)], timestamp=ts, dlc=dlc, extended=extended)
+
+    def send_frame(self, frame: CanFrame) -> bool:
+        return self.sock.send(pack_frames([frame])) == CAN_FRAME_SIZE
+
+    def receive_into(self, out, timeout: Optional[float] = 1.0) -> int:
+        """Fill ``out`` with ``RECORD_SIZE``-byte rows; returns the number received.
+
+        Waits up to ``timeout`` seconds (``None``: forever) for the first frame,
+        then takes only what is already queued.
+        """
+        view = memoryview(out).cast("B")
+        n = len(view) // RECORD_SIZE
+        if not n or not select.select([self.sock], [], [], timeout)[0]:
+            return 0
+        prev = self.sock.gettimeout()
+        self.sock.settimeout(0.0)
+        count = 0
+        try:
+            while count < n:
+                off = count * RECORD_SIZE
+                try:
+                    self.sock.recv_into(view[off:off + CAN_FRAME_SIZE], CAN_FRAME_SIZE)
+                except (BlockingIOError, InterruptedError):
+                    break
+                struct.pack_into("=d", view, off + CAN_FRAME_SIZE, time.time())
+                count += 1
+        finally:
+            self.sock.settimeout(prev)
+        return count
+
+    def receive_frames(self, n: int, timeout: Optional[float] = 1.0) -> memoryview:
+        buf = bytearray(n * RECORD_SIZE)
+        count = self.receive_into(buf, timeout)
+        return memoryview(buf)[:count * RECORD_SIZE]
+
+    def send_frames(self, batch) -> int:
+        """Send contiguous ``struct can_frame`` rows; stops early if the TX queue is full."""
+        view = memoryview(batch).cast("B")
+        sent = 0
+        for off in range(0, len(view) - len(view) % CAN_FRAME_SIZE, CAN_FRAME_SIZE):
+            try:
+                self.sock.send(view[off:off + CAN_FRAME_SIZE])
+            except (BlockingIOError, socket.timeout):
+                break
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    break
+                raise
+            sent += 1
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self) -> "RawCanSocket":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pack_frames(frames: Iterable[CanFrame]) -> bytes:
+    """Contiguous ``struct can_frame`` rows for ``send_frames``."""
+    out = bytearray()
+    pack = struct.Struct(CAN_FRAME_FMT).pack
+    for f in frames:
+        can_id = f.can_id | CAN_EFF_FLAG if f.extended else f.can_id
+        out += pack(can_id, min(f.dlc, 8), f.data[:8])
+    return bytes(out)
+
+
+def _record_dtype():
+    import numpy as np
+
+    return np.dtype([
+        ("can_id", "<u4"),
+        ("dlc", "u1"),
+        ("pad", "V3"),
+        ("data", "u1", (8,)),
+        ("timestamp", "<f8"),
+    ])
+
+
+def records_array(buf):
+    """Zero-copy NumPy view of received rows (fields can_id, dlc, data, timestamp)."""
+    import numpy as np
+
+    return np.frombuffer(buf, dtype=_record_dtype())
+
+
+def records_to_batch(buf):
+    """Received rows as a ``detection.batch.FrameBatch`` with flags stripped from the IDs."""
+    from ..detection.batch import FrameBatch
+
+    rec = records_array(buf)
+    raw = rec["can_id"]
+    ids = raw & CAN_EFF_MASK
+    std = (raw & CAN_EFF_FLAG) == 0
+    ids[std] &= CAN_SFF_MASK
+    return FrameBatch(ids, rec["timestamp"], rec["dlc"], rec["data"])
+
+
+def iter_record_frames(buf):
+    """Yield ``CanFrame`` objects from received rows."""
+    for can_id, dlc, data, ts in struct.iter_unpack(RECORD_FMT, buf):
+        extended = bool(can_id & CAN_EFF_FLAG)
+        can_id &= CAN_EFF_MASK if extended else CAN_SFF_MASK
+        yield CanFrame(can_id, data[:min(dlc, 8)], timestamp=ts, dlc=dlc, extended=extended)
+
+
+def open_bulk_socket(interface: str, filters: Optional[List[CanFilter]] = None, timeout: Optional[float] = None):
+    """Compiled ``CanEmulator`` when the extension is built, else ``RawCanSocket``.
+
+    Both provide ``receive_frames``, ``receive_into``, ``send_frames`` and
+    ``set_filters`` over the same row layouts.
+    """
+    try:
+        import can_emulator
+    except ImportError:
+        can_emulator = None
+    if can_emulator is not None:
+        # None receives every frame and [] none, in both implementations
+        return can_emulator.CanEmulator(interface, filters)
+    return RawCanSocket(interface, filters, timeout=timeout)
@@ -0,0 +1,239 @@
+"""Share one live feed between any number of asyncio subscribers.
+
+A ``BroadcastHub`` keeps at most one running feed per key (e.g. per interface
+and scan parameters). The feed is an async iterator of ``(coalesce_key,
+message)`` pairs; messages are shared, not copied, so one that is serialized
+(or caches its encodings, see ``wire.WireEvent``) is encoded once no matter
+how many clients watch it. The first subscriber starts the feed, later ones join
+it, and the feed is cancelled when the last one leaves.
+
+The feed never waits for subscribers. Each ``Subscriber`` has its own bounded
+queue; when a slow client's queue is full the oldest pending message is
+dropped (``dropped`` counts them). With ``overflow="coalesce"`` (the default)
+a message whose coalesce key is already pending replaces it in place first,
+so a lagging client gets the latest state of a finding rather than every
+intermediate rollup.
+
+The first message of a feed (its start event) is replayed to subscribers
+that join later.
+
+Delivery lag (time a message waited in a subscriber's queue), drops and
+coalesced updates are exported as metrics, and so are the current queue
+depths of every live hub.
+"""
+import asyncio
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import Sample, counter, histogram, register_collector
+
+# (coalesce key or None, message)
+Message = Tuple[Optional[Hashable], Any]
+
+OVERFLOW_POLICIES = ("coalesce", "drop_oldest")
+
+STREAM_LAG = histogram("stream_delivery_lag_seconds", "Time a live message waited in a subscriber queue")
+STREAM_DROPPED = counter("stream_messages_dropped_total", "Live messages dropped for slow subscribers")
+STREAM_COALESCED = counter("stream_messages_coalesced_total", "Pending live messages replaced by a newer update")
+STREAM_SENT = counter("stream_messages_published_total", "Messages published by live feeds")
+
+_HUBS: "weakref.WeakSet[BroadcastHub]" = weakref.WeakSet()
+
+
+@register_collector
+def _hub_samples() -> List[Sample]:
+    subscribers = deepest = queued = 0
+    for hub in list(_HUBS):
+        for channel in list(hub._channels.values()):
+            for sub in list(channel.subscribers):
+                subscribers += 1
+                queued += len(sub)
+                deepest = max(deepest, len(sub))
+    return [
+        Sample("stream_subscribers", "gauge", "Connected live subscribers", values={(): subscribers}),
+        Sample("stream_queued_messages", "gauge", "Messages waiting in all subscriber queues", values={(): queued}),
+        Sample("stream_max_subscriber_queue", "gauge", "Deepest subscriber queue (messages behind)",
+               values={(): deepest}),
+    ]
+
+
+class Subscriber:
+    """One client's bounded queue; iterate it with ``async for`` to get messages."""
+
+    def __init__(self, maxsize: int = 1024, overflow: str = "coalesce"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.channel: Optional["Channel"] = None
+        # Entries are [key, data, queued_at] lists so coalescing can replace data in place
+        self._items: "deque[List[Any]]" = deque()
+        self._pending: Dict[Hashable, List[Any]] = {}
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def offer(self, message: Message):
+        """Queue a message without waiting; never blocks the feed."""
+        if self._closed:
+            return
+        key, data = message
+        if key is not None and self.overflow == "coalesce":
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = data
+                self.coalesced += 1
+                STREAM_COALESCED.inc()
+                return
+        if len(self._items) >= self.maxsize:
+            self._forget(self._items.popleft())
+            self.dropped += 1
+            STREAM_DROPPED.inc()
+        entry = [key, data, time.monotonic()]
+        self._items.append(entry)
+        if key is not None and self.overflow == "coalesce":
+            self._pending[key] = entry
+        self._ready.set()
+
+    def _forget(self, entry: List[Any]):
+        if entry[0] is not None and self._pending.get(entry[0]) is entry:
+            del self._pending[entry[0]]
+
+    def close(self):
+        """End of stream: iteration stops once the queued messages are consumed."""
+        self._closed = True
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._items:
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        entry = self._items.popleft()
+        self._forget(entry)
+        self.delivered += 1
+        STREAM_LAG.observe(time.monotonic() - entry[2])
+        return entry[1]
+
+    def drain(self, max_items: int) -> List[Any]:
+        """Take up to ``max_items`` already queued messages without waiting."""
+        out = []
+        items = self._items
+        now = time.monotonic()
+        while items and len(out) < max_items:
+            entry = items.popleft()
+            self._forget(entry)
+            out.append(entry[1])
+            STREAM_LAG.observe(now - entry[2])
+        self.delivered += len(out)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._items), "delivered": self.delivered, "dropped": self.dropped,
+                "coalesced": self.coalesced, "overflow": self.overflow}
+
+
+class Channel:
+    """One running feed and its subscribers."""
+
+    def __init__(self, key: Hashable, feed: AsyncIterator[Message], on_end: Callable[["Channel"], None]):
+        self.key = key
+        self.subscribers: List[Subscriber] = []
+        self.sent = 0
+        self._header: Optional[Message] = None
+        self._feed = feed
+        self._on_end = on_end
+        self._task = asyncio.ensure_future(self._pump())
+
+    @property
+    def done(self) -> bool:
+        return self._task.done()
+
+    def add(self, sub: Subscriber):
+        sub.channel = self
+        if self._header is not None:
+            sub.offer(self._header)
+        self.subscribers.append(sub)
+
+    def remove(self, sub: Subscriber):
+        if sub in self.subscribers:
+            self.subscribers.remove(sub)
+        sub.close()
+
+    async def _pump(self):
+        try:
+            async for message in self._feed:
+                if self._header is None:
+                    self._header = message
+                self.sent += 1
+                STREAM_SENT.inc()
+                for sub in self.subscribers:
+                    sub.offer(message)
+        finally:
+            self._on_end(self)
+            for sub in self.subscribers:
+                sub.close()
+            aclose = getattr(self._feed, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+    def stop(self):
+        # Cancelling the pump closes the feed (and whatever capture it runs)
+        if not self._task.done():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"key": self.key, "sent": self.sent, "subscribers": [s.stats() for s in self.subscribers]}
+
+
+class BroadcastHub:
+    """Registry of shared feeds keyed by what they capture.
+
+    ``subscribe(key, feed_factory)`` joins the running feed for ``key`` or
+    starts ``feed_factory()`` if there is none; always pair it with
+    ``unsubscribe(sub)``. Both must be called on the event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, overflow: str = "coalesce"):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._channels: Dict[Hashable, Channel] = {}
+        _HUBS.add(self)
+
+    def subscribe(self, key: Hashable, feed_factory: Callable[[], AsyncIterator[Message]],
+                  maxsize: Optional[int] = None, overflow: Optional[str] = None) -> Subscriber:
+        sub = Subscriber(self.maxsize if maxsize is None else maxsize, overflow or self.overflow)
+        channel = self._channels.get(key)
+        if channel is None or channel.done:
+            channel = self._channels[key] = Channel(key, feed_factory(), self._ended)
+        channel.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        channel = sub.channel
+        if channel is None:
+            return
+        channel.remove(sub)
+        if not channel.subscribers:
+            channel.stop()
+
+    def _ended(self, channel: Channel):
+        if self._channels.get(channel.key) is channel:
+            del self._channels[channel.key]
+
+    def channels(self) -> List[Dict[str, Any]]:
+        return [c.stats() for c in self._channels.values()]
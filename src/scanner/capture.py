@@ -0,0 +1,167 @@
+"""Run blocking capture on a reader thread and hand events to asyncio consumers.
+
+scapy's ``sniff``/``sendp`` block for the whole capture, so calling them from an
+``async def`` endpoint stalls the event loop (and every other request) until
+they return. ``Capture`` runs a blocking event source on its own daemon thread
+and pushes each event into a bounded ``asyncio.Queue`` owned by the loop. When
+the queue is full the reader thread waits, so a slow consumer slows the reader
+down instead of growing memory.
+
+Consumers either iterate the capture directly::
+
+    async with Capture(lambda: sniff_can_packets("vcan0")) as cap:
+        async for event in cap:
+            ...
+
+or take several ``subscribe()`` queues before ``start()`` to fan the same
+events out to more than one consumer. Exceptions raised by the source are
+re-raised in the consumer.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# How often a reader blocked on a full queue re-checks for stop()
+_POLL = 0.25
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Subscription:
+    """One consumer's bounded view of a capture; iterate it with ``async for``."""
+
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize)
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        if self._finished:
+            raise StopAsyncIteration
+        item = await self.queue.get()
+        if item is _DONE:
+            self._finished = True
+            raise StopAsyncIteration
+        if isinstance(item, _Failure):
+            self._finished = True
+            raise item.error
+        return item
+
+
+class Capture:
+    """Blocking event source drained by a reader thread into asyncio queues.
+
+    ``source`` is a callable returning an iterable of events; it is only
+    called on the reader thread. ``maxsize`` bounds the hand-off queue and
+    every subscriber queue. ``on_stop`` is called by ``stop()`` to interrupt
+    a source that would otherwise keep blocking (e.g. ``CanSniffer.stop``).
+    """
+
+    def __init__(self, source: Callable[[], Iterable[Dict[str, Any]]], maxsize: int = 1024, name: str = "capture",
+                 on_stop: Optional[Callable[[], None]] = None):
+        self._source = source
+        self._on_stop = on_stop
+        self.maxsize = maxsize
+        self.name = name
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional["asyncio.Queue[Any]"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pump: Optional["asyncio.Task"] = None
+        self._subscribers: List[Subscription] = []
+        self._default: Optional[Subscription] = None
+
+    def subscribe(self, maxsize: Optional[int] = None) -> Subscription:
+        if self._thread is not None:
+            raise RuntimeError("subscribe() must be called before start()")
+        sub = Subscription(self.maxsize if maxsize is None else maxsize)
+        self._subscribers.append(sub)
+        return sub
+
+    async def start(self) -> "Capture":
+        if self._thread is not None:
+            return self
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.maxsize)
+        if not self._subscribers:
+            self._default = self.subscribe()
+        self._thread = threading.Thread(target=self._read, name=self.name, daemon=True)
+        self._thread.start()
+        self._pump = asyncio.ensure_future(self._fan_out())
+        return self
+
+    def _put(self, item) -> bool:
+        # Blocks the reader (not the loop) while the queue is full
+        try:
+            fut = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        except RuntimeError:  # loop already closed
+            return False
+        while True:
+            try:
+                fut.result(timeout=_POLL)
+                return True
+            except concurrent.futures.TimeoutError:
+                if self._stop.is_set():
+                    fut.cancel()
+                    return False
+            except concurrent.futures.CancelledError:
+                return False
+
+    def _read(self):
+        try:
+            for item in self._source():
+                if self._stop.is_set() or not self._put(item):
+                    return
+        except Exception as e:
+            end = _Failure(e)
+        else:
+            end = _DONE
+        if not self._stop.is_set():
+            self._put(end)
+
+    async def _fan_out(self):
+        subs = self._subscribers
+        while True:
+            item = await self._queue.get()
+            # The slowest subscriber sets the pace; queues stay bounded
+            for sub in subs:
+                await sub.queue.put(item)
+            if item is _DONE or isinstance(item, _Failure):
+                return
+
+    def __aiter__(self):
+        if self._default is None:
+            raise RuntimeError("Capture has subscribers; iterate those instead")
+        return self._default
+
+    async def stop(self):
+        """Stop reading; the reader thread exits after its current item."""
+        self._stop.set()
+        if self._on_stop is not None:
+            self._on_stop()
+        if self._pump is not None and not self._pump.done():
+            self._pump.cancel()
+            try:
+                await self._pump
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def __aenter__(self) -> "Capture":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
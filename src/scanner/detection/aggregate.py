@@ -0,0 +1,143 @@
+"""Roll findings up by (rule_id, affected_id) instead of one finding per frame.
+
+A chatty offending ID would otherwise produce a finding (with a full evidence
+event) for every frame. ``FindingAggregator`` keeps one group per key with
+``count``, ``first_seen``/``last_seen`` and a bounded evidence sample, and
+decides when a group is worth (re-)emitting: immediately when a group is new,
+then at most once per ``min_interval`` while it keeps growing.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+def finding_key(finding: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    return finding.get("rule_id", ""), finding.get("affected_id")
+
+
+class _Group:
+    __slots__ = ("finding", "count", "first_seen", "last_seen", "samples", "last_emit", "dirty", "injected")
+
+    def __init__(self, finding: Dict[str, Any], ts: float):
+        self.finding = finding
+        self.count = 0
+        self.first_seen = ts
+        self.last_seen = ts
+        self.samples: List[Any] = []
+        self.last_emit: Optional[float] = None
+        self.dirty = False
+        self.injected = 0
+
+
+class FindingAggregator:
+    """Group findings and throttle how often each group is re-emitted.
+
+    ``add()`` returns the rollups that should be sent now (possibly none).
+    Groups that changed since their last emission are swept out about once per
+    ``min_interval`` by later ``add()`` calls, and ``flush()`` returns whatever
+    is still pending (call it when a stream ends). At most ``max_groups``
+    groups are kept; the least recently updated is evicted.
+    """
+
+    def __init__(self, min_interval: float = 1.0, evidence_samples: int = 3, max_groups: int = 10000, clock=time.time):
+        self.min_interval = min_interval
+        self.evidence_samples = evidence_samples
+        self.max_groups = max_groups
+        self.clock = clock
+        self._groups: "OrderedDict[Tuple[str, Optional[str]], _Group]" = OrderedDict()
+        self._last_sweep: Optional[float] = None
+        self._pending: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def _rollup(self, g: _Group) -> Dict[str, Any]:
+        out = dict(g.finding)
+        out.pop("evidence", None)
+        out.pop("injected", None)
+        rule_id, affected = finding_key(g.finding)
+        out.update({
+            "finding_id": f"{rule_id}:{affected}" if affected is not None else rule_id,
+            "count": g.count,
+            "first_seen": g.first_seen,
+            "last_seen": g.last_seen,
+        })
+        if g.injected:
+            # Occurrences raised by our own injected frames
+            out["injected_count"] = g.injected
+        if g.samples:
+            out["evidence"] = g.samples[0]
+            out["evidence_samples"] = list(g.samples)
+        return out
+
+    def _emit(self, g: _Group, now: float) -> Dict[str, Any]:
+        g.last_emit = now
+        g.dirty = False
+        return self._rollup(g)
+
+    def add(self, finding: Dict[str, Any], ts: Optional[float] = None) -> List[Dict[str, Any]]:
+        now = self.clock() if ts is None else ts
+        key = finding_key(finding)
+        g = self._groups.get(key)
+        if g is None:
+            if len(self._groups) >= self.max_groups:
+                _, old = self._groups.popitem(last=False)
+                if old.dirty:
+                    self._pending.append(self._rollup(old))
+            g = self._groups[key] = _Group(finding, now if finding.get("first_seen") is None else finding["first_seen"])
+        else:
+            self._groups.move_to_end(key)
+            # Keep the most severe wording seen for the group
+            if _SEVERITY_RANK.get(finding.get("severity"), 0) > _SEVERITY_RANK.get(g.finding.get("severity"), 0):
+                g.finding = finding
+        first, last = now, now
+        if finding.get("first_seen") is not None:
+            # Batch findings (see batch.py) are already rolled up per ID
+            g.count += int(finding.get("count") or 1)
+            first = finding["first_seen"]
+            last = finding.get("last_seen") if finding.get("last_seen") is not None else first
+        else:
+            g.count += 1
+        if finding.get("injected"):
+            g.injected += 1
+        if first < g.first_seen:
+            g.first_seen = first
+        if last > g.last_seen:
+            g.last_seen = last
+        ev = finding.get("evidence")
+        if ev is not None and len(g.samples) < self.evidence_samples:
+            g.samples.append(ev)
+        g.dirty = True
+
+        out = self._pending
+        self._pending = []
+        if g.last_emit is None or now - g.last_emit >= self.min_interval:
+            out.append(self._emit(g, now))
+        if self._last_sweep is None or now < self._last_sweep:
+            self._last_sweep = now
+        elif now - self._last_sweep >= self.min_interval:
+            self._last_sweep = now
+            out.extend(self._sweep(now))
+        return out
+
+    def _sweep(self, now: float) -> List[Dict[str, Any]]:
+        out = []
+        for g in self._groups.values():
+            if g.dirty and (g.last_emit is None or now - g.last_emit >= self.min_interval):
+                out.append(self._emit(g, now))
+        return out
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Emit every group with updates not yet reported."""
+        out = self._pending
+        self._pending = []
+        for g in self._groups.values():
+            if g.dirty:
+                out.append(self._emit(g, g.last_seen))
+        return out
+
+    def groups(self) -> List[Dict[str, Any]]:
+        """Current rollup of every group, least recently updated first."""
+        return [self._rollup(g) for g in self._groups.values()]
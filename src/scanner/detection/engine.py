@@ -1,10 +1,145 @@
-from typing import List, Dict, Any
-from .rules import apply_all
+import time
+from typing import List, Dict, Any, Iterable, Optional
+from .rules import apply_all, _event_ts
+from .registry import RulePipeline
+from .policy import PolicyHolder
+from .aggregate import FindingAggregator
+from ..frame import event_frame
+from ..metrics import histogram
+
+DETECTION_SECONDS = histogram("can_detection_seconds", "Streaming detection time per event (all rules and rollup)")
 
 
 class DetectionEngine:
-    def __init__(self, config: Dict[str, Any] | None = None):
-        self.config = config or {}
+    """Runs the detection rules in batch (``analyze``) or streaming (``feed``) mode.
+
+    Settings are compiled once into a ``PolicyHolder``. Pass a shared holder as
+    ``policy`` to have every engine (and running stream) follow settings updates.
+
+    With ``aggregate`` (the default) findings are rolled up per
+    (rule_id, affected_id) with ``count``/``first_seen``/``last_seen`` and a
+    bounded evidence sample; streaming re-emits a group at most once per
+    ``finding_interval`` seconds (setting, default 1.0). Call ``flush()`` when a
+    stream ends to get the final state of groups updated since their last emit.
+
+    ``injected`` (e.g. ``attacks.inject.InjectionRecord``, anything with
+    ``matches(frame)``) correlates captured frames with our own injections:
+    such events are marked ``injected`` and so are the findings they raise
+    (rollups count them in ``injected_count``).
+
+    Rules come from the registry (``registry.register_rule``); ``rule_stats()``
+    reports this engine's per-rule event, finding, error and time counters.
+
+    ``workers`` > 1 runs ``analyze_batch`` on a process pool sharded by CAN ID
+    (see ``parallel.ShardedDetector``); call ``close()`` when done with it.
+    """
+
+    def __init__(self, config: Dict[str, Any] | None = None, policy: PolicyHolder | None = None, aggregate: bool = True,
+                 injected=None, workers: int = 1):
+        self.policy = policy if policy is not None else PolicyHolder(config)
+        self.aggregate = aggregate
+        self.injected = injected
+        self.workers = workers
+        self._sharded = None
+        self._pipeline = RulePipeline(self.policy)
+        self._aggregator = self._new_aggregator()
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.policy.current.config
+
+    @property
+    def payload_profiles(self):
+        """The streaming payload profiles (``payload.ProfileSet``), e.g. to save a baseline."""
+        return getattr(self._pipeline.rule("payload"), "profiles", None)
+
+    def rule_stats(self) -> List[Dict[str, Any]]:
+        return self._pipeline.stats()
+
+    def _new_aggregator(self) -> Optional[FindingAggregator]:
+        if not self.aggregate:
+            return None
+        cfg = self.policy.current.config
+        return FindingAggregator(
+            min_interval=float(cfg.get("finding_interval", 1.0)),
+            evidence_samples=int(cfg.get("evidence_samples", 3)),
+        )
+
+    def _rollup(self, findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.aggregate:
+            return findings
+        agg = self._new_aggregator()
+        for f in findings:
+            ev = f.get("evidence")
+            agg.add(f, ts=_event_ts(ev) if isinstance(ev, dict) else None)
+        return agg.groups()
+
+    def _tag_injected(self, event: Dict[str, Any]) -> bool:
+        if self.injected is None or event.get("type") != "sniff":
+            return False
+        frame = event_frame(event)
+        if frame is not None and self.injected.matches(frame):
+            event["injected"] = True
+            return True
+        return False
 
     def analyze(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        return apply_all(events, config=self.config)
+        findings = apply_all(events, policy=self.policy.current)
+        if self.injected is not None:
+            for ev in events:
+                self._tag_injected(ev)
+            for f in findings:
+                ev = f.get("evidence")
+                if isinstance(ev, dict) and ev.get("injected"):
+                    f["injected"] = True
+        return self._rollup(findings)
+
+    # Streaming mode: feed events as they arrive and get findings back immediately
+    def feed(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        findings = self._pipeline.feed(event)
+        if findings and self._tag_injected(event):
+            for f in findings:
+                f["injected"] = True
+        if self._aggregator is not None and findings:
+            ts = _event_ts(event)
+            out: List[Dict[str, Any]] = []
+            for f in findings:
+                out.extend(self._aggregator.add(f, ts=ts))
+            findings = out
+        DETECTION_SECONDS.observe(time.perf_counter() - start)
+        return findings
+
+    def feed_many(self, events: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        findings: List[Dict[str, Any]] = []
+        for ev in events:
+            findings.extend(self.feed(ev))
+        return findings
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Pending rollups not yet emitted by ``feed`` (empty without aggregation)."""
+        return self._aggregator.flush() if self._aggregator is not None else []
+
+    # Vectorized mode for large offline captures (see batch.py); needs NumPy
+    def analyze_batch(self, batch) -> List[Dict[str, Any]]:
+        from .batch import FrameBatch, analyze_batch
+
+        if not isinstance(batch, FrameBatch):
+            batch = FrameBatch.from_events(batch)
+        if self.workers > 1:
+            if self._sharded is None:
+                from .parallel import ShardedDetector
+
+                self._sharded = ShardedDetector(self.workers, policy=self.policy)
+            return self._rollup(self._sharded.analyze(batch))
+        return self._rollup(analyze_batch(batch, policy=self.policy.current))
+
+    def close(self):
+        """Stop the batch worker pool, if one was started."""
+        if self._sharded is not None:
+            self._sharded.close()
+            self._sharded = None
+
+    def reset(self):
+        self._pipeline = RulePipeline(self.policy)
+        self._aggregator = self._new_aggregator()
@@ -0,0 +1,157 @@
+"""Process-parallel batch detection sharded by CAN ID.
+
+The batch rules (unexpected/blacklisted ID, sliding-window rate, period
+burst/gap) only ever look at one ID's frames, so a batch split by CAN ID can
+be analyzed in independent processes and the findings simply concatenated;
+the result is identical to ``analyze_batch`` on the whole batch. The one
+batch-wide input, whether every frame is timestamped (``batch_timed``), is
+decided by the coordinator and passed to every shard.
+
+The coordinator assigns every frame a shard (``can_id % shards``, or ID
+ranges with ``bounds``), stable-sorts by shard so each shard is one contiguous
+slice in capture order, and writes the records once into a reused
+``multiprocessing.shared_memory`` block. Workers get only the block name and
+their slice bounds, view it as ``FRAME_DTYPE`` records without copying or
+unpickling frames, and send back the (small) findings.
+"""
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .batch import FRAME_DTYPE, FrameBatch, analyze_batch, batch_timed
+from .policy import IdPolicy, PolicyHolder
+
+# Below this many frames the batch is analyzed in-process
+MIN_PARALLEL_FRAMES = 50_000
+
+# Worker-side cache of compiled policies, keyed by (version, config repr)
+_WORKER_POLICIES: Dict[tuple, IdPolicy] = {}
+
+
+def _worker_policy(config: Dict[str, Any], version: int) -> IdPolicy:
+    key = (version, repr(sorted(config.items())))
+    policy = _WORKER_POLICIES.get(key)
+    if policy is None:
+        _WORKER_POLICIES.clear()
+        policy = _WORKER_POLICIES[key] = IdPolicy(config, version)
+    return policy
+
+
+def _analyze_shard(shm_name: str, start: int, stop: int, config: Dict[str, Any], version: int,
+                   timed: bool) -> List[Dict[str, Any]]:
+    # Pool processes share the coordinator's resource tracker, which unlinks
+    # the block only once the coordinator releases it
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        records = np.ndarray((stop - start,), dtype=FRAME_DTYPE, buffer=shm.buf,
+                             offset=start * FRAME_DTYPE.itemsize)
+        batch = FrameBatch.from_records(records)
+        findings = analyze_batch(batch, policy=_worker_policy(config, version), timed=timed)
+        # Release views into the block before closing it
+        del batch, records
+        return findings
+    finally:
+        shm.close()
+
+
+def shard_ids(can_ids: np.ndarray, shards: int, bounds: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Shard index per frame: ``can_id % shards``, or by ID ranges split at ``bounds``."""
+    if bounds is not None:
+        return np.searchsorted(np.asarray(bounds, dtype=np.uint32), can_ids, side="right").astype(np.intp)
+    return (can_ids % np.uint32(shards)).astype(np.intp)
+
+
+class ShardedDetector:
+    """Run ``analyze_batch`` over a process pool, one shard of CAN IDs per task.
+
+    ``workers`` defaults to the CPU count. ``bounds`` switches from hash to
+    range sharding (``len(bounds) + 1`` shards). Batches smaller than
+    ``min_frames`` (or ``workers=1``) run in-process. One batch is analyzed
+    at a time; call ``close()`` to stop the pool and free the shared block.
+    """
+
+    def __init__(self, workers: Optional[int] = None, policy: Optional[PolicyHolder] = None,
+                 config: Optional[Dict[str, Any]] = None, bounds: Optional[Sequence[int]] = None,
+                 min_frames: int = MIN_PARALLEL_FRAMES):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.policy = policy if policy is not None else PolicyHolder(config)
+        self.bounds = list(bounds) if bounds is not None else None
+        self.shards = len(self.bounds) + 1 if self.bounds is not None else self.workers
+        self.min_frames = min_frames
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context(method))
+        return self._pool
+
+    def _records(self, n: int) -> np.ndarray:
+        size = max(1, n * FRAME_DTYPE.itemsize)
+        if self._shm is None or self._shm.size < size:
+            # Grow geometrically so a stream of similar batches reuses one block
+            grown = 2 * self._shm.size if self._shm is not None else 0
+            self._release_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(size, grown))
+        return np.ndarray((n,), dtype=FRAME_DTYPE, buffer=self._shm.buf)
+
+    def _release_shm(self):
+        if self._shm is not None:
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except Exception:
+                pass
+            self._shm = None
+
+    def analyze(self, batch: FrameBatch) -> List[Dict[str, Any]]:
+        policy = self.policy.current
+        n = len(batch)
+        if self.workers <= 1 or n < self.min_frames:
+            return analyze_batch(batch, policy=policy)
+        with self._lock:
+            shard = shard_ids(batch.can_id, self.shards, self.bounds)
+            # Stable: each shard keeps capture order
+            order = np.argsort(shard, kind="stable")
+            counts = np.bincount(shard, minlength=self.shards)
+            records = self._records(n)
+            records["can_id"] = batch.can_id[order]
+            records["dlc"] = batch.dlc[order]
+            records["data"] = batch.data[order]
+            records["timestamp"] = batch.timestamp[order]
+            del records
+            # A shard without untimed frames must still count rates like the whole batch
+            timed = batch_timed(batch)
+            pool = self._executor()
+            futures = []
+            start = 0
+            for count in counts:
+                stop = start + int(count)
+                if count:
+                    futures.append(pool.submit(_analyze_shard, self._shm.name, start, stop, policy.config,
+                                               policy.version, timed))
+                start = stop
+            findings: List[Dict[str, Any]] = []
+            for fut in futures:
+                findings.extend(fut.result())
+        return findings
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        with self._lock:
+            self._release_shm()
+
+    def __enter__(self) -> "ShardedDetector":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,315 @@
+"""Per-ID payload profiles for spotting out-of-profile frames.
+
+Every tracked CAN ID keeps a fixed-size profile of its first 8 payload bytes:
+DLC histogram, per-byte min/max, the mask of bits seen toggling between
+consecutive frames, how often each byte changes, rolling-counter hits (low
+nibble advancing by exactly one) and checksum hits (XOR of all bytes is zero,
+or a byte equals the 8-bit sum of the others). State lives in fixed-size
+arrays, updates are O(dlc) per frame, and the number of tracked IDs is capped.
+
+An ID's profile is learned from its first ``learn_frames`` frames and then
+frozen; later frames are checked against it so spoofed payloads cannot widen
+the baseline:
+
+- ``dlc``: a DLC never seen while learning
+- ``range``: a byte outside its learned min/max
+- ``bits``: a bit that never toggled while learning toggles now (range and
+  bits skip counter and sum-checksum bytes)
+- ``counter``: a byte learned as a rolling counter did not advance by one
+- ``checksum``: a learned XOR/sum checksum does not hold
+
+Profiles round-trip through JSON (``ProfileSet.save``/``load``), so a
+baseline learned on one drive log can be reused on later captures.
+"""
+import json
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+MAX_BYTES = 8
+MAX_DLC = 15
+
+PROFILE_VERSION = 1
+
+# Share of learning frames a counter/checksum pattern must hold in
+_PATTERN_RATIO = 0.95
+
+# Reasons and how much each adds to the anomaly score
+REASON_WEIGHTS = {"dlc": 1.0, "range": 0.5, "bits": 0.5, "counter": 1.0, "checksum": 1.0}
+
+
+def _counts(n: int) -> array:
+    return array("I", bytes(4 * n))
+
+
+class IdProfile:
+    __slots__ = (
+        "frames", "pairs", "dlc", "lo", "hi", "flips", "changes", "counter_hits", "sum_hits",
+        "xor_hits", "changed", "last", "prev", "learned", "counters", "checksum", "derived",
+    )
+
+    def __init__(self):
+        self.frames = 0
+        self.pairs = 0                      # consecutive frame pairs compared
+        self.dlc = _counts(MAX_DLC + 1)
+        self.lo = bytearray(b"\xff" * MAX_BYTES)
+        self.hi = bytearray(MAX_BYTES)
+        self.flips = bytearray(MAX_BYTES)   # bits seen toggling
+        self.changes = _counts(MAX_BYTES)   # pairs where the byte changed
+        self.counter_hits = _counts(MAX_BYTES)
+        self.sum_hits = _counts(MAX_BYTES)
+        self.xor_hits = 0
+        self.changed = 0                    # pairs where any byte changed
+        self.last: Optional[bytes] = None   # last frame that passed the checks
+        self.prev: Optional[bytes] = None   # last frame seen, flagged or not
+        self.learned = False
+        self.counters = 0                   # bit i set: byte i is a rolling counter
+        self.checksum: Optional[str] = None  # "xor" or "sum:<byte>"
+        self.derived = 0                    # counter/checksum bytes: no range or bit checks
+
+    def learn(self, data: bytes, dlc: int):
+        n = min(len(data), MAX_BYTES)
+        self.frames += 1
+        self.dlc[min(dlc, MAX_DLC)] += 1
+        total = x = 0
+        for i in range(n):
+            total += data[i]
+            x ^= data[i]
+        if n and not x:
+            self.xor_hits += 1
+        lo, hi, last = self.lo, self.hi, self.last
+        m = min(n, len(last)) if last is not None else 0
+        if last is not None:
+            self.pairs += 1
+            if data[:m] != last[:m]:
+                self.changed += 1
+        for i in range(n):
+            b = data[i]
+            if b < lo[i]:
+                lo[i] = b
+            if b > hi[i]:
+                hi[i] = b
+            if (total - b) & 0xFF == b:
+                self.sum_hits[i] += 1
+            if i < m:
+                d = b ^ last[i]
+                if d:
+                    self.flips[i] |= d
+                    self.changes[i] += 1
+                if (b - last[i]) & 0x0F == 1:
+                    self.counter_hits[i] += 1
+
+    def freeze(self):
+        self.learned = True
+        self.counters = 0
+        if self.pairs:
+            need = _PATTERN_RATIO * self.pairs
+            for i in range(MAX_BYTES):
+                if self.counter_hits[i] >= need:
+                    self.counters |= 1 << i
+        self.checksum = None
+        # Constant payloads satisfy any checksum trivially
+        if self.frames and self.changed:
+            need = _PATTERN_RATIO * self.frames
+            if self.xor_hits >= need:
+                self.checksum = "xor"
+            else:
+                for i in range(MAX_BYTES):
+                    # A counter byte can't double as the checksum
+                    if self.sum_hits[i] >= need and not self.counters >> i & 1 and self.hi[i] != self.lo[i]:
+                        self.checksum = f"sum:{i}"
+                        break
+        self.derived = self.counters
+        if self.checksum is not None and self.checksum.startswith("sum:"):
+            self.derived |= 1 << int(self.checksum[4:])
+
+    def check(self, data: bytes, dlc: int, last: Optional[bytes] = None) -> List[str]:
+        """Violated checks; counter and bit changes are taken against ``last``
+        (default: the last frame that passed)."""
+        reasons: List[str] = []
+        if not self.dlc[min(dlc, MAX_DLC)]:
+            reasons.append("dlc")
+        n = min(len(data), MAX_BYTES)
+        if last is None:
+            last = self.last
+        lo, hi, flips = self.lo, self.hi, self.flips
+        m = min(n, len(last)) if last is not None else 0
+        out_of_range = new_bits = bad_counter = False
+        derived = self.derived
+        for i in range(n):
+            b = data[i]
+            if derived >> i & 1:
+                # Counters wrap and checksums follow the data; check the pattern instead
+                if i < m and self.counters >> i & 1 and (b - last[i]) & 0x0F != 1:
+                    bad_counter = True
+                continue
+            if b < lo[i] or b > hi[i]:
+                out_of_range = True
+            if i < m and (b ^ last[i]) & ~flips[i] & 0xFF:
+                new_bits = True
+        if out_of_range:
+            reasons.append("range")
+        if new_bits:
+            reasons.append("bits")
+        if bad_counter:
+            reasons.append("counter")
+        checksum = self.checksum
+        if checksum is not None and n:
+            if checksum == "xor":
+                x = 0
+                for i in range(n):
+                    x ^= data[i]
+                ok = not x
+            else:
+                i = int(checksum[4:])
+                ok = i < n and (sum(data[:n]) - data[i]) & 0xFF == data[i]
+            if not ok:
+                reasons.append("checksum")
+        return reasons
+
+    @property
+    def change_rate(self) -> float:
+        return self.changed / self.pairs if self.pairs else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "pairs": self.pairs,
+            "dlc": list(self.dlc),
+            "min": list(self.lo),
+            "max": list(self.hi),
+            "flips": list(self.flips),
+            "changes": list(self.changes),
+            "counter_hits": list(self.counter_hits),
+            "sum_hits": list(self.sum_hits),
+            "xor_hits": self.xor_hits,
+            "changed": self.changed,
+            "learned": self.learned,
+            "counters": [i for i in range(MAX_BYTES) if self.counters >> i & 1],
+            "checksum": self.checksum,
+            "change_rate": round(self.change_rate, 4),
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "IdProfile":
+        p = cls()
+        p.frames = int(d.get("frames", 0))
+        p.pairs = int(d.get("pairs", 0))
+        for name, attr in (("dlc", "dlc"), ("changes", "changes"), ("counter_hits", "counter_hits"),
+                           ("sum_hits", "sum_hits")):
+            target = getattr(p, attr)
+            for i, v in enumerate(d.get(name, [])[:len(target)]):
+                target[i] = int(v)
+        for name, attr in (("min", "lo"), ("max", "hi"), ("flips", "flips")):
+            target = getattr(p, attr)
+            for i, v in enumerate(d.get(name, [])[:MAX_BYTES]):
+                target[i] = int(v) & 0xFF
+        p.xor_hits = int(d.get("xor_hits", 0))
+        p.changed = int(d.get("changed", 0))
+        if d.get("learned"):
+            p.freeze()
+        return p
+
+
+class ProfileSet:
+    """Payload profiles for up to ``max_ids`` IDs (least recently seen evicted).
+
+    ``update(can_id, data, dlc)`` learns while the ID has fewer than
+    ``learn_frames`` frames and returns the violated checks (possibly empty)
+    afterwards. Counter and bit checks compare a frame with the last one that
+    passed, so a single injected frame raises a single alert; a frame that
+    follows on from the flagged one instead (a dropped frame, a real state
+    change) is accepted and becomes the new reference. With ``learn_new=False`` IDs missing from
+    a loaded baseline are not profiled at all.
+    """
+
+    def __init__(self, learn_frames: int = 200, max_ids: int = 4096, learn_new: bool = True):
+        self.learn_frames = max(1, int(learn_frames))
+        self.max_ids = max_ids
+        self.learn_new = learn_new
+        self._ids: "OrderedDict[int, IdProfile]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, can_id: int) -> Optional[IdProfile]:
+        return self._ids.get(can_id)
+
+    def update(self, can_id: int, data: bytes, dlc: int) -> List[str]:
+        ids = self._ids
+        p = ids.get(can_id)
+        if p is None:
+            if not self.learn_new:
+                return []
+            if len(ids) >= self.max_ids:
+                ids.popitem(last=False)
+            p = ids[can_id] = IdProfile()
+        else:
+            ids.move_to_end(can_id)
+        if p.learned:
+            reasons = p.check(data, dlc)
+            if reasons and p.prev is not p.last and p.prev is not None:
+                # The previous frame was flagged too: a counter or bit change it
+                # explains is the bus moving on, not another injection
+                again = p.check(data, dlc, p.prev)
+                reasons = [r for r in reasons if r in again]
+        else:
+            reasons = []
+            p.learn(data, dlc)
+            if p.frames >= self.learn_frames:
+                p.freeze()
+        if not reasons:
+            p.last = data
+        p.prev = data
+        return reasons
+
+    def freeze(self):
+        """End learning now for every tracked ID (e.g. after a baseline capture)."""
+        for p in self._ids.values():
+            if p.frames:
+                p.freeze()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": PROFILE_VERSION,
+            "learn_frames": self.learn_frames,
+            "ids": {hex(can_id): p.to_dict() for can_id, p in self._ids.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], **opts) -> "ProfileSet":
+        opts.setdefault("learn_frames", d.get("learn_frames", 200))
+        profiles = cls(**opts)
+        for key, pd in (d.get("ids") or {}).items():
+            profiles._ids[int(key, 16)] = IdProfile.from_dict(pd)
+        return profiles
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str, **opts) -> "ProfileSet":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f), **opts)
+
+
+def payload_score(reasons: List[str]) -> float:
+    return round(sum(REASON_WEIGHTS.get(r, 0.5) for r in reasons), 2)
+
+
+def _payload_finding(can_id: int, reasons: List[str], profile: Optional[IdProfile]) -> Dict[str, Any]:
+    score = payload_score(reasons)
+    learned = f" (profile of {profile.frames} frames)" if profile is not None else ""
+    return {
+        "rule_id": "PAYLOAD_ANOMALY",
+        "title": "CAN payload outside learned profile",
+        "severity": "high" if score >= 1.0 else "medium",
+        "affected_id": hex(can_id),
+        "reasons": reasons,
+        "score": score,
+        "description": (
+            f"Payload of CAN ID {hex(can_id)} violates its learned profile{learned}: "
+            f"{', '.join(reasons)}; possible spoofed or injected frame."
+        ),
+    }
@@ -0,0 +1,207 @@
+"""Compiled CAN ID policy (whitelist/blacklist) with atomic hot-reload.
+
+Settings are compiled once into ``IdSet`` lookups: a 2048-entry bitmap covering
+every standard (11-bit) ID, including any ranges or masks that match standard
+IDs, plus a hashed set for extended (29-bit) IDs and short lists of extended
+ranges and ``id/mask`` entries. Membership is O(1) for standard IDs.
+
+Entries accept ``0x123`` / ``291`` (single ID), ``0x100-0x1FF`` (inclusive range)
+and ``0x700/0x7F0`` (match when ``can_id & mask == id & mask``).
+
+``PolicyHolder`` keeps the current compiled policy behind a single attribute.
+``update()`` compiles the new settings first and then swaps the reference, so
+engines that read ``holder.current`` per event pick the change up on their next
+frame without being restarted.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..frame import CAN_EFF_MASK, CAN_SFF_MASK
+
+DEFAULT_WHITELIST = [0x123, 0x456]
+DEFAULT_BLACKLIST = [0x7DF, 0x6F1]
+
+# classify() results
+ALLOWED = 0
+UNEXPECTED = 1
+BLACKLISTED = 2
+
+# Extended ranges up to this size are expanded into the hashed set
+_EXPAND_LIMIT = 4096
+
+
+def _parse_int(v) -> int:
+    if isinstance(v, str):
+        v = v.strip()
+        return int(v, 16) if v.lower().startswith("0x") else int(v)
+    return int(v)
+
+
+def parse_id_entry(entry) -> Optional[Tuple[str, int, int]]:
+    """Parse a policy entry into ``("id"|"range"|"mask", a, b)``; None if malformed."""
+    try:
+        if isinstance(entry, str):
+            if "/" in entry:
+                can_id, mask = entry.split("/", 1)
+                mask = _parse_int(mask) & CAN_EFF_MASK
+                return "mask", _parse_int(can_id) & mask, mask
+            text = entry.strip()
+            if "-" in text[1:]:
+                lo, hi = text.split("-", 1)
+                lo, hi = _parse_int(lo), _parse_int(hi)
+                if lo > hi:
+                    lo, hi = hi, lo
+                return "range", lo, hi
+        value = _parse_int(entry)
+        return "id", value, value
+    except Exception:
+        return None
+
+
+class IdSet:
+    __slots__ = ("bitmap", "extended", "ranges", "masks", "size")
+
+    def __init__(self):
+        self.bitmap = bytearray(CAN_SFF_MASK + 1)
+        self.extended = set()
+        self.ranges: List[Tuple[int, int]] = []
+        self.masks: List[Tuple[int, int]] = []
+        self.size = 0  # number of entries compiled in
+
+    @classmethod
+    def compile(cls, entries: Optional[Iterable[Any]]) -> "IdSet":
+        out = cls()
+        bitmap = out.bitmap
+        for entry in entries or []:
+            parsed = parse_id_entry(entry)
+            if parsed is None:
+                continue
+            kind, a, b = parsed
+            out.size += 1
+            if kind == "id":
+                if 0 <= a <= CAN_SFF_MASK:
+                    bitmap[a] = 1
+                else:
+                    out.extended.add(a)
+            elif kind == "range":
+                lo_std, hi_std = max(a, 0), min(b, CAN_SFF_MASK)
+                if lo_std <= hi_std:
+                    bitmap[lo_std:hi_std + 1] = b"\x01" * (hi_std - lo_std + 1)
+                if b > CAN_SFF_MASK:
+                    lo_ext = max(a, CAN_SFF_MASK + 1)
+                    if b - lo_ext < _EXPAND_LIMIT:
+                        out.extended.update(range(lo_ext, b + 1))
+                    else:
+                        out.ranges.append((lo_ext, b))
+            else:
+                # Expand the standard-ID part of the mask into the bitmap
+                for can_id in range(CAN_SFF_MASK + 1):
+                    if can_id & b == a:
+                        bitmap[can_id] = 1
+                out.masks.append((a, b))
+        return out
+
+    def __contains__(self, can_id: int) -> bool:
+        if 0 <= can_id <= CAN_SFF_MASK:
+            return self.bitmap[can_id] == 1
+        if can_id in self.extended:
+            return True
+        for lo, hi in self.ranges:
+            if lo <= can_id <= hi:
+                return True
+        for value, mask in self.masks:
+            if can_id & mask == value:
+                return True
+        return False
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def member_mask(self, ids):
+        """Vectorized membership for a NumPy array of IDs (used by the batch path)."""
+        import numpy as np
+
+        ids = np.asarray(ids, dtype=np.uint32)
+        out = np.zeros(ids.shape[0], dtype=bool)
+        std = ids <= CAN_SFF_MASK
+        out[std] = np.frombuffer(bytes(self.bitmap), dtype=np.uint8)[ids[std]].astype(bool)
+        if std.all():
+            return out
+        ext_ids = ids[~std]
+        ext = np.zeros(ext_ids.shape[0], dtype=bool)
+        if self.extended:
+            ext |= np.isin(ext_ids, np.fromiter(self.extended, dtype=np.uint32, count=len(self.extended)))
+        for lo, hi in self.ranges:
+            ext |= (ext_ids >= lo) & (ext_ids <= hi)
+        for value, mask in self.masks:
+            ext |= (ext_ids & np.uint32(mask)) == value
+        out[~std] = ext
+        return out
+
+
+class IdPolicy:
+    """Immutable compiled form of the detection settings."""
+
+    __slots__ = ("config", "whitelist", "blacklist", "rate_threshold", "rate_window", "period_opts", "payload_opts",
+                 "version")
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, version: int = 0):
+        cfg = self.config = dict(config or {})
+        whitelist = IdSet.compile(cfg.get("whitelist"))
+        blacklist = IdSet.compile(cfg.get("blacklist"))
+        # Empty lists fall back to the built-in defaults, as the rules always have
+        self.whitelist = whitelist if whitelist else IdSet.compile(DEFAULT_WHITELIST)
+        self.blacklist = blacklist if blacklist else IdSet.compile(DEFAULT_BLACKLIST)
+        rate_threshold = cfg.get("rate_threshold", 50)
+        self.rate_threshold = 50 if rate_threshold is None else int(rate_threshold)
+        if self.rate_threshold < 1:
+            raise ValueError(f"rate_threshold must be at least 1 frame, got {rate_threshold!r}")
+        self.rate_window = float(cfg.get("rate_window") or 1.0)
+        self.period_opts: Dict[str, Any] = {}
+        for key, cast in (("period_min_samples", int), ("period_burst_ratio", float), ("period_gap_factor", float)):
+            if cfg.get(key) is not None:
+                self.period_opts[key[len("period_"):]] = cast(cfg[key])
+        # Payload profiling: frames learned per ID and an optional saved baseline
+        self.payload_opts: Dict[str, Any] = {
+            "learn_frames": int(cfg.get("payload_learn_frames") or 200),
+            "profile": cfg.get("payload_profile") or None,
+        }
+        self.version = version
+
+    def classify(self, can_id: int) -> int:
+        if can_id in self.blacklist:
+            return BLACKLISTED
+        if can_id in self.whitelist:
+            return ALLOWED
+        return UNEXPECTED
+
+
+def compile_policy(config: Optional[Dict[str, Any]] = None) -> IdPolicy:
+    return IdPolicy(config)
+
+
+class PolicyHolder:
+    """Shared, atomically swappable reference to the current ``IdPolicy``."""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self._lock = threading.Lock()
+        self.current = IdPolicy(config)
+
+    @classmethod
+    def wrap(cls, policy: IdPolicy) -> "PolicyHolder":
+        """A holder for an already compiled policy."""
+        holder = cls.__new__(cls)
+        holder._lock = threading.Lock()
+        holder.current = policy
+        return holder
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.current.config
+
+    def update(self, config: Dict[str, Any]) -> IdPolicy:
+        # Writers are serialized; readers only ever see a fully compiled policy
+        with self._lock:
+            policy = IdPolicy(config, version=self.current.version + 1)
+            self.current = policy
+        return policy
@@ -0,0 +1,315 @@
+"""Rule plugin registry and the single-pass dispatch pipeline.
+
+Rules are registered by name with the event types they consume (``None`` for
+all) and the fields they need. A rule is any object with ``feed(event) ->
+findings``, built per engine by ``factory(policy_holder)``::
+
+    @register_rule("my_rule", event_types=("sniff",))
+    class MyRule:
+        def __init__(self, policy):
+            ...
+        def feed(self, ev):
+            return []
+
+A rule that needs no settings registers with ``uses_policy=False`` and is
+built with no arguments.
+
+``RulePipeline`` builds the enabled rules once and a dispatch table from
+event type to the rules that want it, so each event is visited once and only
+handed to interested rules; a custom rule never adds a pass over the events.
+Frames are parsed once per event for all rules that need ``frame``. The
+``disabled_rules`` setting switches rules off without unregistering them.
+
+For whole-capture analysis (``rules.apply_all``) a rule may register a
+separate ``batch`` factory; rules with a ``finish()`` method report the
+findings that need the complete input there, after the last event.
+
+Every pipeline counts per rule the events dispatched, findings, errors (the
+last one is kept) and time spent. A rule that raises is counted and skipped
+for that event instead of failing silently. ``rule_stats()`` sums the
+counters of all pipelines, live and finished, for the whole process.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..frame import event_frame
+from ..metrics import Sample, register_collector
+from .policy import PolicyHolder
+
+
+class RuleSpec:
+    __slots__ = ("name", "factory", "batch", "event_types", "fields", "enabled", "description", "uses_policy")
+
+    def __init__(self, name: str, factory: Callable[..., Any], batch: Optional[Callable[..., Any]],
+                 event_types: Optional[Tuple[str, ...]], fields: Tuple[str, ...], enabled: bool, description: str,
+                 uses_policy: bool = True):
+        self.name = name
+        self.factory = factory
+        self.batch = batch
+        self.event_types = event_types
+        self.fields = fields
+        self.enabled = enabled
+        self.description = description
+        self.uses_policy = uses_policy
+
+    def build(self, policy: PolicyHolder, batch: bool = False) -> Any:
+        factory = self.batch if batch and self.batch is not None else self.factory
+        return factory(policy) if self.uses_policy else factory()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "event_types": list(self.event_types) if self.event_types is not None else None,
+            "fields": list(self.fields),
+            "enabled": self.enabled,
+            "description": self.description,
+        }
+
+
+_REGISTRY: "OrderedDict[str, RuleSpec]" = OrderedDict()
+
+
+def register_rule(name: str, factory: Optional[Callable[[PolicyHolder], Any]] = None,
+                  event_types: Optional[Iterable[str]] = ("sniff",), fields: Iterable[str] = ("frame",),
+                  enabled: bool = True, description: str = "", batch: Optional[Callable[[PolicyHolder], Any]] = None,
+                  replace: bool = False, uses_policy: bool = True):
+    """Register a rule factory under ``name``; usable as a decorator.
+
+    ``batch`` builds the variant used for whole-capture analysis (defaults to
+    ``factory``). ``enabled=False`` registers the rule without running it by
+    default. With ``uses_policy=False`` the factories are called without the
+    policy holder. Registering an existing name raises ``ValueError`` unless
+    ``replace``.
+    """
+    def add(f):
+        if name in _REGISTRY and not replace:
+            raise ValueError(f"Rule {name!r} is already registered")
+        doc = description or ((getattr(f, "__doc__", None) or "").strip().splitlines() or [""])[0]
+        _REGISTRY[name] = RuleSpec(name, f, batch, tuple(event_types) if event_types is not None else None,
+                                   tuple(fields), enabled, doc, uses_policy)
+        return f
+
+    return add(factory) if factory is not None else add
+
+
+def unregister_rule(name: str) -> bool:
+    return _REGISTRY.pop(name, None) is not None
+
+
+def registered_rules() -> List[RuleSpec]:
+    return list(_REGISTRY.values())
+
+
+class RuleStats:
+    __slots__ = ("events", "findings", "errors", "ns", "max_ns", "last_error")
+
+    def __init__(self):
+        self.events = 0
+        self.findings = 0
+        self.errors = 0
+        self.ns = 0
+        self.max_ns = 0
+        self.last_error: Optional[str] = None
+
+    def merge(self, other: "RuleStats"):
+        self.events += other.events
+        self.findings += other.findings
+        self.errors += other.errors
+        self.ns += other.ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+        if other.last_error is not None:
+            self.last_error = other.last_error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "findings": self.findings,
+            "errors": self.errors,
+            "total_ms": round(self.ns / 1e6, 3),
+            "mean_us": round(self.ns / self.events / 1e3, 3) if self.events else 0.0,
+            "max_us": round(self.max_ns / 1e3, 3),
+            "last_error": self.last_error,
+        }
+
+
+# Counters of finished pipelines, plus the live ones (summed on demand)
+_retired: Dict[str, RuleStats] = {}
+_live: "weakref.WeakSet[RulePipeline]" = weakref.WeakSet()
+_stats_lock = threading.Lock()
+
+
+def _retire(stats: Dict[str, RuleStats]):
+    with _stats_lock:
+        for name, st in stats.items():
+            _retired.setdefault(name, RuleStats()).merge(st)
+
+
+def _combined() -> Dict[str, RuleStats]:
+    with _stats_lock:
+        combined: Dict[str, RuleStats] = {}
+        for name, st in _retired.items():
+            combined.setdefault(name, RuleStats()).merge(st)
+        for pipeline in list(_live):
+            for name, st in pipeline.stats_by_rule.items():
+                combined.setdefault(name, RuleStats()).merge(st)
+    return combined
+
+
+def rule_stats() -> List[Dict[str, Any]]:
+    """Process-wide per-rule counters, most expensive rule first, with its share of rule time."""
+    combined = _combined()
+    total = sum(st.ns for st in combined.values()) or 1
+    out = [{"rule": name, **st.to_dict(), "time_share": round(st.ns / total, 4)} for name, st in combined.items()]
+    out.sort(key=lambda d: d["total_ms"], reverse=True)
+    return out
+
+
+@register_collector
+def _rule_samples() -> List[Sample]:
+    combined = _combined()
+    families = (
+        ("can_rule_events_total", "Events dispatched to each detection rule", "events", 1),
+        ("can_rule_findings_total", "Findings raised by each detection rule", "findings", 1),
+        ("can_rule_errors_total", "Exceptions raised by each detection rule", "errors", 1),
+        ("can_rule_seconds_total", "Time spent in each detection rule", "ns", 1e-9),
+    )
+    return [Sample(name, "counter", help, ("rule",), {(rule,): getattr(st, field) * scale for rule, st in combined.items()})
+            for name, help, field, scale in families]
+
+
+def reset_rule_stats():
+    with _stats_lock:
+        _retired.clear()
+        for pipeline in list(_live):
+            for st in pipeline.stats_by_rule.values():
+                st.__init__()
+
+
+def _timed(stats: RuleStats, fn: Callable, *args) -> Optional[List[Dict[str, Any]]]:
+    start = time.perf_counter_ns()
+    try:
+        out = fn(*args)
+    except Exception as e:
+        stats.errors += 1
+        stats.last_error = f"{type(e).__name__}: {e}"
+        out = None
+    spent = time.perf_counter_ns() - start
+    stats.ns += spent
+    if spent > stats.max_ns:
+        stats.max_ns = spent
+    if out:
+        stats.findings += len(out)
+    return out
+
+
+class RulePipeline:
+    """The enabled registered rules for one engine, dispatched by event type.
+
+    ``rules`` restricts the pipeline to those names (in registry order) and
+    ``batch`` builds the rules' batch variants. Settings changes that toggle
+    ``disabled_rules`` rebuild the pipeline on the next event; other settings
+    are left to the rules themselves.
+    """
+
+    def __init__(self, policy: PolicyHolder, rules: Optional[Iterable[str]] = None, batch: bool = False):
+        self.policy = policy
+        self.only = set(rules) if rules is not None else None
+        self.batch = batch
+        self.stats_by_rule: Dict[str, RuleStats] = {}
+        self.rules: "OrderedDict[str, Any]" = OrderedDict()
+        self._build()
+        _live.add(self)
+        weakref.finalize(self, _retire, self.stats_by_rule)
+
+    def _build(self):
+        current = self.policy.current
+        self._version = current.version
+        disabled = set(current.config.get("disabled_rules") or ())
+        self._disabled = disabled
+        rules: "OrderedDict[str, Any]" = OrderedDict()
+        wildcard: List[Tuple[str, Callable, RuleStats, bool]] = []
+        typed: Dict[str, List[Tuple[str, Callable, RuleStats, bool]]] = {}
+        for spec in registered_rules():
+            if self.only is not None:
+                if spec.name not in self.only:
+                    continue
+            elif not spec.enabled or spec.name in disabled:
+                continue
+            # Keep the running instance (and its learned state) across rebuilds
+            rule = self.rules.get(spec.name)
+            if rule is None:
+                rule = spec.build(self.policy, batch=self.batch)
+            rules[spec.name] = rule
+            stats = self.stats_by_rule.setdefault(spec.name, RuleStats())
+            entry = (spec.name, rule.feed, stats, "frame" in spec.fields)
+            if spec.event_types is None:
+                wildcard.append(entry)
+            else:
+                for etype in spec.event_types:
+                    typed.setdefault(etype, []).append(entry)
+        # Wildcard rules join every typed list, keeping registry order within each
+        order = {name: i for i, name in enumerate(rules)}
+        self._dispatch = {
+            etype: self._route(sorted(entries + wildcard, key=lambda e: order[e[0]])) for etype, entries in typed.items()
+        }
+        self._wildcard = self._route(wildcard)
+        self.rules = rules
+
+    def reset(self):
+        """Start over with new rule instances (no learned state); counters are kept."""
+        self.rules = OrderedDict()
+        self._build()
+
+    @staticmethod
+    def _route(entries):
+        # (entries, whether any of them needs the parsed frame)
+        return entries, any(e[3] for e in entries)
+
+    def rule(self, name: str) -> Optional[Any]:
+        return self.rules.get(name)
+
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        current = self.policy.current
+        if current.version != self._version:
+            if set(current.config.get("disabled_rules") or ()) != self._disabled:
+                self._build()
+            self._version = current.version
+        entries, wants_frame = self._dispatch.get(ev.get("type"), self._wildcard)
+        if not entries:
+            return []
+        # Parsed once here; rules read the cached ev["frame"]
+        has_frame = wants_frame and (ev.get("frame") or event_frame(ev)) is not None
+        findings: List[Dict[str, Any]] = []
+        for name, feed, stats, needs_frame in entries:
+            if needs_frame and not has_frame:
+                continue
+            out = _timed(stats, feed, ev)
+            stats.events += 1
+            if out:
+                findings.extend(out)
+        return findings
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Findings of rules that report at the end of the input (``finish()``)."""
+        findings: List[Dict[str, Any]] = []
+        for name, rule in self.rules.items():
+            finish = getattr(rule, "finish", None)
+            if finish is not None:
+                out = _timed(self.stats_by_rule[name], finish)
+                if out:
+                    findings.extend(out)
+        return findings
+
+    def run(self, events: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One pass over ``events`` followed by ``finish()``."""
+        findings: List[Dict[str, Any]] = []
+        for ev in events:
+            findings.extend(self.feed(ev))
+        findings.extend(self.finish())
+        return findings
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [{"rule": name, **st.to_dict()} for name, st in self.stats_by_rule.items()]
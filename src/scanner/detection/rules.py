@@ -1,76 +1,84 @@
-from collections import Counter
+import threading
+import time
+from array import array
 from typing import List, Dict, Any, Tuple, Optional
 
+import numpy as np
+
+from .batch import FrameBatch, _Groups, _period, _rate
+from .timing import RateTracker
+from .payload import ProfileSet, _payload_finding
+from .policy import BLACKLISTED, UNEXPECTED, IdPolicy, PolicyHolder, compile_policy
+from .registry import RulePipeline, register_rule
+from ..frame import event_frame
+
+_NAN = float("nan")
+
 
 def _extract_can_fields(event: Dict[str, Any]) -> Tuple[int, str]:
     """Best-effort parse to get CAN ID and data hex from various event payloads.
     Returns (can_id, data_hex) where can_id = -1 if unknown.
     """
-    # Structured fields first
-    can_id = event.get("can_id")
-    data_hex = event.get("data_hex") or event.get("data")
+    frame = event_frame(event)
+    if frame is None:
+        return -1, event.get("data_hex") or event.get("data") or ""
+    return frame.can_id, frame.data_hex
 
-    if can_id is not None:
-        try:
-            return int(can_id), (data_hex or "")
-        except Exception:
-            pass
 
-    # Try to parse from string form like "CAN(id=0x123, data=01020304..."
-    pkt_str = event.get("packet") or event.get("details") or ""
-    if "CAN(" in pkt_str and "id=" in pkt_str:
-        try:
-            # Extract hex id after id=
-            seg = pkt_str.split("id=")[1]
-            # Allow formats 0x123) or 0x123,
-            hex_part = seg.split(")")[0].split(",")[0].strip()
-            if hex_part.startswith("0x"):
-                can_id = int(hex_part, 16)
-            else:
-                can_id = int(hex_part)
-        except Exception:
-            can_id = -1
-        try:
-            if "data=" in pkt_str:
-                dseg = pkt_str.split("data=")[1]
-                data_hex = dseg.split(",")[0].split(")")[0].strip()
-            else:
-                data_hex = ""
-        except Exception:
-            data_hex = ""
-        return can_id if can_id is not None else -1, data_hex or ""
+def _event_can_id(event: Dict[str, Any]) -> int:
+    # Hot path for rules: the frame is parsed once per event and cached on it
+    frame = event.get("frame") or event_frame(event)
+    return frame.can_id if frame is not None else -1
+
+
+def _unexpected_id_finding(can_id: int, ev: Dict[str, Any], blacklisted: bool) -> Dict[str, Any]:
+    if blacklisted:
+        return {
+            "rule_id": "UNEXPECTED_ID_BLACKLIST",
+            "title": "Blacklisted CAN ID observed",
+            "severity": "high",
+            "affected_id": hex(can_id),
+            "description": f"Observed blacklisted CAN ID {hex(can_id)}",
+            "evidence": ev,
+        }
+    return {
+        "rule_id": "UNEXPECTED_ID",
+        "title": "Unexpected CAN ID",
+        "severity": "medium",
+        "affected_id": hex(can_id),
+        "description": f"Observed unexpected CAN ID {hex(can_id)} not in whitelist",
+        "evidence": ev,
+    }
 
-    return -1, data_hex or ""
 
+def _injection_finding(can_id: int, ev: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "rule_id": "INJECTION_POSSIBLE",
+        "title": "CAN frame injection succeeded",
+        "severity": "high",
+        "affected_id": hex(can_id) if can_id != -1 else None,
+        "description": "Injection of a crafted CAN frame succeeded; review network filtering and security gateway policies.",
+        "evidence": ev,
+    }
 
-def rule_unexpected_id(events: List[Dict[str, Any]], whitelist=None, blacklist=None) -> List[Dict[str, Any]]:
-    whitelist = set(whitelist or [0x123, 0x456])
-    blacklist = set(blacklist or [0x7DF, 0x6F1])
+
+def rule_unexpected_id(events: List[Dict[str, Any]], whitelist=None, blacklist=None,
+                       policy: Optional[IdPolicy] = None) -> List[Dict[str, Any]]:
+    if policy is None:
+        policy = IdPolicy({"whitelist": whitelist, "blacklist": blacklist})
+    classify = policy.classify
     findings = []
     for ev in events:
         if ev.get("type") != "sniff":
             continue
-        can_id, _ = _extract_can_fields(ev)
+        can_id = _event_can_id(ev)
         if can_id == -1:
             continue
-        if can_id in blacklist:
-            findings.append({
-                "rule_id": "UNEXPECTED_ID_BLACKLIST",
-                "title": "Blacklisted CAN ID observed",
-                "severity": "high",
-                "affected_id": hex(can_id),
-                "description": f"Observed blacklisted CAN ID {hex(can_id)}",
-                "evidence": ev,
-            })
-        elif can_id not in whitelist:
-            findings.append({
-                "rule_id": "UNEXPECTED_ID",
-                "title": "Unexpected CAN ID",
-                "severity": "medium",
-                "affected_id": hex(can_id),
-                "description": f"Observed unexpected CAN ID {hex(can_id)} not in whitelist",
-                "evidence": ev,
-            })
+        verdict = classify(can_id)
+        if verdict == BLACKLISTED:
+            findings.append(_unexpected_id_finding(can_id, ev, blacklisted=True))
+        elif verdict == UNEXPECTED:
+            findings.append(_unexpected_id_finding(can_id, ev, blacklisted=False))
     return findings
 
 
@@ -78,75 +86,272 @@ def rule_injection_possible(events: List[Dict[str, Any]]) -> List[Dict[str, Any]
     findings = []
     for ev in events:
         if ev.get("type") == "inject" and (ev.get("status") == "success"):
-            can_id, _ = _extract_can_fields(ev)
-            findings.append({
-                "rule_id": "INJECTION_POSSIBLE",
-                "title": "CAN frame injection succeeded",
-                "severity": "high",
-                "affected_id": hex(can_id) if can_id != -1 else None,
-                "description": "Injection of a crafted CAN frame succeeded; review network filtering and security gateway policies.",
-                "evidence": ev,
-            })
+            can_id = _event_can_id(ev)
+            findings.append(_injection_finding(can_id, ev))
     return findings
 
 
-def rule_rate_anomaly(events: List[Dict[str, Any]], threshold: int = 50) -> List[Dict[str, Any]]:
-    ids = []
+def _event_ts(ev: Dict[str, Any]) -> Optional[float]:
+    frame = ev.get("frame")
+    ts = frame.timestamp if frame is not None and frame.timestamp is not None else ev.get("timestamp")
+    if ts is None:
+        return None
+    try:
+        return float(ts)
+    except Exception:
+        return None
+
+
+def _timed_ids(events: List[Dict[str, Any]]) -> Tuple[array, array]:
+    ids, ts = array("I"), array("d")
     for ev in events:
         if ev.get("type") != "sniff":
             continue
-        can_id, _ = _extract_can_fields(ev)
+        can_id = _event_can_id(ev)
         if can_id != -1:
             ids.append(can_id)
-    counts = Counter(ids)
+            t = _event_ts(ev)
+            ts.append(_NAN if t is None else t)
+    return ids, ts
+
+
+def _timing_groups(ids: array, ts: array) -> Optional[_Groups]:
+    # The same vectorized rate/period evaluation as ``batch.analyze_batch``
+    if not ids:
+        return None
+    return _Groups(FrameBatch(np.frombuffer(ids, dtype=np.uint32), np.frombuffer(ts, dtype=np.float64)))
+
+
+def rule_rate_anomaly(events: List[Dict[str, Any]], threshold: int = 50, window: Optional[float] = None) -> List[Dict[str, Any]]:
+    g = _timing_groups(*_timed_ids(events))
+    return _rate(g, threshold, window) if g is not None else []
+
+
+def rule_period_anomaly(events: List[Dict[str, Any]], **period_opts) -> List[Dict[str, Any]]:
+    """Per-ID median periods from timestamped sniff events, with their bursts/gaps."""
+    g = _timing_groups(*_timed_ids(events))
+    return _period(g, **period_opts) if g is not None else []
+
+
+def _profile_set(learn_frames: int = 200, profile: Optional[str] = None) -> ProfileSet:
+    # A saved baseline when configured (and readable), else learn from scratch
+    if profile:
+        try:
+            return ProfileSet.load(profile, learn_frames=learn_frames)
+        except (OSError, ValueError):
+            pass
+    return ProfileSet(learn_frames=learn_frames)
+
+
+def rule_payload_anomaly(events: List[Dict[str, Any]], **payload_opts) -> List[Dict[str, Any]]:
+    """Learn per-ID payload profiles in capture order and report frames that break them."""
+    profiles = _profile_set(**payload_opts)
     findings = []
-    for can_id, cnt in counts.items():
-        if cnt >= threshold:
-            findings.append({
-                "rule_id": "RATE_ANOMALY",
-                "title": "High packet rate for CAN ID",
-                "severity": "medium",
-                "affected_id": hex(can_id),
-                "count": cnt,
-                "description": f"Observed {cnt} frames for CAN ID {hex(can_id)} in a short interval (>= {threshold}).",
-            })
+    for ev in events:
+        if ev.get("type") != "sniff":
+            continue
+        frame = ev.get("frame") or event_frame(ev)
+        if frame is None:
+            continue
+        reasons = profiles.update(frame.can_id, frame.data, frame.dlc)
+        if reasons:
+            f = _payload_finding(frame.can_id, reasons, profiles.get(frame.can_id))
+            f["evidence"] = ev
+            findings.append(f)
     return findings
 
 
-def apply_all(events: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    findings: List[Dict[str, Any]] = []
-    cfg = config or {}
-    wl = cfg.get("whitelist")
-    bl = cfg.get("blacklist")
-    thr = cfg.get("rate_threshold", 50)
-    # Normalize whitelist/blacklist entries that might be strings (e.g., "0x123")
-    def _norm_list(xs):
-        if not xs:
-            return None
-        out = []
-        for v in xs:
-            try:
-                if isinstance(v, str):
-                    out.append(int(v, 16) if v.lower().startswith("0x") else int(v))
-                else:
-                    out.append(int(v))
-            except Exception:
-                continue
-        return out
-    wl = _norm_list(wl)
-    bl = _norm_list(bl)
-
-    # Run rules with config
-    try:
-        findings.extend(rule_unexpected_id(events, whitelist=wl, blacklist=bl))
-    except Exception:
-        pass
-    try:
-        findings.extend(rule_injection_possible(events))
-    except Exception:
-        pass
-    try:
-        findings.extend(rule_rate_anomaly(events, threshold=int(thr)))
-    except Exception:
-        pass
-    return findings
+# Per thread: the batch pipeline of the last policy apply_all ran with
+_batch_pipelines = threading.local()
+
+
+def _batch_pipeline(policy: IdPolicy) -> RulePipeline:
+    cached = getattr(_batch_pipelines, "entry", None)
+    if cached is not None and cached[0] is policy:
+        pipeline = cached[1]
+        # Every call analyzes a capture of its own
+        pipeline.reset()
+        return pipeline
+    pipeline = RulePipeline(PolicyHolder.wrap(policy), batch=True)
+    _batch_pipelines.entry = (policy, pipeline)
+    return pipeline
+
+
+def apply_all(events: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None,
+              policy: Optional[IdPolicy] = None, pipeline: Optional[RulePipeline] = None) -> List[Dict[str, Any]]:
+    """Run every enabled registered rule over ``events`` in one pass.
+
+    Callers holding a precompiled policy skip the per-call settings parse and
+    reuse one pipeline per thread while the policy stays the same. Pass a
+    fresh batch ``pipeline`` to read its per-rule stats afterwards.
+    """
+    if pipeline is None:
+        pipeline = _batch_pipeline(policy if policy is not None else compile_policy(config))
+    return pipeline.run(events)
+
+
+# ---------------------------------------------------------------------------
+# Streaming rules
+#
+# Stateful counterparts of the batch rules above. Each one is fed a single
+# event at a time and returns the findings that event triggered, so callers
+# can surface findings while a capture is still running. State is kept per
+# rule and is bounded independently of how long the stream runs.
+# ---------------------------------------------------------------------------
+
+
+class StreamingUnexpectedId:
+    def __init__(self, policy: PolicyHolder):
+        self.policy = policy
+
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if ev.get("type") != "sniff":
+            return []
+        can_id = _event_can_id(ev)
+        if can_id == -1:
+            return []
+        # Read the holder on every frame so settings updates apply mid-stream
+        verdict = self.policy.current.classify(can_id)
+        if verdict == BLACKLISTED:
+            return [_unexpected_id_finding(can_id, ev, blacklisted=True)]
+        if verdict == UNEXPECTED:
+            return [_unexpected_id_finding(can_id, ev, blacklisted=False)]
+        return []
+
+
+class StreamingInjection:
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if ev.get("type") == "inject" and ev.get("status") == "success":
+            can_id = _event_can_id(ev)
+            return [_injection_finding(can_id, ev)]
+        return []
+
+
+class StreamingTiming:
+    """Sliding-window rate and per-ID period (burst/gap) detection.
+
+    Uses the capture ``timestamp`` of each frame when present, falling back to
+    the local monotonic clock. See ``timing.RateTracker`` for the detectors.
+    """
+
+    def __init__(self, policy: PolicyHolder, max_ids: int = 4096):
+        self.policy = policy
+        current = policy.current
+        self._version = current.version
+        self.tracker = RateTracker(
+            threshold=current.rate_threshold, window=current.rate_window, max_ids=max_ids, **current.period_opts
+        )
+        self._last_check: Optional[float] = None
+
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if ev.get("type") != "sniff":
+            return []
+        can_id = _event_can_id(ev)
+        if can_id == -1:
+            return []
+        current = self.policy.current
+        if current.version != self._version:
+            self._version = current.version
+            self.tracker.configure(current.rate_threshold, current.rate_window, **current.period_opts)
+        ts = _event_ts(ev)
+        now = ts if ts is not None else time.monotonic()
+        findings = self.tracker.update(can_id, now)
+        # Sweep for silent IDs about once per window, driven by frame time
+        if self._last_check is None or now < self._last_check:
+            self._last_check = now
+        elif now - self._last_check >= self.tracker.window:
+            self._last_check = now
+            findings.extend(self.tracker.check_gaps(now))
+        return findings
+
+
+class BatchTiming:
+    """Whole-capture rate and period detection (``rule_rate_anomaly`` and
+    ``rule_period_anomaly``) collected in the same pass as the other rules.
+
+    Frames are kept as two flat arrays (12 bytes per frame) and evaluated by
+    ``batch.py``'s vectorized rules, so the findings match ``analyze_batch``:
+    one per rule and ID, periods from the median interval. Without timestamps
+    on every frame the rate falls back to a per-ID count over the whole
+    capture and no periods are learned.
+    """
+
+    def __init__(self, policy: PolicyHolder):
+        self.policy = policy
+        self.ids = array("I")
+        self.ts = array("d")
+
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if ev.get("type") != "sniff":
+            return []
+        can_id = _event_can_id(ev)
+        if can_id != -1:
+            self.ids.append(can_id)
+            ts = _event_ts(ev)
+            self.ts.append(_NAN if ts is None else ts)
+        return []
+
+    def finish(self) -> List[Dict[str, Any]]:
+        current = self.policy.current
+        g = _timing_groups(self.ids, self.ts)
+        self.ids, self.ts = array("I"), array("d")
+        if g is None:
+            return []
+        findings = _rate(g, current.rate_threshold, current.rate_window)
+        findings.extend(_period(g, **current.period_opts))
+        return findings
+
+
+class StreamingPayload:
+    """Per-ID payload profiling; see ``payload.ProfileSet``.
+
+    Learned profiles survive settings updates unless the payload settings
+    themselves (learning length, baseline file) change.
+    """
+
+    def __init__(self, policy: PolicyHolder, max_ids: int = 4096):
+        self.policy = policy
+        self.max_ids = max_ids
+        current = policy.current
+        self._version = current.version
+        self._opts = current.payload_opts
+        self.profiles = self._load(self._opts)
+
+    def _load(self, opts: Dict[str, Any]) -> ProfileSet:
+        profiles = _profile_set(**opts)
+        profiles.max_ids = self.max_ids
+        return profiles
+
+    def feed(self, ev: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if ev.get("type") != "sniff":
+            return []
+        frame = ev.get("frame") or event_frame(ev)
+        if frame is None:
+            return []
+        current = self.policy.current
+        if current.version != self._version:
+            self._version = current.version
+            if current.payload_opts != self._opts:
+                self._opts = current.payload_opts
+                self.profiles = self._load(self._opts)
+        reasons = self.profiles.update(frame.can_id, frame.data, frame.dlc)
+        if not reasons:
+            return []
+        f = _payload_finding(frame.can_id, reasons, self.profiles.get(frame.can_id))
+        f["evidence"] = ev
+        return [f]
+
+
+register_rule("unexpected_id", StreamingUnexpectedId,
+              description="CAN IDs outside the whitelist or on the blacklist")
+register_rule("injection", StreamingInjection, event_types=("inject",), fields=(), uses_policy=False,
+              description="Injected frames the bus accepted")
+register_rule("timing", StreamingTiming, batch=BatchTiming,
+              description="Sliding-window rate and learned-period bursts/gaps")
+register_rule("payload", StreamingPayload,
+              description="Payloads outside the learned per-ID profile")
+
+
+def build_streaming_rules(policy: PolicyHolder) -> List[Any]:
+    """Instances of the enabled registered rules (see ``registry.RulePipeline``)."""
+    return list(RulePipeline(policy).rules.values())
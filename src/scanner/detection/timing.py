@@ -0,0 +1,201 @@
+"""Per-ID timing state for rate and inter-arrival (period) detection.
+
+Every tracked CAN ID keeps a fixed amount of state: a ring buffer holding the
+timestamps of the last ``threshold`` frames (sliding-window rate) and a pair of
+exponentially weighted moving averages of the inter-arrival time (learned
+period baseline plus a fast short-term estimate). Updates are O(1) per frame and
+the number of tracked IDs is capped, so memory does not grow with capture length.
+"""
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class IdTiming:
+    __slots__ = (
+        "ring", "pos", "filled", "last_ts", "period", "dev", "fast",
+        "samples", "last_rate_alert", "last_burst_alert", "gap_reported",
+    )
+
+    def __init__(self, ring_size: int):
+        self.ring = array("d", bytes(8 * ring_size))
+        self.pos = 0
+        self.filled = 0
+        self.last_ts: Optional[float] = None
+        self.period: Optional[float] = None  # learned baseline (slow EWMA)
+        self.dev = 0.0                       # EWMA of |dt - period|
+        self.fast: Optional[float] = None    # short-term EWMA of dt
+        self.samples = 0
+        self.last_rate_alert = float("-inf")
+        self.last_burst_alert = float("-inf")
+        self.gap_reported = False
+
+
+class RateTracker:
+    """Sliding-window rate plus learned-period burst/gap detector.
+
+    - ``RATE_ANOMALY``: ``threshold`` frames for one ID within ``window`` seconds.
+    - ``PERIOD_BURST``: after ``min_samples`` intervals the short-term period drops
+      below ``burst_ratio`` x the learned baseline (typical of injected frames).
+    - ``PERIOD_GAP``: a frame arrives (or ``check_gaps`` runs) more than
+      ``gap_factor`` x the baseline after the previous one, i.e. frames went missing.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 50,
+        window: float = 1.0,
+        alpha: float = 0.05,
+        fast_alpha: float = 0.3,
+        min_samples: int = 20,
+        burst_ratio: float = 0.5,
+        gap_factor: float = 3.0,
+        max_ids: int = 4096,
+    ):
+        self.threshold = max(1, int(threshold))
+        self.window = float(window)
+        self.alpha = alpha
+        self.fast_alpha = fast_alpha
+        self.min_samples = min_samples
+        self.burst_ratio = burst_ratio
+        self.gap_factor = gap_factor
+        self.max_ids = max_ids
+        self._ids: "OrderedDict[int, IdTiming]" = OrderedDict()
+
+    def configure(self, threshold: Optional[int] = None, window: Optional[float] = None, **opts):
+        """Apply new settings in place, keeping learned period baselines."""
+        if threshold is not None and max(1, int(threshold)) != self.threshold:
+            self.threshold = max(1, int(threshold))
+            for st in self._ids.values():
+                st.ring = array("d", bytes(8 * self.threshold))
+                st.pos = 0
+                st.filled = 0
+        if window is not None:
+            self.window = float(window)
+        for key, value in opts.items():
+            if key in ("alpha", "fast_alpha", "min_samples", "burst_ratio", "gap_factor", "max_ids"):
+                setattr(self, key, value)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def baseline(self, can_id: int) -> Optional[float]:
+        st = self._ids.get(can_id)
+        return st.period if st is not None and st.samples >= self.min_samples else None
+
+    def update(self, can_id: int, ts: float) -> List[Dict[str, Any]]:
+        ids = self._ids
+        st = ids.get(can_id)
+        if st is None:
+            if len(ids) >= self.max_ids:
+                ids.popitem(last=False)  # evict the least recently seen ID
+            st = ids[can_id] = IdTiming(self.threshold)
+        else:
+            ids.move_to_end(can_id)
+        findings: List[Dict[str, Any]] = []
+
+        # Sliding-window rate: the ring holds the last `threshold` timestamps; once
+        # it is full, the next slot to overwrite is the oldest of them.
+        ring = st.ring
+        ring[st.pos] = ts
+        st.pos = (st.pos + 1) % self.threshold
+        if st.filled < self.threshold:
+            st.filled += 1
+        oldest = ring[st.pos]
+        if st.filled == self.threshold and ts - oldest <= self.window and ts - st.last_rate_alert >= self.window:
+            st.last_rate_alert = ts
+            findings.append(_rate_finding(can_id, self.threshold, self.threshold, self.window))
+
+        last = st.last_ts
+        st.last_ts = ts
+        if last is None or ts < last:
+            return findings
+        dt = ts - last
+        learned = st.samples >= self.min_samples
+
+        if learned and st.period and dt > self.gap_factor * st.period and dt > st.period + 4 * st.dev:
+            if not st.gap_reported:
+                findings.append(_gap_finding(can_id, dt, st.period))
+            st.gap_reported = False
+            # Don't let a gap drag the baseline; restart the short-term estimate
+            st.fast = st.period
+            return findings
+        st.gap_reported = False
+
+        st.fast = dt if st.fast is None else st.fast + self.fast_alpha * (dt - st.fast)
+        if learned and st.period and st.fast < self.burst_ratio * st.period:
+            if ts - st.last_burst_alert >= self.window:
+                st.last_burst_alert = ts
+                findings.append(_burst_finding(can_id, st.fast, st.period))
+            # Keep the baseline from adapting to the attack
+            return findings
+
+        if st.period is None:
+            st.period = dt
+        else:
+            err = dt - st.period
+            st.period += self.alpha * err
+            st.dev += self.alpha * (abs(err) - st.dev)
+        st.samples += 1
+        return findings
+
+    def check_gaps(self, now: float) -> List[Dict[str, Any]]:
+        """Report IDs that have gone silent for longer than their gap threshold.
+
+        Runs in O(tracked IDs); call it periodically (e.g. once per second) so
+        missing frames are noticed even when the ID never comes back.
+        """
+        findings = []
+        for can_id, st in self._ids.items():
+            if st.gap_reported or st.last_ts is None or st.samples < self.min_samples or not st.period:
+                continue
+            dt = now - st.last_ts
+            if dt > self.gap_factor * st.period and dt > st.period + 4 * st.dev:
+                st.gap_reported = True
+                findings.append(_gap_finding(can_id, dt, st.period))
+        return findings
+
+
+def _rate_finding(can_id: int, cnt: int, threshold: int, window: Optional[float] = None) -> Dict[str, Any]:
+    interval = f"within {window:g}s" if window else "in a short interval"
+    return {
+        "rule_id": "RATE_ANOMALY",
+        "title": "High packet rate for CAN ID",
+        "severity": "medium",
+        "affected_id": hex(can_id),
+        "count": cnt,
+        "window_count": cnt,
+        "description": f"Observed {cnt} frames for CAN ID {hex(can_id)} {interval} (>= {threshold}).",
+    }
+
+
+def _burst_finding(can_id: int, period: float, baseline: float) -> Dict[str, Any]:
+    return {
+        "rule_id": "PERIOD_BURST",
+        "title": "CAN ID sent faster than its learned period",
+        "severity": "high",
+        "affected_id": hex(can_id),
+        "period_ms": round(period * 1000, 3),
+        "baseline_ms": round(baseline * 1000, 3),
+        "description": (
+            f"CAN ID {hex(can_id)} is arriving every {period * 1000:.1f}ms against a learned period of "
+            f"{baseline * 1000:.1f}ms; possible frame injection."
+        ),
+    }
+
+
+def _gap_finding(can_id: int, gap: float, baseline: float) -> Dict[str, Any]:
+    missing = max(1, int(round(gap / baseline)) - 1)
+    return {
+        "rule_id": "PERIOD_GAP",
+        "title": "Missing frames for periodic CAN ID",
+        "severity": "medium",
+        "affected_id": hex(can_id),
+        "gap_ms": round(gap * 1000, 3),
+        "baseline_ms": round(baseline * 1000, 3),
+        "missing": missing,
+        "description": (
+            f"No frame for CAN ID {hex(can_id)} for {gap * 1000:.1f}ms (learned period {baseline * 1000:.1f}ms, "
+            f"~{missing} frame(s) missing); possible bus-off or suppression attack."
+        ),
+    }
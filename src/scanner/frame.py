@@ -0,0 +1,149 @@
+"""Compact CAN frame representation shared by capture, detection and reporting.
+
+Frames are parsed once where they enter the system (sniffer, injector, replay)
+and travel inside event dicts under the ``"frame"`` key. Rules read the fields
+directly instead of stringifying and re-parsing packets, and serializers expand
+the frame into flat JSON fields only at the edge.
+"""
+from typing import Any, Dict, Optional
+
+CAN_SFF_MASK = 0x7FF
+CAN_EFF_MASK = 0x1FFFFFFF
+
+
+class CanFrame:
+    __slots__ = ("can_id", "dlc", "data", "timestamp", "extended")
+
+    def __init__(self, can_id: int, data: bytes = b"", timestamp: Optional[float] = None,
+                 dlc: Optional[int] = None, extended: Optional[bool] = None):
+        self.can_id = int(can_id)
+        self.data = bytes(data)
+        self.dlc = len(self.data) if dlc is None else int(dlc)
+        self.timestamp = timestamp
+        self.extended = self.can_id > CAN_SFF_MASK if extended is None else bool(extended)
+
+    @property
+    def data_hex(self) -> str:
+        return self.data.hex()
+
+    def summary(self) -> str:
+        return f"CAN(id={hex(self.can_id)}, dlc={self.dlc}, data={self.data.hex()})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "can_id": self.can_id,
+            "dlc": self.dlc,
+            "data_hex": self.data.hex(),
+            "timestamp": self.timestamp,
+            "packet": self.summary(),
+        }
+
+    def __repr__(self) -> str:
+        return self.summary()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CanFrame):
+            return NotImplemented
+        return (self.can_id, self.data, self.dlc, self.timestamp) == (other.can_id, other.data, other.dlc, other.timestamp)
+
+    __hash__ = None
+
+    @classmethod
+    def from_scapy(cls, pkt, layer_cls=None) -> Optional["CanFrame"]:
+        """Build a frame from a scapy packet carrying a CAN layer, else None."""
+        try:
+            layer = pkt[layer_cls] if layer_cls is not None else pkt
+            can_id = int(layer.identifier)
+            data = bytes(getattr(layer, "data", b"") or b"")
+            length = getattr(layer, "length", None)
+            flags = getattr(layer, "flags", 0)
+            ts = getattr(pkt, "time", None)
+            return cls(
+                can_id,
+                data,
+                timestamp=float(ts) if ts is not None else None,
+                dlc=int(length) if length is not None else None,
+                extended=bool(int(flags) & 0x4) or can_id > CAN_SFF_MASK,
+            )
+        except Exception:
+            return None
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["CanFrame"]:
+        """Parse the legacy ``CAN(id=0x123, data=01020304, ...)`` string form."""
+        if not text or "CAN(" not in text or "id=" not in text:
+            return None
+        try:
+            seg = text.split("id=", 1)[1]
+            # Allow formats 0x123) or 0x123,
+            hex_part = seg.split(")")[0].split(",")[0].strip()
+            can_id = int(hex_part, 16) if hex_part.lower().startswith("0x") else int(hex_part)
+        except Exception:
+            return None
+        data = b""
+        if "data=" in text:
+            try:
+                dseg = text.split("data=", 1)[1]
+                data = bytes.fromhex(dseg.split(",")[0].split(")")[0].strip())
+            except Exception:
+                data = b""
+        return cls(can_id, data)
+
+
+def _to_bytes(data_hex) -> bytes:
+    if isinstance(data_hex, (bytes, bytearray)):
+        return bytes(data_hex)
+    try:
+        return bytes.fromhex(data_hex or "")
+    except Exception:
+        return b""
+
+
+def event_frame(event: Dict[str, Any]) -> Optional[CanFrame]:
+    """Return the frame carried by an event, parsing and caching it on first use.
+
+    Structured fields (``can_id``/``data_hex``) win over the legacy ``packet``
+    string. The result is stored back under ``"frame"`` so every later rule
+    gets it for free; events without a recognizable CAN frame return None.
+    """
+    frame = event.get("frame")
+    if frame is not None:
+        return frame
+    can_id = event.get("can_id")
+    if can_id is not None:
+        try:
+            ts = event.get("timestamp")
+            frame = CanFrame(
+                int(can_id),
+                _to_bytes(event.get("data_hex") or event.get("data")),
+                timestamp=float(ts) if ts is not None else None,
+                dlc=event.get("dlc"),
+            )
+        except Exception:
+            frame = None
+    else:
+        frame = CanFrame.parse(event.get("packet") or event.get("details") or "")
+    if frame is not None:
+        event["frame"] = frame
+    return frame
+
+
+def event_to_dict(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten an event for JSON output: frame fields are lifted to the top level."""
+    frame = event.get("frame")
+    if frame is None:
+        return event
+    out = frame.to_dict()
+    for k, v in event.items():
+        if k != "frame" and v is not None:
+            out[k] = v
+    return out
+
+
+def json_default(obj):
+    """``default=`` hook for ``json.dumps`` so findings/evidence with frames serialize."""
+    if isinstance(obj, CanFrame):
+        return obj.to_dict()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
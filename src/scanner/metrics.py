@@ -0,0 +1,340 @@
+"""Process metrics in the Prometheus text exposition format, without dependencies.
+
+Metrics are module-level objects created once through ``counter()``,
+``gauge()`` and ``histogram()`` (creating an existing name returns it), so hot
+paths bind a labelled child up front and pay one locked add per update::
+
+    FRAMES = counter("can_frames_captured_total", "Frames captured", ("interface",))
+    frames = FRAMES.labels("vcan0")
+    frames.inc()
+
+Values that already live elsewhere (queue depths, per-rule counters) are not
+copied on every change: ``register_collector(fn)`` adds a callback run at
+scrape time that returns ``Sample`` families. ``exposition()`` renders
+everything for a ``/metrics`` endpoint.
+
+``SamplingProfiler`` is a stack sampler for one or more threads (stdlib only,
+``sys._current_frames``); its output is the folded-stack format that
+flamegraph tools read.
+"""
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds: 10 µs .. 10 s
+DEFAULT_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_INF = float("inf")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == _INF:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist: _HistogramValue):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new(self):
+        return _Value()
+
+    def labels(self, *values: Any):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new())
+        return child
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_num(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            # Unlabelled: skip a call level on the hot path
+            self.inc = self._default.inc
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != _INF))
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            self.observe = self._default.observe
+
+    def _new(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def samples(self) -> List[str]:
+        out = []
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (_INF,), counts):
+                cumulative += count
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+class Sample:
+    """One metric family returned by a collector: ``values`` maps label values to a number."""
+
+    __slots__ = ("name", "kind", "help", "labelnames", "values")
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: Sequence[str] = (),
+                 values: Optional[Dict[Tuple[Any, ...], float]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = values if values is not None else {}
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_num(v)}" for key, v in self.values.items()]
+
+
+_METRICS: Dict[str, Metric] = {}
+_COLLECTORS: List[Callable[[], Iterable[Sample]]] = []
+_registry_lock = threading.Lock()
+
+
+def _get(cls, name: str, help: str, labelnames: Sequence[str], **kwargs) -> Any:
+    with _registry_lock:
+        metric = _METRICS.get(name)
+        if metric is None:
+            metric = _METRICS[name] = cls(name, help, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name!r} is already registered with another type or labels")
+        return metric
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _get(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _get(Gauge, name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def register_collector(fn: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+    """Run ``fn`` at every scrape; usable as a decorator."""
+    with _registry_lock:
+        if fn not in _COLLECTORS:
+            _COLLECTORS.append(fn)
+    return fn
+
+
+def unregister_collector(fn: Callable[[], Iterable[Sample]]):
+    with _registry_lock:
+        if fn in _COLLECTORS:
+            _COLLECTORS.remove(fn)
+
+
+def exposition() -> str:
+    """All metrics and collector samples in the Prometheus text format (version 0.0.4)."""
+    with _registry_lock:
+        families: List[Any] = list(_METRICS.values())
+        collectors = list(_COLLECTORS)
+    for fn in collectors:
+        try:
+            families.extend(fn())
+        except Exception:  # a failing collector must not break the scrape
+            continue
+    lines = []
+    for fam in families:
+        lines.append(f"# HELP {fam.name} {fam.help}")
+        lines.append(f"# TYPE {fam.name} {fam.kind}")
+        lines.extend(fam.samples())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SamplingProfiler:
+    """Sample the stacks of ``threads`` (idents; default the calling thread) every ``interval`` seconds.
+
+    Runs on its own daemon thread between ``start()`` and ``stop()``; the
+    sampled threads are not slowed down beyond the GIL handoff per sample.
+    ``folded()`` returns ``"outer;inner;leaf count"`` lines and ``top()`` the
+    functions with the most samples at the top of the stack.
+    """
+
+    def __init__(self, threads: Optional[Iterable[int]] = None, interval: float = 0.005, max_depth: int = 64):
+        self.threads = set(threads) if threads is not None else {threading.get_ident()}
+        self.interval = max(0.0005, float(interval))
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.elapsed = 0.0
+        self._stacks: "_Tally[str]" = _Tally()
+        self._leaves: "_Tally[str]" = _Tally()
+        self._halt = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        if self._thread is None:
+            self.started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._halt.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self.threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if names:
+                    self._leaves[names[0]] += 1
+                    self._stacks[";".join(reversed(names))] += 1
+                    self.samples += 1
+
+    def stop(self) -> "SamplingProfiler":
+        if self._thread is not None and not self._halt.is_set():
+            self._halt.set()
+            self._thread.join()
+            self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {n}" for stack, n in self._stacks.most_common())
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        total = self.samples or 1
+        return [{"function": name, "samples": n, "share": round(n / total, 4)}
+                for name, n in self._leaves.most_common(limit)]
+
+    def to_dict(self, limit: int = 20) -> Dict[str, Any]:
+        return {"interval": self.interval, "samples": self.samples, "elapsed": round(self.elapsed, 3),
+                "top": self.top(limit)}
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
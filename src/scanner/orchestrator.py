@@ -0,0 +1,413 @@
+"""Run many scans at once across several CAN interfaces.
+
+``ScanOrchestrator`` owns a fixed pool of worker threads fed from a bounded
+job queue. Each submitted scan becomes a ``ScanJob`` with its own scan id,
+``VulnerabilityScanner`` (so its own capture) and ``DetectionEngine``; capture
+spends its time blocked in the kernel, so threads run buses in parallel
+without a process per bus. Jobs can be cancelled while queued or running
+(running captures are stopped through ``VulnerabilityScanner.stop``).
+
+Findings stay per job (``job.findings``, tagged with the interface) and
+``merge_findings`` combines them across buses per (rule_id, affected_id).
+
+Every job also records what it emits (``result``/``finding`` messages, then
+``error`` and ``done``) in an ``EventRing``: a bounded log with increasing
+sequence numbers, so a client that disconnects can resume from the last
+sequence it saw instead of starting a new scan. Only the newest ``log_size``
+messages are kept; readers that fall further behind are told how many they
+missed.
+
+The ``profile`` option samples the worker thread's stack while the job runs
+(``metrics.SamplingProfiler``; ``True`` or a sample interval in seconds) and
+leaves the result in ``job.profile``.
+"""
+import asyncio
+import queue
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .scanner import VulnerabilityScanner
+from .detection.engine import DetectionEngine
+from .detection.policy import PolicyHolder
+from .metrics import Sample, SamplingProfiler, counter, histogram, register_collector
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# Default stack sample interval for profiled jobs
+PROFILE_INTERVAL = 0.005
+
+SCAN_JOBS = counter("scan_jobs_total", "Scan jobs finished, by status", ("status",))
+SCAN_SECONDS = histogram("scan_job_seconds", "Run time of scan jobs", buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+
+_ORCHESTRATORS: "weakref.WeakSet[ScanOrchestrator]" = weakref.WeakSet()
+
+
+@register_collector
+def _job_samples() -> List[Sample]:
+    waiting = running = 0
+    for orch in list(_ORCHESTRATORS):
+        waiting += orch._queue.qsize()
+        running += sum(1 for job in orch.jobs() if job.status == RUNNING)
+    return [
+        Sample("scan_jobs_queued", "gauge", "Scan jobs waiting for a worker", values={(): waiting}),
+        Sample("scan_jobs_running", "gauge", "Scan jobs running", values={(): running}),
+    ]
+
+
+class EventRing:
+    """Bounded, sequence-numbered message log written by one thread, read by many.
+
+    ``read(offset)`` returns the kept messages with sequence >= ``offset`` and
+    how many older ones were already evicted. Readers block in ``wait`` or
+    await ``wait_async`` until a message past their offset arrives or the log
+    is closed.
+    """
+
+    def __init__(self, maxlen: int = 4096):
+        self._items: "deque[Tuple[int, Dict[str, Any]]]" = deque(maxlen=max(1, maxlen))
+        self._next = 0
+        self.closed = False
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @property
+    def first(self) -> int:
+        """Sequence of the oldest kept message."""
+        return self._next - len(self._items)
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence the next message will get (== messages appended so far)."""
+        return self._next
+
+    def append(self, item: Dict[str, Any]) -> int:
+        with self._cond:
+            seq = self._next
+            self._items.append((seq, item))
+            self._next += 1
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+        return seq
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    @staticmethod
+    def _wake(waiters):
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+        with self._cond:
+            first = self._next - len(self._items)
+            start = max(offset, first)
+            missed = start - offset if offset < first else 0
+            stop = None if limit is None else start - first + limit
+            return list(islice(self._items, start - first, stop)), missed
+
+    def wait(self, offset: int, timeout: Optional[float] = None) -> bool:
+        """Block until a message with sequence >= ``offset`` exists; False on timeout or close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._next > offset or self.closed, timeout)
+            return self._next > offset
+
+    async def wait_async(self, offset: int, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if self._next > offset or self.closed:
+                return self._next > offset
+            event = asyncio.Event()
+            self._waiters.append((asyncio.get_running_loop(), event))
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            with self._cond:
+                self._waiters = [w for w in self._waiters if w[1] is not event]
+        return self._next > offset
+
+
+class ScanJob:
+    """One scan of one interface; fields are updated by the worker running it."""
+
+    def __init__(self, interface: str, options: Optional[Dict[str, Any]] = None, scan_id: Optional[str] = None,
+                 keep_events: bool = False, log_size: int = 4096):
+        self.scan_id = scan_id or uuid.uuid4().hex
+        self.interface = interface
+        self.options = dict(options or {})
+        self.keep_events = keep_events
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.event_count = 0
+        self.events: List[Dict[str, Any]] = []
+        self.log = EventRing(log_size)
+        self._findings: Dict[str, Dict[str, Any]] = {}
+        self.scanner: Optional[VulnerabilityScanner] = None
+        self.profile: Optional[SamplingProfiler] = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def findings(self) -> List[Dict[str, Any]]:
+        return list(self._findings.values())
+
+    def add_finding(self, finding: Dict[str, Any]):
+        # Later rollups of the same group replace earlier ones
+        finding["interface"] = self.interface
+        self._findings[finding.get("finding_id") or str(len(self._findings))] = finding
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        scanner = self.scanner
+        if scanner is not None:
+            scanner.stop()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+        SCAN_JOBS.labels(status).inc()
+        if self.started is not None:
+            SCAN_SECONDS.observe(self.finished - self.started)
+        if error is not None:
+            self.log.append({"event": "error", "payload": {"type": "scan", "status": "failed", "error": error}})
+        self.log.append({"event": "done", "payload": {"scan_id": self.scan_id, "status": status}})
+        self.log.close()
+        self._done.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scan_id": self.scan_id,
+            "interface": self.interface,
+            "status": self.status,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "events": self.event_count,
+            "findings": len(self._findings),
+            "offset": self.log.next_seq,
+        }
+
+
+def merge_findings(jobs: Iterable[ScanJob]) -> List[Dict[str, Any]]:
+    """Combine per-bus findings per (rule_id, affected_id), summing counts."""
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for job in jobs:
+        for f in job.findings:
+            key = (f.get("rule_id"), f.get("affected_id"))
+            m = merged.get(key)
+            if m is None:
+                m = merged[key] = dict(f)
+                m.pop("interface", None)
+                m["interfaces"] = []
+                m["count"] = 0
+            m["interfaces"].append(job.interface)
+            m["count"] += int(f.get("count") or 1)
+            for field, pick in (("first_seen", min), ("last_seen", max)):
+                if f.get(field) is not None:
+                    m[field] = f[field] if m.get(field) is None else pick(m[field], f[field])
+    return list(merged.values())
+
+
+# on_event(job, event, findings) is called on the worker thread for every event
+EventCallback = Callable[[ScanJob, Dict[str, Any], List[Dict[str, Any]]], None]
+
+
+class ScanOrchestrator:
+    """Bounded pool of scan workers.
+
+    ``submit()`` raises ``queue.Full`` once ``max_queue`` jobs are waiting;
+    ``submit_many()`` queues all of its jobs or none.
+    Scan options are passed to ``VulnerabilityScanner.iter_scan`` (``count``,
+    ``timeout``, ``inject``) except ``filters``, which goes to the scanner, and
+    ``source``: a callable taking the scanner and returning the events to
+    analyze instead of a capture (simulations, replays), and ``profile``
+    (see the module docstring). Each job keeps its last ``log_size`` messages
+    in ``job.log``.
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 64, policy: Optional[PolicyHolder] = None,
+                 on_event: Optional[EventCallback] = None, max_jobs: int = 1000, log_size: int = 4096):
+        self.policy = policy if policy is not None else PolicyHolder()
+        self.on_event = on_event
+        self.max_jobs = max_jobs
+        self.log_size = log_size
+        self._queue: "queue.Queue[Optional[ScanJob]]" = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, ScanJob] = {}
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        _ORCHESTRATORS.add(self)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"scan-worker-{i}", daemon=True) for i in range(max_workers)
+        ]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, interface: str, scan_id: Optional[str] = None, keep_events: bool = False,
+               **options) -> ScanJob:
+        job = ScanJob(interface, options, scan_id=scan_id, keep_events=keep_events, log_size=self.log_size)
+        with self._submit_lock:
+            self._enqueue(job)
+        return job
+
+    def submit_many(self, interfaces: Iterable[str], keep_events: bool = False, **options) -> List[ScanJob]:
+        """Submit one job per interface, all or none.
+
+        Raises ``queue.Full`` without queueing anything if the queue cannot
+        take every job.
+        """
+        jobs = [ScanJob(iface, options, keep_events=keep_events, log_size=self.log_size) for iface in interfaces]
+        with self._submit_lock:
+            # Only submitters add to the queue, so the free space can only grow
+            maxsize = self._queue.maxsize
+            if maxsize > 0 and maxsize - self._queue.qsize() < len(jobs):
+                raise queue.Full
+            queued = []
+            try:
+                for job in jobs:
+                    self._enqueue(job)
+                    queued.append(job)
+            except queue.Full:  # e.g. shutdown() took the space meanwhile
+                for job in queued:
+                    job.cancel()
+                with self._lock:
+                    for job in queued:
+                        self._jobs.pop(job.scan_id, None)
+                raise
+        return jobs
+
+    def _enqueue(self, job: ScanJob):
+        self._queue.put_nowait(job)
+        with self._lock:
+            self._jobs[job.scan_id] = job
+            self._prune()
+
+    def _prune(self):
+        # Forget the oldest finished jobs beyond max_jobs
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for scan_id, job in list(self._jobs.items()):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if job.done:
+                del self._jobs[scan_id]
+
+    def get(self, scan_id: str) -> Optional[ScanJob]:
+        return self._jobs.get(scan_id)
+
+    def jobs(self) -> List[ScanJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, scan_id: str) -> bool:
+        job = self._jobs.get(scan_id)
+        if job is None or job.done:
+            return False
+        job.cancel()
+        return True
+
+    def wait(self, jobs: Iterable[ScanJob], timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in jobs:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not job.wait(remaining):
+                return False
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                job._finish(CANCELLED)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                job._finish(FAILED, str(e))
+
+    def _run(self, job: ScanJob):
+        opts = dict(job.options)
+        source = opts.pop("source", None)
+        profile = opts.pop("profile", None)
+        scanner = job.scanner = VulnerabilityScanner(job.interface, filters=opts.pop("filters", None))
+        engine = DetectionEngine(policy=self.policy, injected=scanner.injected)
+        job.status = RUNNING
+        job.started = time.time()
+        if job.cancelled:  # cancelled between dequeue and scanner creation
+            job._finish(CANCELLED)
+            return
+        if profile:
+            interval = PROFILE_INTERVAL if profile is True else float(profile)
+            job.profile = SamplingProfiler(interval=interval).start()
+        try:
+            self._consume(job, scanner, engine, source, opts)
+        finally:
+            if job.profile is not None:
+                job.profile.stop()
+        job._finish(CANCELLED if job.cancelled else COMPLETED)
+
+    def _consume(self, job: ScanJob, scanner: VulnerabilityScanner, engine: DetectionEngine, source, opts):
+        log = job.log
+        events = source(scanner) if source is not None else scanner.iter_scan(**opts)
+        for event in events:
+            if job.cancelled:
+                break
+            job.event_count += 1
+            if job.keep_events:
+                job.events.append(event)
+            log.append({"event": "result", "payload": event})
+            findings = engine.feed(event)
+            for f in findings:
+                job.add_finding(f)
+                log.append({"event": "finding", "payload": f})
+            if self.on_event is not None:
+                self.on_event(job, event, findings)
+        for f in engine.flush():
+            job.add_finding(f)
+            log.append({"event": "finding", "payload": f})
+            if self.on_event is not None:
+                self.on_event(job, None, [f])
+
+    def shutdown(self, wait: bool = True, cancel: bool = False):
+        if cancel:
+            for job in self.jobs():
+                if not job.done:
+                    job.cancel()
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for t in self._workers:
+                t.join()
@@ -1,16 +1,67 @@
+import threading
 import scapy.all as scapy
-from .attacks.sniff import sniff_can_packets
-from .attacks.inject import inject_can_packet
+from .attacks.sniff import CanSniffer, iter_can_packets, sniff_can_packets
+from .attacks.inject import InjectionRecord, inject_can_packet
+
+# How long injection waits for the capture socket before sending anyway
+_LISTEN_TIMEOUT = 2.0
 
 class VulnerabilityScanner:
-    def __init__(self, interface="vcan0"):
+    def __init__(self, interface="vcan0", filters=None):
         self.interface = interface
+        # Kernel-side (can_id, mask) capture filters; None captures everything
+        self.filters = filters
         self.results = []
+        # Frames this scanner injected, for correlation in DetectionEngine
+        self.injected = InjectionRecord()
+        self._sniffer = None
+        self._stopped = False
+
+    def iter_scan(self, count=10, timeout=3, inject=True):
+        """Yield scan events as they are captured, without keeping them.
+
+        ``count=None, timeout=None`` captures until ``stop()`` is called. With
+        ``inject`` the test frame is sent from a thread once the capture is
+        listening, so the capture sees it and detection can match it against
+        ``self.injected``; the ``inject`` event follows the next captured one.
+        """
+        self._sniffer = CanSniffer(self.interface, count=count, timeout=timeout, filters=self.filters)
+        if self._stopped:
+            # stop() came in before the capture existed
+            self._sniffer.stop()
+        injected = []
+        injector = None
+        if inject and not self._stopped:
+            self._sniffer.start()
+            injector = threading.Thread(target=self._inject, args=(self._sniffer, injected), name="scan-inject",
+                                        daemon=True)
+            injector.start()
+        try:
+            for event in iter_can_packets(self.interface, sniffer=self._sniffer):
+                yield event
+                if injector is not None and not injector.is_alive():
+                    injector.join()
+                    injector = None
+                    yield from injected
+        finally:
+            if injector is not None:
+                injector.join()
+        if injector is not None:
+            yield from injected
+
+    def _inject(self, sniffer, out):
+        sniffer.wait_listening(_LISTEN_TIMEOUT)
+        out.extend(inject_can_packet(self.interface, record=self.injected))
+
+    def stop(self):
+        # Safe to call from another thread; ends a continuous capture
+        self._stopped = True
+        if self._sniffer is not None:
+            self._sniffer.stop()
 
     def run_scan(self):
         print(f"Starting scan on {self.interface}...")
-        self.results.extend(sniff_can_packets(self.interface))
-        self.results.extend(inject_can_packet(self.interface))
+        self.results.extend(self.iter_scan())
         return self.results
 
     def get_results(self):
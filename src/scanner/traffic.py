@@ -0,0 +1,287 @@
+"""Synthetic CAN traffic for simulations, tests and benchmarks.
+
+A ``TrafficProfile`` describes a bus as a set of periodic IDs (``IdSpec``:
+period, jitter, DLC and payload style) plus attack ``Burst``s (a spoofed or
+unknown ID sent at a high rate for a while). Frames are generated with NumPy
+one time chunk at a time, so millions of frames cost a few seconds and
+streaming them (``iter_frames``) needs memory for one chunk only. Output is
+reproducible: the same profile, seed and ``chunk_seconds`` always give the
+same frames.
+
+Payload styles:
+
+- ``counter``: byte 0 is a rolling counter (low nibble +1 per frame), the
+  middle bytes a slow signal and the last byte the 8-bit sum of the others,
+  like many ECUs' alive counter/checksum pairs
+- ``signal``: slowly varying bytes, no counter or checksum
+- ``static``: the same bytes every frame
+- ``random``: uniformly random bytes
+
+``send()`` plays frames onto a real (or ``vcan``) interface, paced by their
+timestamps.
+"""
+import math
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .frame import CanFrame
+from .detection.batch import FrameBatch
+
+PAYLOAD_STYLES = ("counter", "signal", "static", "random")
+
+# Transmit periods typical of powertrain/body ECUs, in seconds
+TYPICAL_PERIODS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+CAN_SFF_MASK = 0x7FF
+
+
+class IdSpec:
+    """One periodic ID; ``jitter`` is the standard deviation as a fraction of ``period``."""
+
+    __slots__ = ("can_id", "period", "jitter", "dlc", "payload", "phase")
+
+    def __init__(self, can_id: int, period: float, jitter: float = 0.02, dlc: int = 8, payload: str = "counter",
+                 phase: Optional[float] = None):
+        if payload not in PAYLOAD_STYLES:
+            raise ValueError(f"Unknown payload style {payload!r}; expected one of {', '.join(PAYLOAD_STYLES)}")
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.can_id = int(can_id)
+        self.period = float(period)
+        self.jitter = max(0.0, float(jitter))
+        self.dlc = max(0, min(8, int(dlc)))
+        self.payload = payload
+        self.phase = phase
+
+
+class Burst:
+    """``can_id`` sent at ``rate`` frames/s from ``start`` for ``duration`` seconds (relative to the
+    start of the traffic). ``data`` fixes the payload; random bytes otherwise."""
+
+    __slots__ = ("can_id", "start", "duration", "rate", "data")
+
+    def __init__(self, can_id: int, start: float, duration: float, rate: float = 1000.0, data: Optional[bytes] = None):
+        self.can_id = int(can_id)
+        self.start = float(start)
+        self.duration = float(duration)
+        self.rate = float(rate)
+        self.data = data
+
+
+class TrafficProfile:
+    def __init__(self, ids: Sequence[IdSpec], bursts: Sequence[Burst] = (), seed: int = 0):
+        self.ids = list(ids)
+        self.bursts = list(bursts)
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Fixed per profile: transmit phase, static payloads, signal shape
+        self._phase = np.array([s.phase if s.phase is not None else rng.uniform(0, s.period) for s in self.ids])
+        self._static = rng.integers(0, 256, size=(len(self.ids), 8), dtype=np.uint8)
+        # Whole frames per signal cycle, so a learned baseline covers every value
+        self._signal_period = rng.choice((16, 32, 64), size=len(self.ids))
+
+    @classmethod
+    def default(cls, n_ids: int = 50, seed: int = 0, periods: Sequence[float] = TYPICAL_PERIODS,
+                jitter: float = 0.02, bursts: Sequence[Burst] = ()) -> "TrafficProfile":
+        """``n_ids`` distinct standard IDs with typical periods and a mix of payload styles."""
+        rng = np.random.default_rng(seed)
+        can_ids = rng.choice(np.arange(0x100, CAN_SFF_MASK + 1), size=min(n_ids, CAN_SFF_MASK - 0xFF), replace=False)
+        styles = ("counter", "counter", "signal", "static")
+        ids = [
+            IdSpec(int(can_id), float(rng.choice(periods)), jitter=jitter, dlc=int(rng.choice((8, 8, 8, 4, 2))),
+                   payload=styles[i % len(styles)])
+            for i, can_id in enumerate(sorted(can_ids))
+        ]
+        return cls(ids, bursts, seed=seed)
+
+    @property
+    def rate(self) -> float:
+        """Nominal frames per second without bursts."""
+        return sum(1.0 / s.period for s in self.ids)
+
+    @property
+    def can_ids(self) -> List[int]:
+        return [s.can_id for s in self.ids]
+
+    def _payloads(self, i: int, k: np.ndarray, rng) -> np.ndarray:
+        spec = self.ids[i]
+        n = k.shape[0]
+        if spec.payload == "static":
+            return np.broadcast_to(self._static[i], (n, 8)).copy()
+        if spec.payload == "random":
+            return rng.integers(0, 256, size=(n, 8), dtype=np.uint8)
+        data = np.zeros((n, 8), dtype=np.uint8)
+        wave = (np.sin(2 * np.pi * k / self._signal_period[i]) + 1.0) * 0.5
+        signal = (16 + wave * 96).astype(np.uint8)
+        data[:, :8] = signal[:, None] + np.arange(8, dtype=np.uint8)
+        if spec.payload == "counter" and spec.dlc >= 2:
+            data[:, 0] = (k & 0x0F).astype(np.uint8)
+            last = spec.dlc - 1
+            data[:, last] = (data[:, :last].sum(axis=1, dtype=np.uint32) & 0xFF).astype(np.uint8)
+        return data
+
+    def chunk(self, index: int, chunk_seconds: float = 1.0, start: float = 0.0) -> FrameBatch:
+        """Frames of time chunk ``index`` (``[index, index + 1) * chunk_seconds``), in timestamp order."""
+        t0, t1 = index * chunk_seconds, (index + 1) * chunk_seconds
+        rng = np.random.default_rng([self.seed, index])
+        ids, times, dlcs, datas = [], [], [], []
+        for i, spec in enumerate(self.ids):
+            phase, period = self._phase[i], spec.period
+            k0 = max(0, math.ceil((t0 - phase) / period))
+            k1 = max(0, math.ceil((t1 - phase) / period))
+            if k1 <= k0:
+                continue
+            k = np.arange(k0, k1, dtype=np.int64)
+            ts = phase + k * period
+            if spec.jitter:
+                # Clipped so one ID's frames never swap order
+                ts = ts + np.clip(rng.normal(0.0, spec.jitter * period, k.shape[0]), -0.45 * period, 0.45 * period)
+                # ... nor cross into a neighbouring chunk
+                ts = np.clip(ts, t0, np.nextafter(t1, t0))
+            ids.append(np.full(k.shape[0], spec.can_id, dtype=np.uint32))
+            times.append(ts)
+            dlcs.append(np.full(k.shape[0], spec.dlc, dtype=np.uint8))
+            datas.append(self._payloads(i, k, rng))
+        for burst in self.bursts:
+            lo, hi = max(t0, burst.start), min(t1, burst.start + burst.duration)
+            if hi <= lo:
+                continue
+            step = 1.0 / burst.rate
+            k = np.arange(math.ceil((lo - burst.start) / step), math.ceil((hi - burst.start) / step), dtype=np.int64)
+            if not k.shape[0]:
+                continue
+            ids.append(np.full(k.shape[0], burst.can_id, dtype=np.uint32))
+            times.append(burst.start + k * step)
+            if burst.data is not None:
+                dlc = min(8, len(burst.data))
+                data = np.zeros((k.shape[0], 8), dtype=np.uint8)
+                data[:, :dlc] = np.frombuffer(burst.data[:8], dtype=np.uint8)
+            else:
+                dlc = 8
+                data = rng.integers(0, 256, size=(k.shape[0], 8), dtype=np.uint8)
+            dlcs.append(np.full(k.shape[0], dlc, dtype=np.uint8))
+            datas.append(data)
+        if not ids:
+            return FrameBatch(np.zeros(0, dtype=np.uint32), np.zeros(0))
+        ts = np.concatenate(times)
+        order = np.argsort(ts, kind="stable")
+        data = np.concatenate(datas)[order]
+        dlc = np.concatenate(dlcs)[order]
+        # Bytes past the DLC are not on the wire
+        data[np.arange(8)[None, :] >= dlc[:, None]] = 0
+        return FrameBatch(np.concatenate(ids)[order], ts[order] + start, dlc, data)
+
+    def batches(self, duration: Optional[float] = None, frames: Optional[int] = None, start: float = 0.0,
+                chunk_seconds: float = 1.0) -> Iterator[FrameBatch]:
+        """Chunks covering ``duration`` seconds or ``frames`` frames (endless if neither is set)."""
+        index = 0
+        remaining = frames
+        while True:
+            if duration is not None and index * chunk_seconds >= duration:
+                return
+            batch = self.chunk(index, chunk_seconds, start)
+            if duration is not None and (index + 1) * chunk_seconds > duration:
+                batch = _take(batch, int(np.searchsorted(batch.timestamp, start + duration)))
+            if remaining is not None:
+                if len(batch) >= remaining:
+                    yield _take(batch, remaining)
+                    return
+                remaining -= len(batch)
+            yield batch
+            index += 1
+
+    def generate(self, duration: Optional[float] = None, frames: Optional[int] = None, start: float = 0.0,
+                 chunk_seconds: float = 1.0) -> FrameBatch:
+        """All frames of ``duration`` seconds or the first ``frames`` frames as one batch."""
+        if duration is None and frames is None:
+            raise ValueError("Pass duration or frames")
+        parts = list(self.batches(duration, frames, start, chunk_seconds))
+        return FrameBatch(
+            np.concatenate([b.can_id for b in parts]), np.concatenate([b.timestamp for b in parts]),
+            np.concatenate([b.dlc for b in parts]), np.concatenate([b.data for b in parts]),
+        )
+
+    def iter_frames(self, duration: Optional[float] = None, frames: Optional[int] = None, start: float = 0.0,
+                    chunk_seconds: float = 1.0) -> Iterator[CanFrame]:
+        for batch in self.batches(duration, frames, start, chunk_seconds):
+            yield from batch_frames(batch)
+
+    def iter_events(self, duration: Optional[float] = None, frames: Optional[int] = None, start: float = 0.0,
+                    chunk_seconds: float = 1.0) -> Iterator[dict]:
+        for frame in self.iter_frames(duration, frames, start, chunk_seconds):
+            yield {"type": "sniff", "status": "detected", "frame": frame}
+
+
+def _take(batch: FrameBatch, n: int) -> FrameBatch:
+    return FrameBatch(batch.can_id[:n], batch.timestamp[:n], batch.dlc[:n], batch.data[:n])
+
+
+def batch_frames(batch: FrameBatch) -> Iterator[CanFrame]:
+    can_ids = batch.can_id.tolist()
+    stamps = batch.timestamp.tolist()
+    dlcs = batch.dlc.tolist()
+    rows = batch.data.tobytes()
+    for i, can_id in enumerate(can_ids):
+        dlc = dlcs[i]
+        yield CanFrame(can_id, rows[i * 8:i * 8 + dlc], timestamp=stamps[i], dlc=dlc, extended=can_id > CAN_SFF_MASK)
+
+
+def paced(frames: Iterable[CanFrame], speed: float = 1.0, restamp: bool = False) -> Iterator[CanFrame]:
+    """Yield frames as their timestamps come due (relative to the first), ``speed`` x real time.
+
+    ``restamp`` replaces timestamps with the wall-clock time of release.
+    """
+    first = origin = None
+    for frame in frames:
+        if frame.timestamp is not None:
+            if first is None:
+                first, origin = frame.timestamp, time.monotonic()
+            else:
+                delay = (frame.timestamp - first) / speed - (time.monotonic() - origin)
+                if delay > 0:
+                    time.sleep(delay)
+        if restamp:
+            frame = CanFrame(frame.can_id, frame.data, timestamp=time.time(), dlc=frame.dlc, extended=frame.extended)
+        yield frame
+
+
+def send(interface: str, frames: Iterable[CanFrame], speed: float = 1.0, window: float = 0.005, sock=None) -> dict:
+    """Put ``frames`` on ``interface`` on their timestamp schedule (``speed`` x real time).
+
+    Frames due within the same ``window`` go out in one bulk send. Returns
+    ``sent``, ``dropped`` (socket refused), ``elapsed`` and ``achieved_rate``.
+    """
+    from .attacks.socketcan import open_bulk_socket, pack_frames
+
+    own = sock is None
+    if own:
+        sock = open_bulk_socket(interface)
+    sent = dropped = 0
+    batch: List[CanFrame] = []
+    due = None
+    start = time.perf_counter()
+    try:
+        for frame in paced(frames, speed):
+            now = time.perf_counter()
+            if due is None:
+                due = now + window
+            batch.append(frame)
+            if now >= due:
+                n = sock.send_frames(pack_frames(batch))
+                sent += n
+                dropped += len(batch) - n
+                batch, due = [], None
+        if batch:
+            n = sock.send_frames(pack_frames(batch))
+            sent += n
+            dropped += len(batch) - n
+    finally:
+        if own:
+            close = getattr(sock, "close", None)
+            if close is not None:
+                close()
+    elapsed = time.perf_counter() - start
+    return {"sent": sent, "dropped": dropped, "elapsed": round(elapsed, 6),
+            "achieved_rate": round(sent / elapsed, 1) if elapsed > 0 else 0.0}
@@ -0,0 +1,147 @@
+"""Wire encodings for live streams.
+
+``dumps`` is the JSON encoder for everything the API streams: orjson when it
+is installed (several times faster, native NumPy support), else the standard
+library, with ``frame.json_default`` for frames and bytes either way.
+
+Live messages travel as ``WireEvent`` objects that encode themselves lazily
+and cache the result, so an event is encoded at most once per format however
+many clients receive it. Three formats exist:
+
+- ``json``: one ``{"event", "payload"}`` object per message (the original contract)
+- ``compact``: consecutive frames are batched into one
+  ``{"event": "frames", "fields": [...], "rows": [[timestamp, can_id, dlc, data_hex], ...]}``
+  message without the ``packet`` repr; other messages stay JSON
+- ``binary``: frame batches as packed bytes (WebSocket binary messages)::
+
+    header  <2sBxI   b"CF", version 1, pad, frame count
+    record  <dIB3x8s timestamp (NaN if unknown), can_id (bit 31 = extended), dlc, 3 pad, data[8]
+
+  Records are 24 bytes and 8-byte aligned, so a browser can read them with a
+  ``DataView`` (or a ``Float64Array`` for the timestamps) without copying.
+"""
+import json
+import math
+import struct
+from typing import Any, Dict, Iterable, List, Optional
+
+from .frame import CanFrame, event_to_dict, json_default
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON
+    orjson = None
+
+WIRE_FORMATS = ("json", "compact", "binary")
+
+FRAMES_MAGIC = b"CF"
+FRAMES_VERSION = 1
+FRAMES_HEADER = struct.Struct("<2sBxI")
+FRAME_RECORD = struct.Struct("<dIB3x8s")
+EXTENDED_FLAG = 0x80000000
+
+COMPACT_FIELDS = ["timestamp", "can_id", "dlc", "data_hex"]
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data) -> str:
+        return orjson.dumps(data, default=json_default, option=_ORJSON_OPTS).decode()
+else:
+    def dumps(data) -> str:
+        return json.dumps(data, default=json_default)
+
+
+def pack_frame(frame: CanFrame) -> bytes:
+    can_id = frame.can_id | EXTENDED_FLAG if frame.extended else frame.can_id
+    ts = math.nan if frame.timestamp is None else frame.timestamp
+    return FRAME_RECORD.pack(ts, can_id, min(frame.dlc, 255), frame.data[:8])
+
+
+def pack_batch(records: List[bytes]) -> bytes:
+    return FRAMES_HEADER.pack(FRAMES_MAGIC, FRAMES_VERSION, len(records)) + b"".join(records)
+
+
+def unpack_batch(buf) -> List[CanFrame]:
+    """Decode a binary frame batch (for Python clients and tests)."""
+    magic, version, count = FRAMES_HEADER.unpack_from(buf, 0)
+    if magic != FRAMES_MAGIC or version != FRAMES_VERSION:
+        raise ValueError("Not a frame batch")
+    frames = []
+    for i in range(count):
+        ts, can_id, dlc, data = FRAME_RECORD.unpack_from(buf, FRAMES_HEADER.size + i * FRAME_RECORD.size)
+        extended = bool(can_id & EXTENDED_FLAG)
+        frames.append(CanFrame(can_id & ~EXTENDED_FLAG, data[:min(dlc, 8)], timestamp=None if math.isnan(ts) else ts,
+                               dlc=dlc, extended=extended))
+    return frames
+
+
+class WireEvent:
+    """One live message (``event`` kind and payload) with per-format encodings cached.
+
+    ``frame`` is set for plain captured frames (sniff results), which compact
+    and binary streams batch.
+    """
+
+    __slots__ = ("event", "payload", "frame", "_json", "_row", "_record")
+
+    def __init__(self, event: str, payload: Any = None):
+        self.event = event
+        self.payload = payload
+        frame = None
+        if event == "result" and isinstance(payload, dict) and payload.get("type") == "sniff":
+            frame = payload.get("frame")
+        self.frame: Optional[CanFrame] = frame
+        self._json: Optional[str] = None
+        self._row: Optional[str] = None
+        self._record: Optional[bytes] = None
+
+    def json(self) -> str:
+        if self._json is None:
+            payload = event_to_dict(self.payload) if self.event == "result" else self.payload
+            msg: Dict[str, Any] = {"event": self.event}
+            if payload is not None:
+                msg["payload"] = payload
+            self._json = dumps(msg)
+        return self._json
+
+    def row(self) -> str:
+        if self._row is None:
+            f = self.frame
+            self._row = dumps([f.timestamp, f.can_id, f.dlc, f.data.hex()])
+        return self._row
+
+    def record(self) -> bytes:
+        if self._record is None:
+            self._record = pack_frame(self.frame)
+        return self._record
+
+
+def encode_batch(events: Iterable[WireEvent], fmt: str = "json") -> List[Any]:
+    """Wire messages (``str`` or ``bytes``) for a run of events in ``fmt``.
+
+    Consecutive frames become one batch message in ``compact``/``binary``;
+    everything else, and every message in ``json``, is one JSON text each.
+    """
+    out: List[Any] = []
+    run: List[WireEvent] = []
+
+    def flush():
+        if not run:
+            return
+        if fmt == "binary":
+            out.append(pack_batch([e.record() for e in run]))
+        else:
+            out.append('{"event":"frames","fields":' + dumps(COMPACT_FIELDS) + ',"rows":['
+                       + ",".join(e.row() for e in run) + "]}")
+        run.clear()
+
+    for ev in events:
+        if fmt != "json" and ev.frame is not None:
+            run.append(ev)
+            continue
+        flush()
+        out.append(ev.json())
+    flush()
+    return out
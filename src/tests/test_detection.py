@@ -0,0 +1,320 @@
+import os
+import sys
+import pytest
+
+# Ensure 'src' is importable when running pytest from repo root
+CURRENT_DIR = os.path.dirname(__file__)
+SRC_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from scanner.detection.engine import DetectionEngine
+from scanner.detection.policy import PolicyHolder
+from scanner.frame import CanFrame, event_frame, event_to_dict
+
+
+def _sniff(can_id, ts=None):
+    ev = {"type": "sniff", "status": "detected", "can_id": can_id, "data_hex": "01020304"}
+    if ts is not None:
+        ev["timestamp"] = ts
+    return ev
+
+
+def test_streaming_emits_findings_per_event():
+    engine = DetectionEngine({"whitelist": ["0x123"], "blacklist": ["0x7DF"]})
+    assert engine.feed(_sniff(0x123)) == []
+    found = engine.feed(_sniff(0x7DF))
+    assert [f["rule_id"] for f in found] == ["UNEXPECTED_ID_BLACKLIST"]
+    found = engine.feed({"type": "inject", "status": "success", "can_id": 0x123})
+    assert [f["rule_id"] for f in found] == ["INJECTION_POSSIBLE"]
+
+
+def test_streaming_rate_fires_once_per_window():
+    engine = DetectionEngine({"whitelist": ["0x123"], "rate_threshold": 5, "rate_window": 1.0})
+    findings = engine.feed_many(_sniff(0x123, ts=100.0 + i * 0.01) for i in range(20))
+    assert [f["rule_id"] for f in findings] == ["RATE_ANOMALY"]
+    # Alerts are throttled to one per window per ID
+    findings = engine.feed_many(_sniff(0x123, ts=102.0 + i * 0.01) for i in range(5))
+    assert len(findings) == 1
+
+    # 0 is rejected rather than silently replaced by the default
+    with pytest.raises(ValueError, match="rate_threshold"):
+        PolicyHolder({"rate_threshold": 0})
+    holder = PolicyHolder({"rate_threshold": 1})
+    assert holder.current.rate_threshold == 1 and PolicyHolder().current.rate_threshold == 50
+    with pytest.raises(ValueError):
+        holder.update({"rate_threshold": -5})
+    assert holder.current.rate_threshold == 1
+
+
+def test_period_baseline_detects_burst_and_gap():
+    engine = DetectionEngine({"whitelist": ["0x100"], "rate_threshold": 1000})
+    t = 0.0
+    found = []
+    for _ in range(50):
+        t += 0.1
+        found += engine.feed(_sniff(0x100, ts=t))
+    assert found == []
+    # Injected frames interleaved at 5x the learned rate
+    for _ in range(10):
+        t += 0.02
+        found += engine.feed(_sniff(0x100, ts=t))
+    assert "PERIOD_BURST" in [f["rule_id"] for f in found]
+    # The ID falls silent for a second
+    t += 1.0
+    found = engine.feed(_sniff(0x100, ts=t))
+    assert [f["rule_id"] for f in found] == ["PERIOD_GAP"]
+
+
+def test_legacy_packet_string_parsed_once_into_frame():
+    ev = {"type": "sniff", "status": "detected", "packet": "CAN(id=0x7DF, data=0201, t=1)"}
+    engine = DetectionEngine({"blacklist": ["0x7DF"]})
+    assert [f["rule_id"] for f in engine.feed(ev)] == ["UNEXPECTED_ID_BLACKLIST"]
+    assert ev["frame"] == CanFrame(0x7DF, b"\x02\x01")
+    assert event_frame(ev) is ev["frame"]
+    flat = event_to_dict(ev)
+    assert flat["can_id"] == 0x7DF and flat["data_hex"] == "0201" and "frame" not in flat
+
+
+def test_batch_path_aggregates_per_id():
+    engine = DetectionEngine({"whitelist": ["0x123"], "blacklist": ["0x7DF"], "rate_threshold": 5})
+    events = [_sniff(0x123, ts=i * 0.01) for i in range(10)]
+    events += [_sniff(0x7DF, ts=1.0 + i) for i in range(3)]
+    events += [_sniff(0x18DAF110, ts=5.0)]
+    by_rule = {(f["rule_id"], f["affected_id"]): f for f in engine.analyze_batch(events)}
+    assert by_rule[("UNEXPECTED_ID_BLACKLIST", "0x7df")]["count"] == 3
+    assert by_rule[("UNEXPECTED_ID_BLACKLIST", "0x7df")]["first_seen"] == 1.0
+    assert ("UNEXPECTED_ID", "0x18daf110") in by_rule
+    assert by_rule[("RATE_ANOMALY", "0x123")]["window_count"] == 10
+
+
+def test_list_and_batch_paths_agree_on_rate_and_period():
+    from scanner.detection.batch import FrameBatch, analyze_batch
+    from scanner.detection.policy import compile_policy
+    from scanner.detection.rules import apply_all
+
+    policy = compile_policy({"whitelist": ["0x100", "0x200"], "rate_threshold": 15, "rate_window": 1.0})
+    events = [_sniff(0x100, ts=i * 0.1) for i in range(40)]
+    events += [_sniff(0x100, ts=3.95 + i * 0.01) for i in range(5)] + [_sniff(0x100, ts=6.0)]
+    events += [_sniff(0x200, ts=10.0 + i * 0.1) for i in range(30)]
+
+    def timing(findings):
+        return sorted((f["rule_id"], f["affected_id"], f["count"]) for f in findings)
+
+    found = timing(apply_all(events, policy=policy))
+    assert found == timing(analyze_batch(FrameBatch.from_events(events), policy=policy))
+    assert [r for r, _, _ in found] == ["PERIOD_BURST", "PERIOD_GAP", "RATE_ANOMALY"]
+
+
+def test_policy_ranges_masks_and_hot_reload():
+    holder = PolicyHolder({"whitelist": ["0x100-0x1FF", "0x18DA0000/0x1FFF0000"], "blacklist": ["0x7DF"]})
+    engine = DetectionEngine(policy=holder)
+    assert engine.feed(_sniff(0x1A0)) == []
+    assert engine.feed(_sniff(0x18DAF110)) == []
+    assert [f["rule_id"] for f in engine.feed(_sniff(0x200))] == ["UNEXPECTED_ID"]
+    # Swapping the policy applies to the already running engine
+    holder.update({"whitelist": ["0x200"], "blacklist": ["0x1A0"]})
+    assert engine.feed(_sniff(0x200)) == []
+    assert [f["rule_id"] for f in engine.feed(_sniff(0x1A0))] == ["UNEXPECTED_ID_BLACKLIST"]
+
+
+def test_findings_roll_up_per_rule_and_id():
+    engine = DetectionEngine({"blacklist": ["0x7DF"], "rate_threshold": 1000, "finding_interval": 1.0, "evidence_samples": 2})
+    emitted = engine.feed_many(_sniff(0x7DF, ts=10.0 + i * 0.01) for i in range(100))
+    # First occurrence goes out at once; the next update waits for the interval
+    assert len(emitted) == 1 and emitted[0]["count"] == 1
+    emitted = engine.feed_many(_sniff(0x7DF, ts=11.0 + i * 0.01) for i in range(50))
+    assert len(emitted) == 1 and emitted[0]["count"] == 101
+    final = engine.flush()
+    assert len(final) == 1
+    assert final[0]["finding_id"] == "UNEXPECTED_ID_BLACKLIST:0x7df"
+    assert final[0]["count"] == 150 and len(final[0]["evidence_samples"]) == 2
+    assert final[0]["first_seen"] == 10.0 and final[0]["last_seen"] == 11.49
+    assert engine.flush() == []
+    rolled = engine.analyze([_sniff(0x7DF, ts=float(i)) for i in range(5)])
+    assert [(f["rule_id"], f["count"]) for f in rolled] == [("UNEXPECTED_ID_BLACKLIST", 5)]
+
+
+def test_replay_streams_candump_and_asc_logs(tmp_path):
+    from scanner.replay import analyze_capture, detect_format, iter_frames
+
+    log = tmp_path / "drive.log"
+    lines = [f"({1000 + i * 0.01:.6f}) vcan0 123#0102{i:02X}" for i in range(30)]
+    lines += ["(1000.500000) vcan0 7DF#0201", "(1000.600000) vcan0 18DAF110#AABB", "garbage"]
+    log.write_text("\n".join(lines) + "\n")
+    assert detect_format(str(log)) == "candump"
+    frames = list(iter_frames(str(log)))
+    assert len(frames) == 32 and frames[-1].extended and frames[-1].can_id == 0x18DAF110
+    assert frames[2].data == b"\x01\x02\x02" and frames[2].timestamp == 1000.02
+
+    summary = analyze_capture(str(log), config={"whitelist": ["0x123"], "blacklist": ["0x7DF"]})
+    assert summary["frames"] == 32
+    rules = {f["finding_id"] for f in summary["findings"]}
+    assert {"UNEXPECTED_ID_BLACKLIST:0x7df", "UNEXPECTED_ID:0x18daf110"} <= rules
+    batch = analyze_capture(str(log), config={"whitelist": ["0x123"], "blacklist": ["0x7DF"]}, batch=True, chunk_frames=10)
+    assert {f["finding_id"] for f in batch["findings"]} >= {"UNEXPECTED_ID_BLACKLIST:0x7df"}
+
+    asc = tmp_path / "drive.asc"
+    asc.write_text(
+        "date Mon Jan 15 10:00:00.000 am 2024\nbase hex  timestamps absolute\n"
+        "   0.010000 1  123             Rx   d 4 01 02 03 04\n"
+        "   0.020000 1  18DAF110x       Rx   d 2 AA BB\n"
+        "   0.030000 1  ErrorFrame\n"
+    )
+    frames = list(iter_frames(str(asc)))
+    assert [(f.can_id, f.data, f.extended) for f in frames] == [(0x123, b"\x01\x02\x03\x04", False), (0x18DAF110, b"\xaa\xbb", True)]
+    assert frames[1].timestamp - frames[0].timestamp == pytest.approx(0.01)
+
+
+def test_sharded_batch_matches_single_process():
+    import numpy as np
+    from scanner.detection.batch import FrameBatch, analyze_batch
+    from scanner.detection.parallel import ShardedDetector
+
+    rng = np.random.default_rng(7)
+    n = 20_000
+    ids = rng.choice(np.array([0x123, 0x456, 0x7DF, 0x300, 0x18DAF110], dtype=np.uint32), n)
+    batch = FrameBatch(ids, np.sort(rng.random(n) * 10.0), np.full(n, 8), rng.integers(0, 256, (n, 8)))
+    config = {"rate_threshold": 100}
+
+    def key(findings):
+        return sorted((f["rule_id"], f["affected_id"], f["count"]) for f in findings)
+
+    expected = key(analyze_batch(batch, config))
+    with ShardedDetector(workers=2, config=config, min_frames=0) as det:
+        assert key(det.analyze(batch)) == expected
+        # Second batch reuses the pool and shared block
+        assert key(det.analyze(batch)) == expected
+    with ShardedDetector(workers=2, config=config, bounds=[0x400], min_frames=0) as det:
+        assert key(det.analyze(batch)) == expected
+
+    # Untimed frames on one shard only: every shard still counts instead of windowing
+    ts = batch.timestamp.copy()
+    ts[ids == 0x7DF] = np.nan
+    mixed = FrameBatch(ids, ts, batch.dlc, batch.data)
+    expected = key(analyze_batch(mixed, config))
+    assert ("RATE_ANOMALY", "0x123", int((ids == 0x123).sum())) in expected
+    with ShardedDetector(workers=2, config=config, bounds=[0x400], min_frames=0) as det:
+        assert key(det.analyze(mixed)) == expected
+
+
+def test_payload_profiles_flag_spoofed_frames_and_round_trip(tmp_path):
+    from scanner.detection.payload import ProfileSet
+
+    def frame(i, value):
+        # byte 0: rolling counter, byte 1: signal in 0x10..0x1F, byte 3: sum of the others
+        body = bytes([i & 0xFF, value, 0x00])
+        return body + bytes([sum(body) & 0xFF])
+
+    profiles = ProfileSet(learn_frames=100)
+    for i in range(100):
+        assert profiles.update(0x123, frame(i, 0x10 + i * 7 % 16), 4) == []
+    learned = profiles.get(0x123)
+    assert learned.learned and learned.counters == 0b1 and learned.checksum == "sum:3"
+    assert profiles.update(0x123, frame(100, 0x15), 4) == []
+    # Spoofed frame: counter jumps, signal out of range, checksum not updated
+    assert profiles.update(0x123, bytes([0x42, 0x80, 0x00, 0x00]), 4) == ["range", "bits", "counter", "checksum"]
+    assert profiles.update(0x123, b"\x43\x10", 2)[0] == "dlc"
+    # The next genuine frame follows the last genuine one, not the spoofed ones
+    assert profiles.update(0x123, frame(101, 0x16), 4) == []
+
+    path = tmp_path / "profile.json"
+    profiles.save(str(path))
+    loaded = ProfileSet.load(str(path))
+    assert loaded.get(0x123).checksum == "sum:3" and loaded.get(0x123).counters == 0b1
+
+    # Streaming engine with a saved baseline flags the first out-of-profile frame
+    engine = DetectionEngine({"whitelist": ["0x123"], "payload_profile": str(path)})
+    assert engine.feed({"type": "sniff", "frame": CanFrame(0x123, frame(5, 0x12), timestamp=1.0)}) == []
+    found = engine.feed({"type": "sniff", "frame": CanFrame(0x123, bytes([6, 0x12, 0, 0]), timestamp=1.1)})
+    assert [(f["rule_id"], f["affected_id"]) for f in found] == [("PAYLOAD_ANOMALY", "0x123")]
+    assert found[0]["reasons"] == ["checksum"] and found[0]["severity"] == "high"
+
+
+def test_payload_profiles_alert_once_for_a_dropped_frame_or_state_change():
+    from scanner.detection.payload import ProfileSet
+
+    profiles = ProfileSet(learn_frames=50)
+    for i in range(50):
+        assert profiles.update(0x200, bytes([i & 0x0F, 0x01]), 2) == []
+    # Frame 50 is lost on the bus: the gap is flagged once, then the counter follows on
+    assert profiles.update(0x200, bytes([51 & 0x0F, 0x01]), 2) == ["counter"]
+    assert [profiles.update(0x200, bytes([i & 0x0F, 0x01]), 2) for i in range(52, 61)] == [[]] * 9
+    # A bit that never toggled while learning: one alert, then the new state is the reference
+    assert profiles.update(0x200, bytes([61 & 0x0F, 0x03]), 2) == ["range", "bits"]
+    assert [profiles.update(0x200, bytes([i & 0x0F, 0x03]), 2) for i in range(62, 65)] == [["range"]] * 3
+
+
+def test_apply_all_reuses_one_pipeline_per_policy_without_carrying_state():
+    from scanner.detection import rules
+    from scanner.detection.policy import compile_policy
+    from scanner.detection.rules import apply_all
+
+    policy = compile_policy({"whitelist": ["0x123"], "payload_learn_frames": 5})
+    steady = [{"type": "sniff", "frame": CanFrame(0x123, b"\x01\x02", timestamp=float(i))} for i in range(10)]
+    assert apply_all(steady, policy=policy) == []
+    pipeline = rules._batch_pipelines.entry[1]
+    # A different payload is learned afresh, not judged against the last call's profile
+    other = [{"type": "sniff", "frame": CanFrame(0x123, b"\xF0\x0F", timestamp=float(i))} for i in range(10)]
+    assert apply_all(other, policy=policy) == []
+    assert rules._batch_pipelines.entry[1] is pipeline
+
+
+def test_registered_rule_joins_single_pass_with_cost_stats():
+    from scanner.detection.registry import register_rule, rule_stats, unregister_rule
+
+    seen = []
+
+    class Probe:
+        def feed(self, ev):
+            seen.append(ev["type"])
+            if ev["frame"].can_id == 0x666:
+                raise RuntimeError("probe failed")
+            return [{"rule_id": "PROBE", "affected_id": hex(ev["frame"].can_id), "severity": "low"}]
+
+    # Needs no settings, so it is built without the policy holder
+    register_rule("probe", Probe, event_types=("sniff",), uses_policy=False)
+    try:
+        engine = DetectionEngine({"whitelist": ["0x123", "0x666"]})
+        engine.feed(_sniff(0x123, ts=1.0))
+        engine.feed({"type": "inject", "status": "success", "can_id": 0x123})
+        engine.feed(_sniff(0x666, ts=1.1))
+        # Only sniff events reach the rule, and its failure doesn't stop the others
+        assert seen == ["sniff", "sniff"]
+        stats = {s["rule"]: s for s in engine.rule_stats()}
+        assert stats["probe"]["events"] == 2 and stats["probe"]["findings"] == 1
+        assert stats["probe"]["errors"] == 1 and "probe failed" in stats["probe"]["last_error"]
+        assert stats["injection"]["events"] == 1 and stats["timing"]["events"] == 2
+        assert any(s["rule"] == "probe" for s in rule_stats())
+
+        # Batch analysis runs it in the same pass; disabled_rules switches it off
+        rolled = DetectionEngine({"whitelist": ["0x123"]}).analyze([_sniff(0x123, ts=float(i)) for i in range(3)])
+        assert [(f["rule_id"], f["count"]) for f in rolled] == [("PROBE", 3)]
+        holder = PolicyHolder({"whitelist": ["0x123"]})
+        engine = DetectionEngine(policy=holder)
+        assert engine.feed(_sniff(0x123)) != []
+        holder.update({"whitelist": ["0x123"], "disabled_rules": ["probe"]})
+        assert engine.feed(_sniff(0x123)) == []
+    finally:
+        unregister_rule("probe")
+
+
+def test_synthetic_traffic_is_reproducible_and_clean_until_a_burst():
+    import numpy as np
+    from scanner.traffic import Burst, TrafficProfile
+
+    profile = TrafficProfile.default(n_ids=20, seed=3)
+    batch = profile.generate(duration=5.0)
+    again = TrafficProfile.default(n_ids=20, seed=3).generate(duration=5.0)
+    assert np.array_equal(batch.can_id, again.can_id) and np.array_equal(batch.data, again.data)
+    assert np.all(np.diff(batch.timestamp) >= 0) and set(batch.can_id.tolist()) == set(profile.can_ids)
+    assert abs(len(batch) - profile.rate * 5.0) < 0.02 * len(batch)
+    # Frame-capped generation is a prefix of the same stream
+    assert np.array_equal(profile.generate(frames=1000).timestamp, batch.timestamp[:1000])
+
+    config = {"whitelist": [hex(i) for i in profile.can_ids], "rate_threshold": 500}
+    assert DetectionEngine(config).feed_many(profile.iter_events(duration=5.0)) == []
+
+    profile.bursts = [Burst(profile.can_ids[0], 2.0, 0.5, rate=2000)]
+    found = DetectionEngine(config).feed_many(profile.iter_events(duration=5.0))
+    assert {(f["rule_id"], f["affected_id"]) for f in found} >= {("RATE_ANOMALY", hex(profile.can_ids[0]))}
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import sqlite3
+
+# Ensure 'src' is importable when running pytest from repo root
+CURRENT_DIR = os.path.dirname(__file__)
+SRC_DIR = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from reporting.logger import Logger
+from reporting.query import query_results
+from reporting.report_generator import generate_report, iter_report
+
+
+def _count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_logger_batches_in_background_and_flushes(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    logger = Logger(db_path, batch_size=100, flush_interval=5)
+    for i in range(250):
+        logger.log_result("sniff", "detected", {"can_id": i})
+    logger.flush()
+    assert _count(db_path) == 250
+    logger.log_many([("finding", "high", {"rule_id": "X"})] * 3)
+    logger.close()
+    assert _count(db_path) == 253
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_details_use_the_installed_serializer(tmp_path):
+    from reporting import logger as logger_module
+
+    def dumps(details):
+        if "huge" in details:
+            raise TypeError("Integer exceeds 64-bit range")
+        return "encoded"
+
+    db_path = str(tmp_path / "results.db")
+    logger_module.set_serializer(dumps)
+    try:
+        logger = Logger(db_path, background=False)
+        logger.log_result("sniff", "detected", {"can_id": 1})
+        logger.log_result("sniff", "detected", "as is")
+        logger.log_result("finding", "high", {"huge": 1 << 70})
+        logger.close()
+    finally:
+        logger_module.set_serializer(None)
+    conn = sqlite3.connect(db_path)
+    details = [r[0] for r in conn.execute("SELECT details FROM results ORDER BY id")]
+    conn.close()
+    assert details == ["encoded", "as is", json.dumps({"huge": 1 << 70})]
+
+
+def test_results_are_indexed_and_paginated(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    logger = Logger(db_path)
+    for i in range(5):
+        logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x100 + i % 2, "timestamp": 10.0 + i}, scan_id="a")
+    logger.log_finding({"rule_id": "UNEXPECTED_ID", "severity": "medium", "affected_id": "0x101"}, scan_id="b")
+    logger.close()
+
+    rows, cursor = query_results(db_path, scan_id="a", limit=2)
+    assert [r["ts"] for r in rows] == [14.0, 13.0] and cursor == rows[-1]["id"]
+    rows, cursor = query_results(db_path, scan_id="a", before_id=cursor, limit=2)
+    assert [r["ts"] for r in rows] == [12.0, 11.0]
+    rows, _ = query_results(db_path, can_id=0x101)
+    assert {r["type"] for r in rows} == {"sniff", "finding"}
+    rows, _ = query_results(db_path, severity="medium", rule_id="UNEXPECTED_ID")
+    assert len(rows) == 1 and rows[0]["scan_id"] == "b"
+    rows, cursor = query_results(db_path, since=11.0, until=13.0)
+    assert [r["ts"] for r in rows] == [12.0, 11.0] and cursor is None
+
+
+def test_report_streams_and_summary_is_incremental(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    logger = Logger(db_path, background=False)
+    logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x123}, scan_id="s1")
+    logger.log_finding({"rule_id": "UNEXPECTED_ID", "severity": "medium", "affected_id": "0x7df"}, scan_id="s1")
+    report = generate_report(db_path)
+    assert report.startswith("# Vulnerability Test Report") and "[MEDIUM]" in report
+
+    lines = [json.loads(line) for line in "".join(iter_report(db_path, fmt="jsonl", scan_id="s1")).splitlines()]
+    assert lines[0]["kind"] == "summary" and lines[0]["rows"] == 2
+    assert [line["kind"] for line in lines[1:]] == ["result", "finding"]
+
+    logger.log_finding({"rule_id": "RATE_ANOMALY", "severity": "medium", "affected_id": "0x123"}, scan_id="s1")
+    logger.close()
+    summary = json.loads(next(iter_report(db_path, fmt="jsonl", scan_id="s1")).splitlines()[0])
+    assert summary["rows"] == 3 and summary["findings_by_rule"] == {"UNEXPECTED_ID": 1, "RATE_ANOMALY": 1}
+    assert "<table>" in generate_report(db_path, fmt="html")
+
+
+def test_partitions_read_as_one_table_then_compact_and_expire(tmp_path, monkeypatch):
+    import time
+    from reporting import logger as logger_module
+    from reporting.partitions import list_partitions, maintain, partition_for
+    from reporting.query import clear_results, query_traffic
+
+    db_path = str(tmp_path / "results.db")
+    clock = [time.time() - 3 * 86400]
+    monkeypatch.setattr(logger_module, "partition_for", lambda path, mode: partition_for(path, mode, now=clock[0]))
+    logger = Logger(db_path, background=False, partition="day")
+    for i in range(120):
+        logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x100 + i % 2, "timestamp": 60.0 + i}, scan_id="old")
+    logger.log_finding({"rule_id": "RATE_ANOMALY", "severity": "medium", "affected_id": "0x100"}, scan_id="old")
+    clock[0] = time.time()
+    logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x123, "timestamp": 1000.0}, scan_id="new")
+    logger.close()
+    assert len(list_partitions(db_path)) == 2 and not os.path.exists(db_path)
+
+    # Ids keep growing across partitions, so pagination continues into the older file
+    rows, cursor = query_results(db_path, limit=1)
+    assert rows[0]["scan_id"] == "new"
+    rows, _ = query_results(db_path, before_id=cursor, limit=2)
+    assert [r["type"] for r in rows] == ["finding", "sniff"] and rows[0]["id"] < cursor
+    traffic = query_traffic(db_path, scan_id="old")
+    assert [(t["minute"], t["can_id"], t["frames"]) for t in traffic] == [
+        (120, "0x100", 30), (120, "0x101", 30), (60, "0x100", 30), (60, "0x101", 30)]
+
+    # Compaction keeps findings and per-minute counts, only for the old partition,
+    # and connections already open on it keep working
+    held = sqlite3.connect(list_partitions(db_path)[0].path)
+    assert held.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 121
+    result = maintain(db_path, compact_after_hours=24)
+    assert held.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 1
+    assert held.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    held.close()
+    assert result["dropped"] == [] and [c["frames"] for c in result["compacted"]] == [120]
+    assert query_traffic(db_path, scan_id="old") == traffic
+    assert [r["type"] for r in query_results(db_path, scan_id="old")[0]] == ["finding"]
+    summary = json.loads(generate_report(db_path, fmt="jsonl").splitlines()[0])
+    assert summary["rows"] == 2 and summary["compacted_frames"] == 120
+
+    result = maintain(db_path, retention_days=1)
+    assert len(result["dropped"]) == 1 and [r["scan_id"] for r in query_results(db_path)[0]] == ["new"]
+    assert clear_results(db_path) == 1 and list_partitions(db_path) == []
+
+
+def test_results_cursor_walks_across_partitions(tmp_path, monkeypatch):
+    import time
+    from reporting import logger as logger_module
+    from reporting.partitions import list_partitions, partition_for
+
+    # /api/results passes its `cursor` straight through as `before_id`
+    db_path = str(tmp_path / "results.db")
+    clock = [time.time() - 3 * 86400]
+    monkeypatch.setattr(logger_module, "partition_for", lambda path, mode: partition_for(path, mode, now=clock[0]))
+    logger = Logger(db_path, background=False, partition="day")
+    for days in (3, 2, 0):
+        clock[0] = time.time() - days * 86400
+        for i in range(5):
+            logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x100, "timestamp": float(i)},
+                             scan_id="odd" if i % 2 else "even")
+    logger.close()
+    assert len(list_partitions(db_path)) == 3
+    everything = [r["id"] for r in query_results(db_path, limit=100)[0]]
+    assert len(everything) == 15 and everything == sorted(everything, reverse=True)
+
+    def walk(**filters):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = query_results(db_path, before_id=cursor, **filters)
+            ids += [r["id"] for r in rows]
+            if cursor is None:
+                return ids
+
+    # Pages ending exactly on a partition's first row and pages straddling two
+    assert walk(limit=5) == everything
+    assert walk(limit=2) == everything
+    odd = [r["id"] for r in query_results(db_path, scan_id="odd", limit=100)[0]]
+    assert len(odd) == 6 and walk(scan_id="odd", limit=4) == odd
+
+
+def _old_partition_logger(db_path, monkeypatch, days=3):
+    import time
+    from reporting import logger as logger_module
+    from reporting.partitions import partition_for
+
+    then = time.time() - days * 86400
+    monkeypatch.setattr(logger_module, "partition_for", lambda path, mode: partition_for(path, mode, now=then))
+    return Logger(db_path, background=False, partition="day")
+
+
+def test_report_after_compaction_counts_frames_once(tmp_path, monkeypatch):
+    from reporting.partitions import compact_partition, list_partitions
+
+    db_path = str(tmp_path / "results.db")
+    logger = _old_partition_logger(db_path, monkeypatch)
+    for i in range(5):
+        logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x100, "timestamp": 60.0 + i})
+    logger.log_finding({"rule_id": "RATE_ANOMALY", "severity": "medium", "affected_id": "0x100"})
+    logger.close()
+
+    def summary():
+        return json.loads(generate_report(db_path, fmt="jsonl").splitlines()[0])
+
+    before = summary()
+    assert before["rows"] == 6 and before["by_type"]["sniff"] == 5
+    compact_partition(list_partitions(db_path)[0])
+    after = summary()
+    assert after["rows"] == 1 and after["by_type"] == {"finding": 1} and after["compacted_frames"] == 5
+
+
+def test_compaction_racing_a_writer_loses_no_rows(tmp_path, monkeypatch):
+    import threading
+    from reporting.partitions import compact_partition, list_partitions
+
+    db_path = str(tmp_path / "results.db")
+    logger = _old_partition_logger(db_path, monkeypatch)
+    for i in range(20000):
+        logger.log_result("sniff", "detected", "{}", can_id=0x100, ts=60.0 + i % 600)
+    part = list_partitions(db_path)[0]
+    written = [20000]
+    started, done = threading.Event(), threading.Event()
+
+    def write():
+        # A late writer keeps committing into the partition while it is compacted
+        while not done.is_set():
+            logger.log_result("sniff", "detected", "{}", can_id=0x200, ts=100.0)
+            logger.log_result("inject", "success", "{}")
+            written[0] += 2
+            started.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    started.wait()
+    compact_partition(part)
+    done.set()
+    writer.join()
+    logger.close()
+
+    conn = sqlite3.connect(part.path)
+    rows = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    folded = conn.execute("SELECT COALESCE(SUM(frames), 0) FROM frame_minutes").fetchone()[0]
+    injects = conn.execute("SELECT COUNT(*) FROM results WHERE test_type = 'inject'").fetchone()[0]
+    conn.close()
+    assert injects == (written[0] - 20000) // 2 and rows + folded == written[0]
+
+
+def test_compaction_buckets_rows_without_ts_by_utc_minute(tmp_path, monkeypatch):
+    import datetime
+    import time
+    from reporting.partitions import compact_partition, list_partitions
+    from reporting.query import query_traffic
+
+    # Rows from older writers carry only the local-time ISO timestamp
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        db_path = str(tmp_path / "results.db")
+        logger = _old_partition_logger(db_path, monkeypatch)
+        logger.close()
+        part = list_partitions(db_path)[0]
+        event = 1_700_000_000.0
+        conn = sqlite3.connect(part.path)
+        conn.execute(
+            "INSERT INTO results (timestamp, test_type, status, details, can_id) VALUES (?, 'sniff', 'detected', '{}', ?)",
+            (datetime.datetime.fromtimestamp(event).isoformat(), 0x100),
+        )
+        conn.commit()
+        conn.close()
+        raw = query_traffic(db_path)
+        compact_partition(part)
+        assert [t["minute"] for t in raw] == [int(event // 60) * 60]
+        assert query_traffic(db_path) == raw
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_maintenance_never_touches_the_unpartitioned_database(tmp_path, monkeypatch):
+    import time
+    from reporting.partitions import Maintainer, maintain
+
+    db_path = str(tmp_path / "results.db")
+    logger = Logger(db_path, background=False, partition="none")
+    logger.log_event({"type": "sniff", "status": "detected", "can_id": 0x123, "timestamp": 1.0})
+    logger.close()
+    old = time.time() - 40 * 86400
+    os.utime(db_path, (old, old))
+
+    assert maintain(db_path, retention_days=30, compact_after_hours=24) == {"dropped": [], "compacted": []}
+    assert _count(db_path) == 1
+    monkeypatch.setenv("RESULTS_PARTITION", "none")
+    maintainer = Maintainer(db_path=db_path, retention_days=30, compact_after_hours=24)
+    assert not maintainer.enabled and "skipped" in maintainer.run_once()
+    assert _count(db_path) == 1
+    # Storage is still measured for metrics with partitioning off
+    usage = maintainer.measure()
+    assert usage["partitions"] == 1 and usage["bytes"] >= os.path.getsize(db_path)
+    assert maintainer.usage is usage
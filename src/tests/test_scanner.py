@@ -20,3 +20,452 @@ def test_vulnerability_scan(scanner):
     assert len(results) > 0
     assert any(r["type"] == "sniff" for r in results)
     assert any(r["type"] == "inject" for r in results)
+
+
+def test_capture_runs_off_the_event_loop_with_backpressure():
+    import asyncio
+    import time
+    from scanner.capture import Capture
+
+    produced = []
+
+    def source():
+        for i in range(50):
+            time.sleep(0.001)  # blocking work stays on the reader thread
+            produced.append(i)
+            yield {"type": "sniff", "status": "detected", "n": i}
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        tick_task = asyncio.ensure_future(ticker())
+        got = []
+        async with Capture(source, maxsize=2) as cap:
+            async for ev in cap:
+                if not got:
+                    # Consumer is stalled: the reader may only run a few items ahead
+                    await asyncio.sleep(0.1)
+                    assert len(produced) <= 8
+                got.append(ev["n"])
+        tick_task.cancel()
+        return got, ticks
+
+    got, ticks = asyncio.run(main())
+    assert got == list(range(50))
+    assert ticks > 10
+
+
+def test_capture_reraises_source_errors():
+    import asyncio
+    from scanner.capture import Capture
+
+    def source():
+        yield {"type": "sniff", "status": "detected"}
+        raise RuntimeError("interface down")
+
+    async def main():
+        seen = []
+        async with Capture(source) as cap:
+            try:
+                async for ev in cap:
+                    seen.append(ev)
+            except RuntimeError as e:
+                return seen, str(e)
+
+    seen, err = asyncio.run(main())
+    assert len(seen) == 1 and err == "interface down"
+
+
+class _FakeAsyncSniffer:
+    """Feeds packets to ``prn`` from a thread until stopped, like scapy's AsyncSniffer."""
+
+    def __init__(self, prn=None, count=0, started_callback=None, **kwargs):
+        import threading
+        self.prn = prn
+        self.count = count
+        self.started_callback = started_callback
+        self.exception = None
+        self._halt = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def _run(self):
+        from scapy.layers.can import CAN
+        if self.started_callback is not None:
+            self.started_callback()
+        n = 0
+        while not self._halt.is_set() and (not self.count or n < self.count):
+            self.prn(CAN(identifier=0x100 + n % 4, data=b"\x01\x02"))
+            n += 1
+            if n % 50 == 0:
+                self._halt.wait(0.001)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, join=True):
+        self._halt.set()
+
+
+def test_continuous_sniffer_rotates_chunks_and_stops(monkeypatch):
+    import scapy.all as scapy
+    from scanner.attacks import sniff
+
+    monkeypatch.setattr(scapy, "AsyncSniffer", _FakeAsyncSniffer)
+    sniffer = sniff.CanSniffer("vcan0", max_queue=500)
+    sizes = []
+    for chunk in sniffer.chunks(max_frames=100, max_seconds=0.5):
+        sizes.append(len(chunk))
+        assert chunk[0]["frame"].can_id in (0x100, 0x101, 0x102, 0x103)
+        if len(sizes) == 5:
+            sniffer.stop()
+    assert sizes[:5] == [100] * 5
+    assert not sniffer.running
+    # Nothing accumulates beyond the bounded queue; the rest is counted as dropped
+    assert sniffer.received >= sum(sizes)
+
+    bounded = sniff.sniff_can_packets("vcan0", count=7)
+    assert len(bounded) == 7 and all(r["status"] == "detected" for r in bounded)
+
+
+def test_capture_filters_match_policy_entries():
+    from scanner.attacks.socketcan import CAN_EFF_FLAG, compile_filters, filter_matches, pack_filters
+    from scanner.detection.policy import IdSet
+
+    entries = ["0x123", "0x100-0x1FF", "0x205-0x20C", "0x700/0x7F0", "0x18DAF110"]
+    filters = compile_filters(entries)
+    assert (0x100, 0x700 | CAN_EFF_FLAG) in filters
+    assert len(pack_filters(filters)) == 8 * len(filters)
+    ids = IdSet.compile(entries)
+    for can_id in range(0x800):
+        assert filter_matches(filters, can_id) == (can_id in ids), hex(can_id)
+    assert filter_matches(filters, 0x18DAF110)
+    assert not filter_matches(filters, 0x18DAF111)
+    # A standard ID entry does not let the same number through as an extended ID
+    assert not filter_matches(filters, 0x123, extended=True)
+
+
+def test_filter_semantics_none_receives_all_and_empty_receives_none(monkeypatch):
+    import types
+    from scanner.attacks.socketcan import CAN_RAW_FILTER_MAX, RawCanSocket, open_bulk_socket, pack_filters
+
+    class FakeSock:
+        def setsockopt(self, level, option, value):
+            self.value = value
+
+    raw = object.__new__(RawCanSocket)
+    raw.sock = FakeSock()
+    raw.set_filters(None)
+    assert raw.sock.value == pack_filters([(0, 0)])
+    # An explicitly empty list is a zero-length filter: nothing gets through
+    raw.set_filters([])
+    assert raw.sock.value == b""
+    raw.set_filters([(0x123, 0x7FF)] * (CAN_RAW_FILTER_MAX + 1))
+    assert raw.sock.value == pack_filters([(0, 0)])
+
+    # The compiled socket gets None and [] unchanged, not collapsed into one
+    seen = []
+    fake = types.SimpleNamespace(CanEmulator=lambda interface, filters: seen.append(filters))
+    monkeypatch.setitem(sys.modules, "can_emulator", fake)
+    open_bulk_socket("vcan0")
+    open_bulk_socket("vcan0", [])
+    assert seen == [None, []]
+
+
+def test_bulk_frame_io_round_trip():
+    import socket
+    from scanner.attacks.socketcan import (
+        RECORD_SIZE, RawCanSocket, iter_record_frames, pack_frames, records_array, records_to_batch,
+    )
+    from scanner.frame import CanFrame
+
+    # A seqpacket pair keeps 16-byte frame boundaries like a CAN_RAW socket
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    tx, rx = object.__new__(RawCanSocket), object.__new__(RawCanSocket)
+    tx.sock, rx.sock = a, b
+    frames = [CanFrame(0x100 + i, bytes([i, i + 1]), dlc=2) for i in range(5)] + [CanFrame(0x18DAF110, b"\xAA" * 8)]
+    assert tx.send_frames(pack_frames(frames)) == 6
+
+    buf = rx.receive_frames(16, timeout=1.0)
+    assert len(buf) == 6 * RECORD_SIZE
+    rec = records_array(buf)
+    assert rec["dlc"].tolist() == [2] * 5 + [8]
+    batch = records_to_batch(buf)
+    assert batch.can_id.tolist() == [f.can_id for f in frames]
+    got = list(iter_record_frames(buf))
+    assert [(f.can_id, f.data, f.extended) for f in got] == [(f.can_id, f.data, f.extended) for f in frames]
+    assert rx.receive_frames(4, timeout=0.01).nbytes == 0
+    a.close()
+    b.close()
+
+
+def test_injection_engine_paces_batches_and_records_frames():
+    import socket
+    from scanner.attacks.inject import InjectionEngine, id_sweep, payload_mutations
+    from scanner.attacks.socketcan import RawCanSocket, iter_record_frames
+    from scanner.detection.engine import DetectionEngine
+
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    b.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    tx, rx = object.__new__(RawCanSocket), object.__new__(RawCanSocket)
+    tx.sock, rx.sock = a, b
+
+    engine = InjectionEngine("vcan0", rate=4000, sock=tx)
+    stats = engine.run(payload_mutations(0x7DF, b"\x02\x01\x00", mode="increment"), count=400)
+    assert stats["sent"] == 400 and stats["dropped"] == 0
+    # 400 frames at 4000/s take ~0.1 s; pacing keeps the rate near target
+    assert 0.08 <= stats["elapsed"] <= 0.5
+    assert stats["achieved_rate"] <= 4000 * 1.15
+
+    unpaced = InjectionEngine("vcan0", sock=tx, record=engine.record).run(id_sweep(0x100, 0x10F, b"\x00"))
+    assert unpaced["sent"] == 16
+
+    received = []
+    while True:
+        buf = rx.receive_frames(512, timeout=0.05)
+        if not len(buf):
+            break
+        received.extend(iter_record_frames(buf))
+    assert len(received) == 416
+    assert received[1].data == b"\x02\x01\x01"
+
+    # Findings raised by our own frames are marked as injected
+    detect = DetectionEngine({"whitelist": ["0x123"], "blacklist": ["0x7DF"]}, injected=engine.record)
+    found = detect.feed({"type": "sniff", "status": "detected", "frame": received[0]})
+    assert found and found[0]["rule_id"] == "UNEXPECTED_ID_BLACKLIST" and found[0]["injected_count"] == 1
+    a.close()
+    b.close()
+
+
+def test_scan_injects_while_capturing_and_correlates_its_frame(monkeypatch):
+    import socket
+    from scanner.attacks import inject, sniff
+    from scanner.attacks.socketcan import RawCanSocket
+    from scanner.detection.engine import DetectionEngine
+    from scanner.scanner import VulnerabilityScanner
+
+    # The injector's socket loops back into the capture's, like a vcan bus
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    tx, rx = object.__new__(RawCanSocket), object.__new__(RawCanSocket)
+    tx.sock, rx.sock = a, b
+    monkeypatch.setattr(inject, "open_bulk_socket", lambda interface, filters=None: tx)
+    monkeypatch.setattr(sniff, "open_bulk_socket", lambda interface, filters=None: rx)
+
+    scanner = VulnerabilityScanner("vcan0", filters=[(0, 0)])
+    detect = DetectionEngine({"whitelist": ["0x100"]}, injected=scanner.injected)
+    events = []
+    findings = []
+    for event in scanner.iter_scan(count=1, timeout=3):
+        events.append(event)
+        findings.extend(detect.feed(event))
+    assert [e["type"] for e in events] == ["sniff", "inject"]
+    assert events[0]["frame"].can_id == 0x123 and events[0]["injected"]
+    assert events[1]["status"] == "success"
+    unexpected = [f for f in findings if f["rule_id"] == "UNEXPECTED_ID"]
+    assert unexpected and unexpected[0]["injected_count"] == 1
+
+
+def test_orchestrator_scans_interfaces_in_parallel(monkeypatch):
+    import queue
+    import time
+    import scapy.all as scapy
+    from scanner.detection.policy import PolicyHolder
+    from scanner.orchestrator import CANCELLED, COMPLETED, ScanOrchestrator, merge_findings
+
+    monkeypatch.setattr(scapy, "AsyncSniffer", _FakeAsyncSniffer)
+    orch = ScanOrchestrator(max_workers=4, max_queue=4, policy=PolicyHolder({"whitelist": ["0x100"]}))
+    start = time.monotonic()
+    jobs = orch.submit_many([f"vcan{i}" for i in range(4)], count=None, timeout=0.3, inject=False)
+    assert orch.wait(jobs, timeout=5)
+    # Four 0.3 s captures overlap instead of taking 1.2 s back to back
+    assert time.monotonic() - start < 1.0
+    assert [j.status for j in jobs] == [COMPLETED] * 4
+    assert len({j.scan_id for j in jobs}) == 4
+    assert {f["interface"] for f in jobs[2].findings} == {"vcan2"}
+    merged = {f["finding_id"]: f for f in merge_findings(jobs)}
+    assert sorted(merged["UNEXPECTED_ID:0x101"]["interfaces"]) == [f"vcan{i}" for i in range(4)]
+    orch.shutdown()
+
+    small = ScanOrchestrator(max_workers=1, max_queue=1)
+    running = small.submit("vcan0", count=None, timeout=None, inject=False)
+    while running.status != "running":
+        time.sleep(0.01)
+    # Two jobs do not fit in the one free slot: neither is queued nor registered
+    try:
+        small.submit_many(["vcan1", "vcan2"], count=None, timeout=None, inject=False)
+        assert False, "queue should be too small"
+    except queue.Full:
+        pass
+    assert small.jobs() == [running] and small._queue.qsize() == 0
+    waiting = small.submit("vcan1", count=None, timeout=None, inject=False)
+    try:
+        small.submit("vcan2")
+        assert False, "queue should be full"
+    except queue.Full:
+        pass
+    assert small.cancel(waiting.scan_id) and small.cancel(running.scan_id)
+    assert small.wait([running, waiting], timeout=5)
+    assert running.status == CANCELLED and waiting.status == CANCELLED
+    assert running.event_count > 0
+    small.shutdown()
+
+
+def test_job_log_resumes_from_offset_and_reports_gaps():
+    import asyncio
+    from scanner.frame import CanFrame
+    from scanner.orchestrator import COMPLETED, EventRing, ScanOrchestrator
+
+    def source(scanner):
+        for i in range(5):
+            yield {"type": "sniff", "status": "detected", "frame": CanFrame(0x7DF, bytes([i]), timestamp=float(i))}
+
+    orch = ScanOrchestrator(max_workers=1, log_size=100)
+    job = orch.submit("vcan0", source=source)
+    assert job.wait(5) and job.status == COMPLETED
+    entries, missed = job.log.read(0)
+    kinds = [item["event"] for _, item in entries]
+    assert kinds[:2] == ["result", "finding"] and kinds.count("result") == 5 and kinds[-1] == "done"
+    assert [seq for seq, _ in entries] == list(range(len(entries))) and missed == 0
+    # Resuming after the last seen sequence replays only what followed it
+    tail, _ = job.log.read(entries[-3][0] + 1)
+    assert [seq for seq, _ in tail] == [entries[-2][0], entries[-1][0]]
+    orch.shutdown()
+
+    ring = EventRing(maxlen=3)
+    for i in range(5):
+        ring.append({"event": "result", "payload": i})
+    entries, missed = ring.read(0)
+    assert missed == 2 and [seq for seq, _ in entries] == [2, 3, 4] and ring.first == 2
+
+    async def follow():
+        waiter = asyncio.ensure_future(ring.wait_async(5, timeout=2))
+        await asyncio.sleep(0.05)
+        ring.append({"event": "done"})
+        return await waiter
+
+    assert asyncio.run(follow()) is True
+    ring.close()
+    assert ring.wait(99, timeout=1) is False
+
+
+def test_broadcast_hub_shares_one_feed_and_bounds_slow_subscribers():
+    import asyncio
+    from scanner.broadcast import BroadcastHub
+
+    started = []
+    closed = []
+
+    async def feed():
+        started.append(1)
+        try:
+            yield None, "start"
+            for i in range(50):
+                yield ("finding" if i % 2 else None), f"msg{i}"
+                await asyncio.sleep(0)
+            # Keep running until the last subscriber leaves
+            await asyncio.sleep(10)
+        finally:
+            closed.append(1)
+
+    async def main():
+        hub = BroadcastHub(maxsize=8)
+        fast = hub.subscribe("vcan0", feed)
+        slow = hub.subscribe("vcan0", feed, overflow="drop_oldest")
+        coalescing = hub.subscribe("vcan0", feed)
+        got = []
+        async for text in fast:
+            got.append(text)
+            if text == "msg49":
+                break
+        # Everyone shares one feed; the fast reader saw every message
+        assert started == [1] and got[0] == "start" and len(got) == 51
+        assert len(slow) == 8 and slow.dropped == 51 - 8
+        # Pending findings were replaced in place instead of queued again
+        assert coalescing.coalesced > 0 and len(coalescing) == 8
+        pending = [await coalescing.__anext__() for _ in range(8)]
+        assert [t for t in pending if int(t[3:]) % 2] == ["msg49"]
+        late = hub.subscribe("vcan0", feed)
+        assert await late.__anext__() == "start"
+        for sub in (fast, slow, coalescing):
+            hub.unsubscribe(sub)
+        assert not closed
+        hub.unsubscribe(late)
+        await asyncio.sleep(0.05)
+        assert closed == [1] and hub.channels() == []
+
+    asyncio.run(main())
+
+
+def test_wire_formats_batch_frames_and_encode_once():
+    import json
+    from scanner.frame import CanFrame
+    from scanner.wire import WireEvent, encode_batch, unpack_batch
+
+    frames = [CanFrame(0x123, b"\x01\x02", timestamp=1.5), CanFrame(0x18DAF110, b"\xAA" * 8), CanFrame(0x7DF, b"")]
+    events = [WireEvent("result", {"type": "sniff", "status": "detected", "frame": f}) for f in frames[:2]]
+    events += [WireEvent("finding", {"finding_id": "X", "evidence": {"frame": frames[0]}})]
+    events += [WireEvent("result", {"type": "sniff", "status": "detected", "frame": frames[2]}), WireEvent("done")]
+
+    legacy = [json.loads(m) for m in encode_batch(events, "json")]
+    assert legacy[0]["payload"]["packet"].startswith("CAN(id=0x123") and legacy[-1] == {"event": "done"}
+    assert legacy[2]["payload"]["evidence"]["frame"]["data_hex"] == "0102"
+
+    compact = [json.loads(m) for m in encode_batch(events, "compact")]
+    assert [m["event"] for m in compact] == ["frames", "finding", "frames", "done"]
+    assert compact[0]["rows"] == [[1.5, 0x123, 2, "0102"], [None, 0x18DAF110, 8, "aa" * 8]]
+
+    binary = encode_batch(events, "binary")
+    assert isinstance(binary[0], bytes) and len(binary[0]) == 8 + 2 * 24
+    decoded = unpack_batch(binary[0])
+    assert [(f.can_id, f.data, f.extended, f.timestamp) for f in decoded] == [
+        (0x123, b"\x01\x02", False, 1.5), (0x18DAF110, b"\xAA" * 8, True, None)]
+    # Encodings are cached on the event and shared by every subscriber
+    assert events[0].row() is events[0].row() and events[0].json() is events[0].json()
+
+
+def test_metrics_exposition_and_profiled_job():
+    import time
+    from scanner.frame import CanFrame
+    from scanner.metrics import counter, exposition, histogram
+    from scanner.orchestrator import COMPLETED, ScanOrchestrator
+
+    frames = counter("test_frames_total", "Frames seen in the test", ("interface",))
+    frames.labels("vcan0").inc()
+    frames.labels("vcan0").inc(2)
+    latency = histogram("test_latency_seconds", "Test latency", buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 1.0):
+        latency.observe(value)
+    assert counter("test_frames_total", "again", ("interface",)) is frames
+    text = exposition()
+    assert "# TYPE test_frames_total counter" in text
+    assert 'test_frames_total{interface="vcan0"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.01"} 1' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text and "test_latency_seconds_count 3" in text
+
+    def source(scanner):
+        for i in range(20):
+            time.sleep(0.01)
+            yield {"type": "sniff", "status": "detected", "frame": CanFrame(0x123, bytes([i]), timestamp=float(i))}
+
+    orch = ScanOrchestrator(max_workers=1)
+    job = orch.submit("vcan0", source=source, profile=0.001)
+    assert job.wait(5) and job.status == COMPLETED
+    orch.shutdown()
+    profile = job.profile.to_dict()
+    assert profile["samples"] > 0 and profile["top"]
+    assert "source (test_scanner.py" in job.profile.folded()
+    text = exposition()
+    # Detection, rule and job metrics were recorded along the way
+    assert 'scan_jobs_total{status="completed"}' in text
+    assert 'can_rule_events_total{rule="unexpected_id"}' in text and "can_detection_seconds_count" in text